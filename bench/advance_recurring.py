@@ -0,0 +1,106 @@
+"""Перенос повторяющихся дедлайнов: старый цикл по пользователям против одного прохода.
+
+    python -m bench.advance_recurring [--rows 1000000] [--per-user 20]
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import storage
+
+
+def _legacy_advance(con, user_id: int) -> None:
+    # db_advance_recurring до перехода на due: strptime, шаг за шагом, UPDATE на строку
+    today = datetime.now().date()
+    rows = con.execute(
+        "SELECT id, date, repeat FROM deadlines WHERE user_id = ? AND repeat IS NOT NULL",
+        (user_id,),
+    ).fetchall()
+    for dl_id, date_str, repeat in rows:
+        try:
+            d = datetime.strptime(date_str, "%d.%m.%Y").date()
+        except ValueError:
+            continue
+        if d >= today:
+            continue
+        while d < today:
+            if repeat == "weekly":
+                d += timedelta(days=7)
+            elif repeat == "monthly":
+                d = storage._next_month(d)
+            else:
+                break
+        con.execute(
+            "UPDATE deadlines SET date = ?, due = ? WHERE id = ?",
+            (d.strftime("%d.%m.%Y"), storage.to_day(d), dl_id),
+        )
+
+
+def _generate(path: Path, rows: int, per_user: int) -> None:
+    rng = random.Random(42)
+    today = storage.today_day()
+    repeats = (None, None, "weekly", "monthly")
+    con = storage.connect(path)
+    batch = []
+    for i in range(rows):
+        due = today - rng.randrange(-60, 5 * 365)
+        date_str = storage.from_day(due).strftime(storage.DATE_FMT)
+        batch.append((f"{i:08x}", i // per_user, f"dl {i}", date_str, rng.choice(repeats), due))
+        if len(batch) == 50_000:
+            with con:
+                con.executemany("INSERT INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    with con:
+        con.executemany("INSERT INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)", batch)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--per-user", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path, new_path = Path(tmp) / "old.db", Path(tmp) / "new.db"
+        storage.init_db(old_path)
+        _generate(old_path, args.rows, args.per_user)
+        shutil.copy(old_path, new_path)
+
+        con = storage.connect(old_path)
+        users = [r[0] for r in con.execute("SELECT DISTINCT user_id FROM deadlines")]
+        t0 = time.perf_counter()
+        for uid in users:
+            with con:
+                _legacy_advance(con, uid)
+        old_s = time.perf_counter() - t0
+        con.close()
+
+        async def run_new() -> tuple[float, int]:
+            storage.open_storage(new_path)
+            t0 = time.perf_counter()
+            moved = await storage.db_advance_recurring()
+            elapsed = time.perf_counter() - t0
+            await storage.close_storage()
+            return elapsed, moved
+
+        new_s, moved = asyncio.run(run_new())
+
+        query = "SELECT id, date, due FROM deadlines ORDER BY id"
+        same = sqlite3.connect(old_path).execute(query).fetchall() == sqlite3.connect(new_path).execute(query).fetchall()
+
+    print(f"rows: {args.rows}, users: {len(users)}, moved: {moved}")
+    print(f"per-user loop: {old_s:8.2f} s")
+    print(f"bulk pass:     {new_s:8.2f} s  ({old_s / new_s:.1f}x)")
+    print(f"results match: {same}")
+
+
+if __name__ == "__main__":
+    main()
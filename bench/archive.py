@@ -0,0 +1,133 @@
+"""Архивирование давно прошедших разовых дедлайнов: рабочий набор до и после.
+
+Поверх синтетической базы каждому пользователю добавляется --history разовых
+дедлайнов, просроченных на 2 месяца–2 года (так выглядит база, которую ни
+разу не чистили). Замеряются чтение списка пользователя мимо кэша, выборка
+слота напоминаний 09:00 и размер файла — до и после db_archive_expired; во
+время архивирования другие чаты пишут, и снимается задержка их db_add.
+
+    python -m bench.archive [--users 5000] [--per-user 20] [--history 60] [--writers 20]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import storage
+from bench.synthetic import add_profile_args, populate, profile_from_args
+
+ARCHIVE_AFTER_DAYS = 30
+HISTORY_MIN_DAYS = 60
+HISTORY_MAX_DAYS = 730
+SAMPLE_USERS = 500
+INSERT_BATCH = 50_000
+
+
+def _add_history(path: Path, users: int, history: int, today: int) -> None:
+    rng = random.Random(7)
+    con = storage.connect(path)
+    rows = []
+    for uid in range(1, users + 1):
+        for n in range(history):
+            due = today - rng.randrange(HISTORY_MIN_DAYS, HISTORY_MAX_DAYS)
+            date_str = storage.from_day(due).strftime(storage.DATE_FMT)
+            rows.append((uuid4().hex[:8], uid, f"старая задача {n}", date_str, None, due))
+        if len(rows) >= INSERT_BATCH or uid == users:
+            with con:
+                con.executemany(
+                    "INSERT OR IGNORE INTO deadlines (id, user_id, name, date, repeat, due) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            rows.clear()
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+
+def _db_size(path: Path) -> float:
+    return sum(p.stat().st_size for p in path.parent.glob(path.name + "*")) / 1e6
+
+
+async def _hot_reads(users: int) -> tuple[float, float]:
+    sample = random.Random(1).sample(range(1, users + 1), min(SAMPLE_USERS, users))
+    storage._cache.clear()
+    lat = []
+    for uid in sample:
+        t0 = time.perf_counter()
+        await storage.db_get(uid)
+        lat.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    async for _ in storage.db_iter_slot_deadlines(9, 0, storage.today_day() + 7):
+        pass
+    return statistics.median(lat), time.perf_counter() - t0
+
+
+async def _other_chats(writers: int, latencies: list[float], stop: asyncio.Event) -> None:
+    async def writer(uid: int) -> None:
+        rng = random.Random(uid)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await storage.db_add(uid, uuid4().hex[:8], "обычный дедлайн", storage.today_day() + 3)
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(rng.expovariate(20))
+
+    await asyncio.gather(*(writer(10_000_000 + i) for i in range(writers)))
+
+
+async def _run(path: Path, users: int, writers: int) -> None:
+    storage.open_storage(path)
+    count = "SELECT count(*) FROM deadlines"
+    rows_before = sum(n for (n,) in await storage._get_storage().scan(lambda con: con.execute(count).fetchall()))
+    size_before = _db_size(path)
+    read_before, slot_before = await _hot_reads(users)
+
+    write_lat: list[float] = []
+    stop = asyncio.Event()
+    background = asyncio.create_task(_other_chats(writers, write_lat, stop))
+    await asyncio.sleep(0.2)
+    t0 = time.perf_counter()
+    archived = await storage.db_archive_expired(ARCHIVE_AFTER_DAYS)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await background
+
+    rows_after = sum(n for (n,) in await storage._get_storage().scan(lambda con: con.execute(count).fetchall()))
+    read_after, slot_after = await _hot_reads(users)
+    await storage.close_storage()
+    con = storage.connect(path)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+    print(f"в архив: {archived} строк за {elapsed:.2f} с")
+    print(f"  deadlines: {rows_before} → {rows_after} строк")
+    print(f"  db_get мимо кэша, p50: {read_before * 1000:.3f} → {read_after * 1000:.3f} мс")
+    print(f"  слот 09:00 целиком: {slot_before * 1000:.1f} → {slot_after * 1000:.1f} мс")
+    print(f"  файл БД: {size_before:.1f} → {_db_size(path):.1f} МБ (с архивом)")
+    if write_lat:
+        write_lat.sort()
+        print(f"  db_add других чатов ({len(write_lat)}): p50 {statistics.median(write_lat) * 1000:.2f} мс, "
+              f"p99 {write_lat[int(len(write_lat) * 0.99)] * 1000:.2f} мс, max {write_lat[-1] * 1000:.2f} мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_profile_args(parser)
+    parser.set_defaults(users=5000)
+    parser.add_argument("--history", type=int, default=60, help="давно прошедших разовых дедлайнов на пользователя")
+    parser.add_argument("--writers", type=int, default=20, help="сколько других чатов пишут во время архивирования")
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "archive.db"
+        populate(path, profile)
+        _add_history(path, profile.users, args.history, storage.today_day())
+        asyncio.run(_run(path, profile.users, args.writers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Сквозная проверка шардированного режима на локальном fake Bot API.
+
+Поднимает N воркеров и роутер, прогоняет через роутер /start и диалог добавления
+дедлайна для каждого пользователя, проверяет, что данные каждого пользователя
+лежат ровно в его шарде, затем перебалансирует шарды и проверяет снова. Перед
+перебалансировкой имитируется сбой прошлого переноса: архив уже скопирован в
+новые шарды, но не удалён из старых.
+
+    python -m bench.cluster_e2e [--users 300] [--shards 1,4] [--rebalance-to 6]
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from bench.fake_api import TOKEN, FakeBotApi
+from cluster import WORKER_HOST, ShardRouter, WorkerLink, WorkerPool, rebalance, shard_for, shard_path
+from main import WEBHOOK_PATH
+from markup import BTN_ADD
+from storage import init_db
+
+SECRET = "bench-secret"
+BASE_PORT = 18090
+
+
+def _flow(api: FakeBotApi, uid: int) -> list[dict]:
+    return [
+        api.message_update(uid, "/start"),
+        api.message_update(uid, BTN_ADD),
+        api.message_update(uid, f"задача {uid}"),
+        api.message_update(uid, "01.01.2031"),
+        api.callback_update(uid, "repeat_none"),
+    ]
+
+
+async def _post(reader, writer, body: bytes) -> int:
+    writer.write(
+        f"POST {WEBHOOK_PATH} HTTP/1.1\r\nHost: bot\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1])
+
+
+def _placement(directory: Path, shards: int, table: str = "deadlines") -> dict[int, list[int]]:
+    found: dict[int, list[int]] = {}
+    for shard in range(shards):
+        con = sqlite3.connect(shard_path(shard, directory))
+        for (uid,) in con.execute(f"SELECT user_id FROM {table}"):
+            found.setdefault(uid, []).append(shard)
+        con.close()
+    return found
+
+
+def _check(directory: Path, shards: int, users: int, table: str = "deadlines") -> None:
+    found = _placement(directory, shards, table)
+    assert len(found) == users, f"{table}: строки есть у {len(found)} из {users} пользователей"
+    # по одной строке на пользователя: лишняя значила бы задвоение при переносе
+    wrong = [uid for uid, where in found.items() if where != [shard_for(uid, shards)]]
+    assert not wrong, f"{table}: пользователи не в своём шарде или задвоены: {wrong[:10]}"
+
+
+def _add_archive(directory: Path, shards: int) -> None:
+    # архив наполняется раз в сутки; для проверки переноса кладём по строке на пользователя
+    for shard in range(shards):
+        con = sqlite3.connect(shard_path(shard, directory))
+        with con:
+            con.execute(
+                "INSERT INTO archived_deadlines (id, user_id, name, date, repeat, due, archived) "
+                "SELECT id, user_id, name, date, repeat, due, due + 30 FROM deadlines"
+            )
+        con.close()
+
+
+def _crash_copy(directory: Path, shards: int, to: int) -> None:
+    # сбой посреди переноса: копия архива в цели закоммичена, а из источника
+    # ещё не удалена; повторный rebalance должен только доудалить
+    for target in range(to):
+        init_db(shard_path(target, directory))
+    for shard in range(shards):
+        con = sqlite3.connect(shard_path(shard, directory))
+        rows = con.execute(
+            "SELECT id, user_id, name, date, repeat, due, archived FROM archived_deadlines"
+        ).fetchall()
+        con.close()
+        for target in range(to):
+            moving = [row for row in rows if shard_for(row[1], to) == target != shard]
+            if not moving:
+                continue
+            dst = sqlite3.connect(shard_path(target, directory))
+            with dst:
+                dst.executemany(
+                    "INSERT INTO archived_deadlines (id, user_id, name, date, repeat, due, archived) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", moving,
+                )
+            dst.close()
+
+
+async def _run(users: int, shards: int, directory: Path) -> float:
+    api = FakeBotApi()
+    await api.start()
+    worker_secret = secrets.token_urlsafe(16)
+    pool = WorkerPool(shards, worker_secret, token=TOKEN, base_url=api.base_url,
+                      directory=directory, base_port=BASE_PORT)
+    pool.start()
+    links = [WorkerLink(WORKER_HOST, port, WEBHOOK_PATH, worker_secret) for port in pool.ports]
+    router = ShardRouter("127.0.0.1", 0, WEBHOOK_PATH, SECRET, links)
+    try:
+        await asyncio.gather(*(link.wait_ready() for link in links))
+        await router.start()
+
+        async def user(uid: int) -> None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", router.port)
+            for update in _flow(api, uid):
+                status = await _post(reader, writer, json.dumps(update).encode())
+                assert status == 200, status
+            writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(1000 + i) for i in range(users)))
+        # ответ роутера значит «в очереди воркера»; ждём, пока все дедлайны запишутся
+        while sum(map(len, _placement(directory, shards).values())) < users:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        print(f"  разложено по шардам: {dict(sorted(router.routed.items()))}, "
+              f"вызовов API: {dict(api.calls)}")
+        return elapsed
+    finally:
+        await router.stop()
+        await asyncio.to_thread(pool.stop)
+        await api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--shards", default="1,4")
+    parser.add_argument("--rebalance-to", type=int, default=6)
+    args = parser.parse_args()
+
+    for shards in map(int, args.shards.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            print(f"{shards} шард(ов):")
+            elapsed = asyncio.run(_run(args.users, shards, directory))
+            _check(directory, shards, args.users)
+            updates = args.users * 5
+            print(f"  {updates} апдейтов за {elapsed:.2f} с ({updates / elapsed:.0f}/с), размещение верно")
+
+            _add_archive(directory, shards)
+            _crash_copy(directory, shards, args.rebalance_to)
+            moved = rebalance([shard_path(i, directory) for i in range(shards)], args.rebalance_to, directory)
+            _check(directory, args.rebalance_to, args.users)
+            _check(directory, args.rebalance_to, args.users, "archived_deadlines")
+            again = rebalance([shard_path(i, directory) for i in range(args.rebalance_to)], args.rebalance_to, directory)
+            assert not again, again
+            _check(directory, args.rebalance_to, args.users, "archived_deadlines")
+            print(f"  перебалансировка {shards} -> {args.rebalance_to}: переехало "
+                  f"{sum(moved.values())} из {args.users}, размещение и архив верны после прерванного переноса, повтор ничего не двигает")
+
+
+if __name__ == "__main__":
+    main()
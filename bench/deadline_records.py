@@ -0,0 +1,133 @@
+"""Строки дедлайнов: словари против Deadline и рендер списка с RenderContext.
+
+Снимает память на одну строку результата q_get (через tracemalloc) и время
+отрисовки страниц списка и дайджестов слота: прежний путь — словарь на строку,
+подпись даты и статус заново для каждой строки — против кортежей Deadline и
+одного RenderContext на запрос.
+
+    python -m bench.deadline_records [--users 2000] [--per-user 10] [--repeats 5]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import main as bot
+import storage
+from bench.synthetic import add_profile_args, populate, profile_from_args
+from main import MONTHS_RU, REPEAT_LABELS
+
+
+# --- прежнее представление, воспроизведено здесь для сравнения ---
+
+def _legacy_rows(rows) -> list[dict]:
+    return [{"id": r[0], "name": r[1], "date": r[2], "repeat": r[3], "due": r[4]} for r in rows]
+
+
+def _legacy_line(idx: int, dl: dict, today: int) -> str:
+    days = None if dl["due"] is None else dl["due"] - today
+    if dl["due"] is None:
+        fd = dl["date"]
+    else:
+        d = storage.from_day(dl["due"])
+        fd = f"{d.day} {MONTHS_RU[d.month]}"
+    if days is None:
+        status = ""
+    elif days < 0:
+        status = f"просрочен на {abs(days)} дн."
+    elif days == 0:
+        status = "СЕГОДНЯ!"
+    elif days == 1:
+        status = "ЗАВТРА!"
+    else:
+        status = f"через {days} дн."
+    repeat_tag = ""
+    if dl.get("repeat") in REPEAT_LABELS:
+        repeat_tag = f" [{REPEAT_LABELS[dl['repeat']]}]"
+    return f"{idx}. {dl['name']}{repeat_tag} — {fd} ({status})"
+
+
+def _fetch(path: Path, users: int) -> list[list[tuple]]:
+    con = storage.connect(path)
+    try:
+        return [
+            con.execute(f"SELECT {storage.DEADLINE_COLS} FROM deadlines WHERE user_id = ? ORDER BY due, id",
+                        (uid,)).fetchall()
+            for uid in range(1, users + 1)
+        ]
+    finally:
+        con.close()
+
+
+def _bytes_per_row(raw: list[list[tuple]], convert) -> float:
+    rows = sum(len(r) for r in raw)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    converted = [convert(r) for r in raw]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del converted
+    return (after - before) / rows
+
+
+def _time(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser()
+    add_profile_args(parser)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+    today = storage.today_day()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "records.db"
+        populate(path, profile, today)
+        raw = _fetch(path, profile.users)
+    rows = sum(len(r) for r in raw)
+
+    legacy_b = _bytes_per_row(raw, _legacy_rows)
+    tuple_b = _bytes_per_row(raw, lambda r: list(map(storage.Deadline._make, r)))
+    print(f"{rows} строк у {profile.users} пользователей")
+    print(f"  память на строку: dict {legacy_b:.0f} Б, Deadline {tuple_b:.0f} Б "
+          f"(ROW_COST кэша = {storage.ROW_COST})")
+
+    legacy = [_legacy_rows(r) for r in raw]
+    records = [list(map(storage.Deadline._make, r)) for r in raw]
+
+    def render_legacy() -> None:
+        for dls in legacy:
+            # раньше «сегодня» бралось заново в каждом обработчике
+            day = storage.today_day()
+            for i, dl in enumerate(dls):
+                _legacy_line(i + 1, dl, day)
+
+    def render_records() -> None:
+        for dls in records:
+            ctx = bot.RenderContext(today)
+            for i, dl in enumerate(dls):
+                bot._deadline_line(i + 1, dl, ctx)
+
+    def digest_records() -> None:
+        # дайджест слота: один контекст на весь слот
+        ctx = bot.RenderContext(today)
+        for dls in records:
+            bot._reminder_text(dls, ctx)
+
+    for name, fn in (("список, dict", render_legacy), ("список, Deadline", render_records),
+                     ("дайджесты слота, Deadline", digest_records)):
+        elapsed = _time(fn, args.repeats)
+        print(f"  {name:>26}: {elapsed * 1000:8.1f} мс, {elapsed / rows * 1e6:6.2f} мкс/строка")
+
+
+if __name__ == "__main__":
+    main_cli()
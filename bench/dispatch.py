@@ -0,0 +1,88 @@
+"""Рассылка слота напоминаний в поддельный бот с 429: голый send_message против диспетчера.
+
+Второй замер — одновременные 429: все DISPATCH_CONCURRENCY запросов в полёте
+получают retry_after разом, и рассылка должна встать на retry_after, а не на
+сумму пауз.
+
+    python -m bench.dispatch [--users 300] [--retry-after 5]
+"""
+import argparse
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from bench.fake_bot import FakeBot
+from dispatcher import DISPATCH_CONCURRENCY, ReminderDispatcher
+
+
+class _FloodedBot(FakeBot):
+    """Первые burst вызовов разом получают 429 с одним и тем же retry_after."""
+
+    def __init__(self, burst: int, retry_after: int):
+        super().__init__(retry_after=retry_after)
+        self.burst = burst
+        self.first_delivery: float | None = None
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        if self.burst:
+            self.burst -= 1
+            self.rejected += 1
+            await asyncio.sleep(self.latency)
+            raise RetryAfter(self.retry_after)
+        await super().send_message(chat_id, text, **kwargs)
+        if self.first_delivery is None:
+            self.first_delivery = time.monotonic()
+
+
+async def _bare(bot: FakeBot, users: int) -> None:
+    # _send_user_reminder до диспетчера: исключение логируется, напоминание теряется
+    async def one(uid: int) -> None:
+        try:
+            await bot.send_message(chat_id=uid, text="Напоминание")
+        except Exception:
+            pass
+
+    await asyncio.gather(*(one(uid) for uid in range(users)))
+
+
+async def _dispatched(bot: FakeBot, users: int) -> ReminderDispatcher:
+    dispatcher = ReminderDispatcher(bot)
+    await asyncio.gather(*(dispatcher.send(uid, "Напоминание") for uid in range(users)))
+    return dispatcher
+
+
+async def _stall(users: int, retry_after: int) -> float:
+    bot = _FloodedBot(DISPATCH_CONCURRENCY, retry_after)
+    dispatcher = ReminderDispatcher(bot)
+    t0 = time.monotonic()
+    await asyncio.gather(*(dispatcher.send(uid, "Напоминание") for uid in range(users)))
+    return bot.first_delivery - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--retry-after", type=int, default=5)
+    args = parser.parse_args()
+
+    bot = FakeBot()
+    t0 = time.perf_counter()
+    asyncio.run(_bare(bot, args.users))
+    print(f"bare send:  {time.perf_counter() - t0:6.2f} s  delivered {len(bot.delivered)}/{args.users}  "
+          f"429s {bot.rejected}")
+
+    bot = FakeBot()
+    t0 = time.perf_counter()
+    dispatcher = asyncio.run(_dispatched(bot, args.users))
+    print(f"dispatcher: {time.perf_counter() - t0:6.2f} s  delivered {len(bot.delivered)}/{args.users}  "
+          f"429s {bot.rejected}  {dispatcher.stats()}")
+
+    stall = asyncio.run(_stall(DISPATCH_CONCURRENCY, args.retry_after))
+    print(f"{DISPATCH_CONCURRENCY} одновременных 429 с retry_after={args.retry_after}: "
+          f"первая доставка через {stall:.2f} с")
+    assert stall < args.retry_after + 1, "паузы от одновременных 429 сложились"
+
+
+if __name__ == "__main__":
+    main()
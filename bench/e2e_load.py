@@ -0,0 +1,272 @@
+"""Нагрузка на диалоги бота тысячами виртуальных пользователей через fake Bot API.
+
+Каждый пользователь проходит /start, добавление дедлайна через календарь, список,
+переименование, смену даты и удаление, каждый раз дожидаясь ответа бота в свой
+чат. Бот собирается через main.build_application и ходит в fake Bot API по
+base_url; апдейты кладутся прямо в очередь приложения, как это делает webhook.
+
+Снимается задержка каждого обработчика (от вызова до возврата, включая ответы
+боту), число исходящих вызовов API по методам и сколько сценариев дошло до конца.
+Fake API можно замедлить и заставить отвечать 429.
+
+    python -m bench.e2e_load [--users 2000] [--ramp 5] [--think 0.05]
+                             [--concurrent-updates 1] [--flood-rate 0.01] [--slow-rate 0.01]
+                             [--memory]
+
+С --memory бот работает на MemoryBackend (storage.MEMORY_PATH) вместо файла.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from functools import wraps
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import Application
+
+import main
+from bench.fake_api import TOKEN, FakeBotApi
+from markup import BTN_ADD, BTN_LIST
+from metrics import walk_handlers
+from storage import MEMORY_PATH, _get_storage, close_storage, init_db
+
+
+class FlowError(Exception):
+    pass
+
+
+def _instrument(application: Application, latencies: dict[str, list[float]]) -> None:
+    def wrap(handler) -> None:
+        callback = handler.callback
+        name = callback.__name__
+
+        @wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                latencies[name].append(time.perf_counter() - started)
+
+        handler.callback = timed
+
+    for handler in walk_handlers(application):
+        wrap(handler)
+
+
+async def _start_app(
+    api: FakeBotApi, path: Path | str, concurrent_updates: int, flood_rate: float = 0,
+) -> Application:
+    builder = (
+        Application.builder().token(TOKEN).base_url(api.base_url).base_file_url(api.base_file_url)
+        .updater(None).concurrent_updates(concurrent_updates)
+    )
+    # виртуальные пользователи жмут быстрее любого человека: личный лимит FloodGuard
+    # отбросил бы хвост сценария, поэтому по умолчанию он выключен (повторы
+    # отсеиваются всё равно)
+    application = main.build_application(builder, db_path=path, flood_rate=flood_rate)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    return application
+
+
+async def _stop_app(application: Application) -> None:
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+
+def _callbacks(message: dict, prefix: str) -> list[str]:
+    markup = message.get("reply_markup") or {}
+    return [
+        button["callback_data"]
+        for row in markup.get("inline_keyboard", ())
+        for button in row
+        if button.get("callback_data", "").startswith(prefix)
+    ]
+
+
+class VirtualUser:
+    def __init__(self, api: FakeBotApi, application: Application, uid: int, args, rng: random.Random):
+        self.api = api
+        self.application = application
+        self.uid = uid
+        self.timeout = args.timeout
+        self.think = args.think
+        self.rng = rng
+        self.inbox = api.inbox(uid)
+        self.steps = 0
+
+    async def _send(self, update: dict, expect: str) -> dict:
+        if self.think:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        await self.application.update_queue.put(Update.de_json(update, self.application.bot))
+        try:
+            reply = await asyncio.wait_for(self.inbox.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise FlowError(f"нет ответа на шаге {expect}") from None
+        self.steps += 1
+        return reply
+
+    async def text(self, text: str, expect: str) -> dict:
+        return await self._send(self.api.message_update(self.uid, text), expect)
+
+    async def click(self, data: str, expect: str) -> dict:
+        return await self._send(self.api.callback_update(self.uid, data), expect)
+
+    async def run(self) -> None:
+        today = date.today()
+        year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+
+        await self.text("/start", "start")
+        await self.text(BTN_ADD, "add_start")
+        await self.text(f"задача {self.uid}", "add_name")
+        await self.click(f"cal_n_{month:02d}.{year}", "add_date_cal_nav")
+        await self.click(f"cal_d_{self.rng.randrange(1, 29):02d}.{month:02d}.{year}", "add_date_cal_pick")
+        await self.click(self.rng.choice(("repeat_none", "repeat_weekly", "repeat_monthly")), "add_repeat")
+
+        listing = await self.text(BTN_LIST, "list_deadlines")
+        ids = [data.removeprefix("editname_") for data in _callbacks(listing, "editname_")]
+        if not ids:
+            raise FlowError("в списке нет добавленного дедлайна")
+        dl_id = ids[-1]
+
+        await self.click(f"editname_{dl_id}", "editname_start")
+        await self.text(f"задача {self.uid} (новое)", "editname_receive")
+        await self.click(f"editdate_{dl_id}", "editdate_start")
+        await self.text(f"{self.rng.randrange(1, 29):02d}.{month:02d}.{year + 1}", "editdate_receive")
+        await self.click("menu_list", "list_deadlines")
+        await self.click(f"delete_{dl_id}", "delete_deadline_callback")
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def _summary(latencies: dict[str, list[float]]) -> dict[str, dict]:
+    out = {}
+    for name, values in sorted(latencies.items()):
+        values = sorted(values)
+        out[name] = {
+            "count": len(values),
+            "p50_ms": statistics.median(values) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    return out
+
+
+async def _run(args, path: Path | str) -> dict:
+    api = FakeBotApi(
+        latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        flood_rate=args.flood_rate, retry_after=args.retry_after, seed=args.seed,
+    )
+    await api.start()
+    application = await _start_app(api, path, args.concurrent_updates)
+    latencies: dict[str, list[float]] = defaultdict(list)
+    _instrument(application, latencies)
+    errors: Counter[str] = Counter()
+
+    async def on_error(update, context) -> None:
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(on_error)
+
+    failures: Counter[str] = Counter()
+    steps = 0
+    rng = random.Random(args.seed)
+
+    async def user(i: int) -> None:
+        nonlocal steps
+        uid = 1000 + i
+        await asyncio.sleep(args.ramp * i / args.users)
+        vu = VirtualUser(api, application, uid, args, random.Random(rng.random()))
+        try:
+            await vu.run()
+        except FlowError as e:
+            failures[str(e)] += 1
+        finally:
+            steps += vu.steps
+            api.close_inbox(uid)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    backend = type(_get_storage()).__name__
+    await _stop_app(application)
+    await close_storage()
+    await api.stop()
+
+    return {
+        "users": args.users,
+        "storage": backend,
+        "completed": args.users - sum(failures.values()),
+        "elapsed_s": elapsed,
+        "updates_per_s": steps / elapsed,
+        "failures": dict(failures),
+        "errors": dict(errors),
+        "api_calls": dict(api.calls),
+        "injected_429": dict(api.flooded),
+        "slowed": api.slowed,
+        "handlers": _summary(latencies),
+    }
+
+
+def _print(report: dict) -> None:
+    print(f"{report['completed']}/{report['users']} сценариев за {report['elapsed_s']:.1f} с, "
+          f"{report['updates_per_s']:.0f} апдейтов/с ({report['storage']})")
+    if report["failures"]:
+        print(f"  не дошли до конца: {report['failures']}")
+    if report["errors"]:
+        print(f"  ошибки в обработчиках: {report['errors']}")
+    print(f"  вызовы API: {report['api_calls']}")
+    if report["injected_429"] or report["slowed"]:
+        print(f"  внедрено 429: {report['injected_429']}, медленных ответов: {report['slowed']}")
+    print(f"  {'обработчик':>26} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, s in report["handlers"].items():
+        print(f"  {name:>26} {s['count']:>7} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+              f"{s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд стартуют все пользователи")
+    parser.add_argument("--think", type=float, default=0.05, help="средняя пауза перед каждым действием, с")
+    parser.add_argument("--timeout", type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument("--concurrent-updates", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="куда записать отчёт в JSON")
+    parser.add_argument("--memory", action="store_true", help="БД в памяти (MemoryBackend) вместо файла")
+    args = parser.parse_args()
+    # httpx пишет INFO на каждый запрос к API — на тысячах пользователей это шум
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.memory:
+        report = asyncio.run(_run(args, MEMORY_PATH))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "e2e.db"
+            init_db(path)
+            report = asyncio.run(_run(args, path))
+    _print(report)
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,232 @@
+"""Локальная замена Bot API: бот направляется сюда через base_url.
+
+Понимает методы, которые вызывает бот, отдаёт апдейты через long polling
+и считает вызовы по методам. Умеет отвечать медленно и с 429, а сообщения бота
+в чат складывает во входящие этого чата, если их кто-то слушает. Файлы,
+добавленные через add_file, отдаются getFile и скачиванием по base_file_url.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+from webhook import read_request, write_response
+
+TOKEN = "123456:fake"
+
+MESSAGE_METHODS = ("sendMessage", "editMessageText", "editMessageReplyMarkup")
+# методы, на которые может прийти внедрённый 429; служебные вызовы вроде getMe не трогаем
+FLOOD_METHODS = (*MESSAGE_METHODS, "answerCallbackQuery")
+
+
+def _params(body: bytes, content_type: str) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, values in parse_qs(body.decode()).items():
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+
+def user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, description: str, parameters: dict | None = None):
+        super().__init__(description)
+        self.status = status
+        self.payload = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            self.payload["parameters"] = parameters
+
+
+class FakeBotApi:
+    """latency — задержка каждого ответа; slow_rate доля ответов задерживается ещё
+    на slow_latency; flood_rate доля вызовов FLOOD_METHODS получает 429 с retry_after.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+        slow_rate: float = 0.0, slow_latency: float = 1.0,
+        flood_rate: float = 0.0, retry_after: int = 1, seed: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.calls: Counter[str] = Counter()
+        self.flooded: Counter[str] = Counter()
+        self.slowed = 0
+        self._inboxes: dict[int, asyncio.Queue] = {}
+        self._rng = random.Random(seed)
+        self._updates: list[dict] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._files: dict[str, bytes] = {}
+        self._server: asyncio.Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    def add_file(self, content: bytes) -> str:
+        file_id = f"file{len(self._files) + 1}"
+        self._files[file_id] = content
+        return file_id
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    def message_update(self, uid: int, text: str) -> dict:
+        message = {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": user(uid), "text": text,
+        }
+        if text.startswith("/"):
+            # CommandHandler смотрит на сущность bot_command, а не на сам текст
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self.next_update_id(), "message": message}
+
+    def document_update(self, uid: int, file_id: str, file_name: str) -> dict:
+        message = {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": user(uid),
+            "document": {
+                "file_id": file_id, "file_unique_id": file_id, "file_name": file_name,
+                "file_size": len(self._files[file_id]),
+            },
+        }
+        return {"update_id": self.next_update_id(), "message": message}
+
+    def callback_update(self, uid: int, data: str, message_id: int = 1) -> dict:
+        return {
+            "update_id": self.next_update_id(),
+            "callback_query": {
+                "id": str(self.next_update_id()), "from": user(uid), "chat_instance": str(uid),
+                "data": data,
+                "message": {
+                    "message_id": message_id, "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"}, "from": user(0), "text": "…",
+                },
+            },
+        }
+
+    def inbox(self, chat_id: int) -> asyncio.Queue:
+        """Очередь сообщений бота в чат: параметры вызова, имя метода в "method" и "message_id"."""
+        return self._inboxes.setdefault(chat_id, asyncio.Queue())
+
+    def close_inbox(self, chat_id: int) -> None:
+        self._inboxes.pop(chat_id, None)
+
+    def push(self, update: dict) -> None:
+        self._updates.append(update)
+        self._new_update.set()
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": params.get("message_id") or next(self._message_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": user(0), "text": params.get("text", ""),
+        }
+
+    async def _inject(self, method: str) -> None:
+        delay = self.latency
+        if self.slow_rate and self._rng.random() < self.slow_rate:
+            delay += self.slow_latency
+            self.slowed += 1
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.flood_rate and method in FLOOD_METHODS and self._rng.random() < self.flood_rate:
+            self.flooded[method] += 1
+            raise ApiError(429, f"Too Many Requests: retry after {self.retry_after}",
+                           {"retry_after": self.retry_after})
+
+    async def call(self, method: str, params: dict):
+        if method != "getUpdates":
+            await self._inject(method)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bot", "username": "fake_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self._files:
+                raise ApiError(400, "Bad Request: invalid file_id")
+            return {"file_id": file_id, "file_unique_id": file_id,
+                    "file_size": len(self._files[file_id]), "file_path": f"documents/{file_id}"}
+        if method in MESSAGE_METHODS:
+            message = self._message(params)
+            inbox = self._inboxes.get(int(params.get("chat_id") or 0))
+            if inbox is not None:
+                inbox.put_nowait({**params, "method": method, "message_id": message["message_id"]})
+            return message
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method = request.path.rsplit("/", 1)[-1]
+                if request.path.startswith("/file/"):
+                    content = self._files.get(method)
+                    write_response(writer, 200 if content is not None else 404, content or b"",
+                                   keep_alive=request.keep_alive)
+                    await writer.drain()
+                    continue
+                self.calls[method] += 1
+                status, payload = 200, None
+                try:
+                    payload = {"ok": True, "result": await self.call(
+                        method, _params(request.body, request.headers.get("content-type", "")),
+                    )}
+                except ApiError as e:
+                    status, payload = e.status, e.payload
+                write_response(writer, status, json.dumps(payload).encode(),
+                               headers={"Content-Type": "application/json"},
+                               keep_alive=request.keep_alive)
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,36 @@
+"""Поддельный бот с flood control как у Telegram: 429 при превышении лимитов."""
+import asyncio
+import random
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+
+
+class FakeBot:
+    def __init__(self, global_rate: int = 30, per_chat_interval: float = 1.0,
+                 latency: float = 0.02, retry_after: int = 1, seed: int = 0):
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.latency = latency
+        self.retry_after = retry_after
+        self.delivered: dict[int, int] = {}
+        self.rejected = 0
+        self.calls = 0
+        self._window: deque[float] = deque()
+        self._chat_last: dict[int, float] = {}
+        self._rng = random.Random(seed)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.latency * (0.5 + self._rng.random()))
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1.0:
+            self._window.popleft()
+        last = self._chat_last.get(chat_id)
+        if len(self._window) >= self.global_rate or (last is not None and now - last < self.per_chat_interval):
+            self.rejected += 1
+            raise RetryAfter(self.retry_after)
+        self._window.append(now)
+        self._chat_last[chat_id] = now
+        self.delivered[chat_id] = self.delivered.get(chat_id, 0) + 1
@@ -0,0 +1,101 @@
+"""Опрос лент календаря так, как это делают календарные клиенты.
+
+Поднимает FeedServer над синтетической базой и прогоняет три прохода по всем
+пользователям: первый запрос (лента собирается из БД), повторный без ETag
+(лента из кэша) и условный с If-None-Match (304). Для каждого прохода — запросы
+в секунду, p50/p99 и сколько раз лента собиралась заново.
+
+Клиент — голые keep-alive соединения asyncio, чтобы в замер не попадала
+стоимость HTTP-клиента.
+
+    python -m bench.feed_load [--users 2000] [--per-user 10] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import storage
+from bench.synthetic import add_profile_args, populate, profile_from_args
+from feed import FeedServer, feed_path
+
+SECRET = "bench"
+
+
+async def _get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+               path: str, etag: str | None) -> tuple[int, dict[str, str]]:
+    request = f"GET {path} HTTP/1.1\r\nHost: bench\r\n"
+    if etag:
+        request += f"If-None-Match: {etag}\r\n"
+    writer.write((request + "\r\n").encode())
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = {}
+    for line in head[1:]:
+        name, _, value = line.partition(":")
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get("content-length", 0)))
+    return int(head[0].split(" ", 2)[1]), headers
+
+
+async def _pass(port: int, paths: dict[int, str], etags: dict[int, str],
+                concurrency: int, conditional: bool) -> tuple[float, list[float], int]:
+    queue = list(paths.items())
+    latencies: list[float] = []
+    not_modified = 0
+
+    async def worker() -> None:
+        nonlocal not_modified
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        while queue:
+            uid, path = queue.pop()
+            t0 = time.perf_counter()
+            status, headers = await _get(reader, writer, path, etags.get(uid) if conditional else None)
+            latencies.append(time.perf_counter() - t0)
+            if status == 304:
+                not_modified += 1
+            elif status == 200:
+                etags[uid] = headers["etag"]
+            else:
+                raise RuntimeError(f"{path}: HTTP {status}")
+        writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - t0, sorted(latencies), not_modified
+
+
+async def _run(path: Path, users: int, concurrency: int) -> None:
+    storage.open_storage(path)
+    server = FeedServer("127.0.0.1", 0, SECRET)
+    await server.start()
+    paths = {uid: feed_path(SECRET, uid) for uid in range(1, users + 1)}
+    etags: dict[int, str] = {}
+    for name, conditional in (("первый запрос", False), ("повтор без ETag", False), ("If-None-Match", True)):
+        builds = server.cache.misses
+        elapsed, lat, not_modified = await _pass(server.port, paths, etags, concurrency, conditional)
+        print(f"{name:>16}: {len(lat) / elapsed:8.0f} запр/с, p50 {statistics.median(lat) * 1000:6.2f} мс, "
+              f"p99 {lat[int(len(lat) * 0.99)] * 1000:6.2f} мс, сборок ленты {server.cache.misses - builds}, "
+              f"304: {not_modified}")
+    print(f"кэш лент: {server.cache.stats()}")
+    await server.stop()
+    await storage.close_storage()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_profile_args(parser)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "feed.db"
+        populate(path, profile)
+        asyncio.run(_run(path, profile.users, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Пользователи, которые долбят по кнопкам: исходящие вызовы API с защитой от флуда и без.
+
+Каждый виртуальный пользователь открывает календарь добавления и --presses раз
+подряд жмёт ◀/▶ с частотой --rate в секунду. Жмёт он по той клавиатуре, которая
+у него сейчас на экране, то есть по последней дошедшей до него правке. Потом
+выбирает день, трижды подряд жмёт «удалить» у нового дедлайна и шлёт --spam
+команд /list подряд. Клиент держит у себя сообщения с их клавиатурой и
+edit_date, как настоящий Telegram, и кладёт их в callback-запросы.
+
+Прогон идёт дважды: как есть (FloodGuard и склейка листания) и без защиты,
+когда FloodGuard снят, а обработчики листания правят клавиатуру на каждое
+нажатие, как раньше. Для
+обоих снимаются вызовы API по методам, пиковое число правок одного сообщения за
+секунду и то, совпал ли в конце показанный месяц с последним нажатием.
+
+    python -m bench.flood [--users 5] [--presses 20] [--rate 10] [--spam 20] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from telegram import Update
+
+import main
+from bench.e2e_load import _callbacks, _start_app, _stop_app
+from bench.fake_api import FakeBotApi, user
+from markup import BTN_ADD, BTN_LIST, calendar_markup
+from metrics import walk_handlers
+from storage import close_storage, init_db
+
+QUIET = 1.0
+TIMEOUT = 60.0
+EDITS = ("editMessageText", "editMessageReplyMarkup")
+
+
+def _unguarded_nav(cancel_cb: str, state: int):
+    """Листание до FloodGuard: каждое нажатие — своя правка клавиатуры прямо в обработчике."""
+    async def nav(update, context):
+        query = update.callback_query
+        await query.answer()
+        month, year = main._parse_cal_nav(query.data)
+        await query.message.edit_reply_markup(reply_markup=calendar_markup(year, month, cancel_cb=cancel_cb))
+        return state
+
+    return nav
+
+
+def _unguard(application) -> None:
+    application.remove_handler(application.handlers[-1][0], group=-1)
+    old = {
+        main.add_date_cal_nav: _unguarded_nav("cancel_add", main.ADD_DATE),
+        main.editdate_cal_nav: _unguarded_nav("cancel_edit", main.EDIT_DATE),
+    }
+    for handler in walk_handlers(application):
+        handler.callback = old.get(handler.callback, handler.callback)
+
+
+class Client:
+    """Экран одного пользователя: сообщения бота с текстом, клавиатурой и edit_date."""
+
+    def __init__(self, api: FakeBotApi, application, uid: int):
+        self.api = api
+        self.application = application
+        self.uid = uid
+        self.inbox = api.inbox(uid)
+        self.messages: dict[int, dict] = {}
+        self.edit_times: dict[int, list[float]] = defaultdict(list)
+        self.received = asyncio.Event()
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        while True:
+            call = await self.inbox.get()
+            message_id = int(call["message_id"])
+            message = self.messages.setdefault(message_id, {"message_id": message_id})
+            if call["method"] != "editMessageReplyMarkup":
+                message["text"] = call.get("text", "")
+            message["reply_markup"] = call.get("reply_markup")
+            if call["method"] in EDITS:
+                message["edit_date"] = int(time.time())
+                self.edit_times[message_id].append(time.monotonic())
+            self.last = message
+            self.received.set()
+
+    async def reply(self, prefix: str = "") -> dict:
+        """Дождаться сообщения бота, текст которого начинается с prefix; отложенные правки пропускаются."""
+        async def matching() -> dict:
+            while True:
+                await self.received.wait()
+                if self.last.get("text", "").startswith(prefix):
+                    return self.last
+                self.received.clear()
+
+        return await asyncio.wait_for(matching(), TIMEOUT)
+
+    async def quiet(self) -> None:
+        # очередь апдейтов общая, а правки, отложенные склейкой, приходят позже ответа на нажатие
+        while True:
+            self.received.clear()
+            try:
+                await asyncio.wait_for(self.received.wait(), QUIET)
+            except asyncio.TimeoutError:
+                if self.application.update_queue.empty():
+                    return
+
+    async def _put(self, update: dict) -> None:
+        self.received.clear()
+        await self.application.update_queue.put(Update.de_json(update, self.application.bot))
+
+    async def text(self, text: str) -> None:
+        await self._put(self.api.message_update(self.uid, text))
+
+    async def click(self, message: dict, data: str) -> None:
+        shown = {
+            "message_id": message["message_id"], "date": int(time.time()),
+            "chat": {"id": self.uid, "type": "private"}, "from": user(0),
+            "text": message.get("text", "…"),
+        }
+        for key in ("reply_markup", "edit_date"):
+            if message.get(key):
+                shown[key] = message[key]
+        await self._put({
+            "update_id": self.api.next_update_id(),
+            "callback_query": {
+                "id": str(self.api.next_update_id()), "from": user(self.uid),
+                "chat_instance": str(self.uid), "data": data, "message": shown,
+            },
+        })
+
+    def close(self) -> None:
+        self._reader.cancel()
+        self.api.close_inbox(self.uid)
+
+
+def _shown_month(message: dict) -> str | None:
+    days = _callbacks(message, "cal_d_")
+    return days[0].split(".", 1)[1] if days else None
+
+
+async def _user(api: FakeBotApi, application, uid: int, args, rng: random.Random) -> tuple[bool, int]:
+    client = Client(api, application, uid)
+    try:
+        await client.text("/start")
+        await client.reply()
+        await client.text(BTN_ADD)
+        await client.reply()
+        await client.text(f"задача {uid}")
+        calendar = await client.reply("Выбери дату")
+
+        last = None
+        for _ in range(args.presses):
+            message = client.messages[calendar["message_id"]]
+            last = rng.choice(_callbacks(message, "cal_p_") + _callbacks(message, "cal_n_"))
+            await client.click(message, last)
+            await asyncio.sleep(1 / args.rate)
+        await client.quiet()
+        message = client.messages[calendar["message_id"]]
+        # cal_p_MM.YYYY и cal_n_MM.YYYY несут сам месяц, на который листают
+        correct = _shown_month(message) == last.split("_", 2)[2]
+
+        day = _callbacks(message, "cal_d_")[0]
+        await client.click(message, day)
+        repeat = await client.reply("Повторяющийся")
+        await client.click(repeat, "repeat_none")
+        await client.reply("Дедлайн добавлен")
+
+        await client.text(BTN_LIST)
+        listing = await client.reply(main.LIST_HEADER)
+        delete = _callbacks(listing, "delete_")[-1]
+        for _ in range(3):
+            await client.click(listing, delete)
+            await asyncio.sleep(0.05)
+        await client.quiet()
+
+        for _ in range(args.spam):
+            await client.text("/list")
+            await asyncio.sleep(1 / args.rate)
+        await client.quiet()
+        peak = max(
+            max(sum(1 for u in times if t <= u < t + 1) for t in times)
+            for times in client.edit_times.values()
+        )
+        return correct, peak
+    finally:
+        client.close()
+
+
+async def _run(args, path: Path, guarded: bool) -> dict:
+    api = FakeBotApi(latency=args.latency)
+    await api.start()
+    application = await _start_app(api, path, args.concurrent_updates, main.FLOOD_UPDATE_RATE)
+    if not guarded:
+        _unguard(application)
+    try:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            _user(api, application, 1000 + i, args, random.Random(rng.random())) for i in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started
+        stats = application.bot_data["flood_guard"].stats() if guarded else {}
+        # после тишины ни одна правка календаря не должна висеть
+        assert not stats or stats["nav_pending"] == 0, stats
+    finally:
+        await _stop_app(application)
+        await close_storage()
+        await api.stop()
+    return {
+        "elapsed_s": elapsed,
+        "calls": Counter({m: n for m, n in api.calls.items() if m not in ("getMe", "getUpdates")}),
+        "correct": sum(ok for ok, _ in results),
+        "peak": max(peak for _, peak in results),
+        "guard": stats,
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--presses", type=int, default=20, help="нажатий ◀/▶ подряд на пользователя")
+    parser.add_argument("--rate", type=float, default=10.0, help="нажатий в секунду")
+    parser.add_argument("--spam", type=int, default=20, help="команд /list подряд на пользователя")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument("--concurrent-updates", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("apscheduler").setLevel(logging.WARNING)
+    logging.getLogger("telegram.ext").setLevel(logging.WARNING)
+
+    for name, guarded in (("без защиты", False), ("FloodGuard", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "flood.db"
+            init_db(path)
+            report = asyncio.run(_run(args, path, guarded))
+        calls = report["calls"]
+        print(f"{name}: {sum(calls.values())} вызовов API за {report['elapsed_s']:.1f} с, "
+              f"правок одного сообщения за секунду до {report['peak']}, "
+              f"месяц совпал с последним нажатием у {report['correct']}/{args.users}")
+        print(f"  {dict(sorted(calls.items()))}")
+        if report["guard"]:
+            print(f"  {report['guard']}")
+
+
+if __name__ == "__main__":
+    main_cli()
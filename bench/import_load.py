@@ -0,0 +1,122 @@
+"""Импорт большого CSV и .ics и что в это время видят другие чаты.
+
+Генерирует файл на --rows строк (часть — с битыми датами и дубликатами),
+импортирует его через importer.import_file и параллельно гоняет обычные
+записи других пользователей. Снимается время импорта, задержка event loop
+и задержка чужих db_add во время импорта, а отдельным проходом без БД — пик
+памяти разбора (tracemalloc замедляет код в разы, поэтому не в замере времени).
+
+    python -m bench.import_load [--rows 50000] [--kind csv|ics] [--writers 20]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from uuid import uuid4
+
+import storage
+from bench.loop_lag import _probe
+from importer import PARSERS, ImportStats, _next_batch, import_file
+
+IMPORTER = 1
+
+
+def _write_csv(path: Path, rows: int, rng: random.Random, today: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Название;Дата;Повтор\n")
+        for i in range(rows):
+            d = storage.from_day(today + rng.randrange(-30, 200))
+            date = d.strftime(storage.DATE_FMT) if rng.random() > 0.02 else "31.02.2026"
+            name = f"Пара {i % (rows // 2 or 1)}"  # вторая половина повторяет первую
+            repeat = rng.choice(("", "", "weekly", "monthly"))
+            f.write(f"{name};{date};{repeat}\n")
+
+
+def _write_ics(path: Path, rows: int, rng: random.Random, today: int) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//import//RU\r\n")
+        for i in range(rows):
+            d = storage.from_day(today + rng.randrange(-30, 200))
+            start = d.strftime("%Y%m%d") if rng.random() > 0.02 else "20260231"
+            f.write("BEGIN:VEVENT\r\n")
+            f.write(f"UID:{uuid4()}\r\nDTSTART;VALUE=DATE:{start}\r\n")
+            f.write(f"SUMMARY:Пара {i % (rows // 2 or 1)}\\, аудитория {i % 300}\r\n")
+            if rng.random() < 0.5:
+                f.write(f"RRULE:FREQ={rng.choice(('WEEKLY', 'MONTHLY'))}\r\n")
+            f.write("END:VEVENT\r\n")
+        f.write("END:VCALENDAR\r\n")
+
+
+async def _other_chats(writers: int, latencies: list[float], stop: asyncio.Event) -> None:
+    async def writer(uid: int) -> None:
+        rng = random.Random(uid)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await storage.db_add(uid, uuid4().hex[:8], "обычный дедлайн", storage.today_day() + 3)
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(rng.expovariate(20))
+
+    await asyncio.gather(*(writer(1000 + i) for i in range(writers)))
+
+
+def _parse_peak(upload: Path, kind: str) -> int:
+    tracemalloc.start()
+    records = PARSERS[kind](upload, ImportStats())
+    while _next_batch(records):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+async def _run(path: Path, upload: Path, kind: str, writers: int) -> None:
+    storage.open_storage(path)
+    lags: list[float] = []
+    write_lat: list[float] = []
+    stop = asyncio.Event()
+    background = [
+        asyncio.create_task(_probe(lags, stop)),
+        asyncio.create_task(_other_chats(writers, write_lat, stop)),
+    ]
+    await asyncio.sleep(0.2)
+    t0 = time.perf_counter()
+    stats = await import_file(IMPORTER, upload, kind)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await asyncio.gather(*background)
+    await storage.close_storage()
+
+    lags.sort()
+    write_lat.sort()
+    print(f"{kind}: {upload.stat().st_size / 1e6:.1f} МБ за {elapsed:.2f} с — {stats}")
+    print(f"  пик памяти разбора: {_parse_peak(upload, kind) / 1e6:.1f} МБ")
+    print(f"  задержка loop: p50 {statistics.median(lags) * 1000:.2f} мс, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1000:.2f} мс, max {lags[-1] * 1000:.2f} мс")
+    if write_lat:
+        print(f"  db_add других чатов ({len(write_lat)}): p50 {statistics.median(write_lat) * 1000:.2f} мс, "
+              f"p99 {write_lat[int(len(write_lat) * 0.99)] * 1000:.2f} мс, max {write_lat[-1] * 1000:.2f} мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--kind", choices=("csv", "ics"), default="csv")
+    parser.add_argument("--writers", type=int, default=20, help="сколько других чатов пишут во время импорта")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    today = storage.today_day()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "import.db"
+        upload = Path(tmp) / f"upload.{args.kind}"
+        storage.init_db(path)
+        (_write_csv if args.kind == "csv" else _write_ics)(upload, args.rows, random.Random(args.seed), today)
+        asyncio.run(_run(path, upload, args.kind, args.writers))
+
+
+if __name__ == "__main__":
+    main()
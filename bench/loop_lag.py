@@ -0,0 +1,109 @@
+"""Задержка event loop при обращениях к БД: синхронный _conn() против storage.
+
+    python -m bench.loop_lag [--users 200] [--ops 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import statistics
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import storage
+
+TICK = 0.001
+
+
+async def _probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - t0 - TICK)
+
+
+def _seed(path: Path, users: int) -> None:
+    con = storage.connect(path)
+    with con:
+        for uid in range(users):
+            for i in range(10):
+                storage.q_add(con, uid, uuid4().hex[:8], f"dl {i}", storage.parse_day(f"{1 + i:02d}.01.2020"), "weekly")
+    con.close()
+
+
+async def _sync_op(path: Path, uid: int) -> None:
+    # поведение до storage: новое соединение и коммит на каждый вызов прямо в корутине
+    con = sqlite3.connect(path)
+    with con:
+        storage.q_get_until(con, uid, storage.today_day() + 7)
+    with con:
+        storage.q_get(con, uid)
+    with con:
+        storage.q_set_remind_time(con, uid, 9, 0)
+    con.close()
+
+
+async def _async_op(uid: int) -> None:
+    await storage.db_get_until(uid, storage.today_day() + 7)
+    await storage.db_get(uid)
+    await storage.db_set_remind_time(uid, 9, 0)
+
+
+async def _run(make_op, users: int, ops: int, concurrency: int) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with sem:
+            await make_op(i % users)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(ops)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    lags.sort()
+    return {
+        "ops_per_s": ops / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000 if lags else 0.0,
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1] * 1000 if lags else 0.0,
+        "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        storage.init_db(path)
+        _seed(path, args.users)
+
+        before = asyncio.run(_run(lambda uid: _sync_op(path, uid), args.users, args.ops, args.concurrency))
+
+        async def after_run():
+            storage.open_storage(path)
+            try:
+                return await _run(_async_op, args.users, args.ops, args.concurrency)
+            finally:
+                await storage.close_storage()
+
+        after = asyncio.run(after_run())
+
+    for label, res in (("sync _conn()", before), ("storage", after)):
+        print(
+            f"{label:>14}: {res['ops_per_s']:8.0f} ops/s  "
+            f"lag p50 {res['lag_p50_ms']:6.2f} ms  p99 {res['lag_p99_ms']:7.2f} ms  "
+            f"max {res['lag_max_ms']:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
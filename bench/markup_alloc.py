@@ -0,0 +1,63 @@
+"""Аллокации и время на построение разметки в обработчиках: сборка каждый раз против кэша.
+
+    python -m bench.markup_alloc [--calls 2000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import markup
+
+
+def _legacy_repeat_kb() -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton("Нет", callback_data="repeat_none")],
+        [InlineKeyboardButton("Еженедельно", callback_data="repeat_weekly")],
+        [InlineKeyboardButton("Ежемесячно", callback_data="repeat_monthly")],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+CASES = (
+    ("calendar nav", lambda i: markup.build_calendar(2026, 1 + i % 12, "cancel_add"),
+     lambda i: markup.calendar_markup(2026, 1 + i % 12, "cancel_add")),
+    ("repeat choice", lambda i: _legacy_repeat_kb(), lambda i: markup.REPEAT_KB),
+)
+
+
+def _measure(fn, calls: int) -> tuple[float, float, float]:
+    keep = []
+    tracemalloc.start()
+    before_bytes, _ = tracemalloc.get_traced_memory()
+    before_blocks = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    for i in range(calls):
+        keep.append(fn(i))
+    after_bytes, _ = tracemalloc.get_traced_memory()
+    after_blocks = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    per_call_us = (time.perf_counter() - t0) / calls * 1e6
+    return (after_blocks - before_blocks) / calls, (after_bytes - before_bytes) / calls, per_call_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    for i in range(12):
+        markup.calendar_markup(2026, 1 + i, "cancel_add")
+
+    print(f"{'':>14} {'':>7} {'blocks/call':>12} {'bytes/call':>11} {'us/call':>8}")
+    for label, legacy, cached in CASES:
+        for mode, fn in (("rebuild", legacy), ("cached", cached)):
+            blocks, size, us = _measure(fn, args.calls)
+            print(f"{label:>14} {mode:>7} {blocks:>12.1f} {size:>11.0f} {us:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
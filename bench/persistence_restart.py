@@ -0,0 +1,136 @@
+"""Переживает ли диалог рестарт и сколько стоит запуск при большом числе пользователей.
+
+1. Через fake Bot API пользователь начинает добавлять дедлайн, бот перезапускается
+   посреди диалога, после рестарта пользователь досылает дату — дедлайн должен записаться.
+2. Время загрузки состояния при старте для разного числа пользователей с сохранённым
+   user_data: SqlitePersistence против чтения всего сразу.
+
+    python -m bench.persistence_restart [--users 1000,100000]
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import Application
+
+import main
+from bench.fake_api import TOKEN, FakeBotApi
+from markup import BTN_ADD
+from persistence import SqlitePersistence
+from storage import close_storage, connect, init_db, open_storage
+
+CONVERSATIONS = ("add", "editdate", "editname", "settime")
+
+
+async def _start_app(api: FakeBotApi, path: Path) -> Application:
+    builder = Application.builder().token(TOKEN).base_url(api.base_url).updater(None)
+    application = main.build_application(builder, db_path=path)
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    return application
+
+
+async def _stop_app(application: Application) -> None:
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+
+async def _send(application: Application, update: dict) -> None:
+    await application.process_update(Update.de_json(update, application.bot))
+
+
+async def _restart_check(path: Path) -> None:
+    api = FakeBotApi()
+    await api.start()
+    uid = 42
+    app = await _start_app(api, path)
+    await _send(app, api.message_update(uid, BTN_ADD))
+    await _send(app, api.message_update(uid, "курсовая"))
+    await _stop_app(app)
+
+    app = await _start_app(api, path)
+    await _send(app, api.message_update(uid, "01.01.2031"))
+    await _send(app, api.callback_update(uid, "repeat_none"))
+    await _stop_app(app)
+    await api.stop()
+
+    con = sqlite3.connect(path)
+    rows = con.execute("SELECT name, date FROM deadlines WHERE user_id = ?", (uid,)).fetchall()
+    con.close()
+    assert rows == [("курсовая", "01.01.2031")], rows
+    print("диалог пережил рестарт: дедлайн записан после перезапуска посреди добавления")
+
+
+def _populate(path: Path, users: int) -> None:
+    init_db(path)
+    con = connect(path)
+    now = int(time.time())
+    with con:
+        con.executemany(
+            "INSERT INTO user_data (user_id, data, updated) VALUES (?, ?, ?)",
+            ((uid, json.dumps({"deadline_name": f"задача {uid}", "edit_dl_id": "0123abcd"}), now)
+             for uid in range(users)),
+        )
+        # незавершённый диалог у каждого сотого
+        con.executemany(
+            "INSERT INTO conversations (name, key, user_id, state, updated) VALUES (?, ?, ?, ?, ?)",
+            (("add", json.dumps([uid, uid]), uid, json.dumps(main.ADD_DATE), now)
+             for uid in range(0, users, 100)),
+        )
+    con.close()
+
+
+async def _load_lazy(path: Path) -> float:
+    started = time.perf_counter()
+    persistence = SqlitePersistence(path)
+    await persistence.get_user_data()
+    for name in CONVERSATIONS:
+        await persistence.get_conversations(name)
+    elapsed = time.perf_counter() - started
+    await persistence.flush()
+    await close_storage()
+    return elapsed
+
+
+async def _load_eager(path: Path) -> float:
+    started = time.perf_counter()
+    st = open_storage(path)
+    rows = await st.scan(lambda con: con.execute("SELECT user_id, data FROM user_data").fetchall())
+    {uid: json.loads(data) for uid, data in rows}
+    for name in CONVERSATIONS:
+        await st.scan(lambda con: con.execute(
+            "SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall())
+    elapsed = time.perf_counter() - started
+    await close_storage()
+    return elapsed
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1000,100000")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "restart.db"
+        init_db(path)
+        asyncio.run(_restart_check(path))
+
+    for users in map(int, args.users.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "startup.db"
+            _populate(path, users)
+            lazy = asyncio.run(_load_lazy(path))
+            eager = asyncio.run(_load_eager(path))
+            print(f"{users:>7} пользователей: ленивая загрузка {lazy * 1000:7.1f} мс, "
+                  f"всё сразу {eager * 1000:7.1f} мс")
+
+
+if __name__ == "__main__":
+    main_cli()
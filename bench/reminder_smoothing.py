@@ -0,0 +1,110 @@
+"""Пиковая нагрузка круглого слота напоминаний со сглаживанием и без.
+
+Все пользователи стоят на 09:00 по умолчанию, то есть время не выбирали сами. Без
+сглаживания слот рассылается целиком в свою минуту; со сглаживанием дайджесты
+собираются заранее, а отправка размазывается по окну. Окно сжато (по умолчанию 10 с вместо 10 мин), лимит диспетчера снят, чтобы
+видеть сам спрос: сколько запросов к БД и отправок приходится на одну секунду.
+
+    python -m bench.reminder_smoothing [--users 10000] [--window 10] [--lead 2]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import main as bot
+import storage
+from dispatcher import ReminderDispatcher
+
+
+class CountingBot:
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.sent_at: list[float] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+        self.sent_at.append(time.time())
+
+
+def _seed(path: Path, users: int) -> None:
+    storage.init_db(path)
+    con = storage.connect(path)
+    tomorrow = storage.from_day(storage.today_day() + 1).strftime(storage.DATE_FMT)
+    with con:
+        con.executemany(
+            "INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, 9, 0)",
+            ((uid,) for uid in range(1, users + 1)),
+        )
+        con.executemany(
+            "INSERT INTO deadlines (id, user_id, name, date, due) VALUES (?, ?, ?, ?, ?)",
+            ((f"{uid:08x}", uid, f"задача {uid}", tomorrow, storage.today_day() + 1)
+             for uid in range(1, users + 1)),
+        )
+    con.close()
+
+
+def _per_second(stamps: list[float], origin: float) -> Counter[int]:
+    return Counter(int(t - origin) for t in stamps)
+
+
+async def _run(path: Path, smooth: bool, window: float, lead: float) -> dict:
+    st = storage.open_storage(path)
+    reads: list[float] = []
+
+    def counting(plain_read):
+        async def counting_read(fn, *args):
+            reads.append(time.time())
+            return await plain_read(fn, *args)
+        return counting_read
+
+    for shard in st.shards:
+        shard.read = counting(shard.read)
+    sender = CountingBot()
+    dispatcher = ReminderDispatcher(sender, concurrency=512, rate=1e6, per_chat_interval=0)
+
+    origin = time.time()
+    if smooth:
+        digests = await bot.build_slot_digests(9, 0, storage.today_day(), window)
+        slot = origin + lead
+        await asyncio.sleep(max(0.0, slot - time.time()))
+        await bot.send_smoothed_reminders(dispatcher, digests, slot)
+    else:
+        await asyncio.sleep(lead)
+        slot = time.time()
+        await bot.send_slot_reminders(dispatcher, 9, 0)
+    await storage.close_storage()
+
+    read_rate = _per_second(reads, origin)
+    send_rate = _per_second(sender.sent_at, origin)
+    return {
+        "peak_reads": max(read_rate.values()),
+        "peak_sends": max(send_rate.values()),
+        "reads_in_slot": sum(n for s, n in read_rate.items() if s >= int(slot - origin)),
+        "sent": len(sender.sent_at),
+        "span": max(sender.sent_at) - slot,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--window", type=float, default=10.0)
+    parser.add_argument("--lead", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "smoothing.db"
+        _seed(path, args.users)
+        print(f"{args.users} пользователей в слоте 09:00, окно {args.window:g} с")
+        for label, smooth in (("без сглаживания", False), ("со сглаживанием", True)):
+            r = asyncio.run(_run(path, smooth, args.window, args.lead))
+            print(f"  {label}: пик {r['peak_reads']} запросов к БД/с "
+                  f"(в сам слот {r['reads_in_slot']}), пик {r['peak_sends']} отправок/с, "
+                  f"отправлено {r['sent']} за {r['span']:.1f} с от начала слота")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Время запуска и память планировщика напоминаний: run_daily на пользователя против одного тика.
+
+    python -m bench.scheduler_startup [--users 10000 100000 1000000]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import time as dt_time
+from pathlib import Path
+
+from telegram.ext import Application
+
+import main as bot
+import storage
+
+
+def _seed(path: Path, users: int) -> None:
+    con = storage.connect(path)
+    with con:
+        con.executemany(
+            "INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, ?, ?)",
+            ((uid, 9 if uid % 3 else uid % 24, uid % 60) for uid in range(users)),
+        )
+    con.close()
+
+
+async def _noop(context) -> None:
+    pass
+
+
+async def _per_user(application, lookup: bool = True) -> None:
+    # schedule_all_reminders до перехода на тик: отдельный run_daily на каждую строку settings;
+    # поиск по имени перебирает все задачи, поэтому запуск квадратичен по числу пользователей
+    jq = application.job_queue
+    for user_id, hour, minute in await storage.db_all_remind_settings():
+        if lookup:
+            for job in jq.get_jobs_by_name(f"remind_{user_id}"):
+                job.schedule_removal()
+        jq.run_daily(_noop, time=dt_time(hour=hour, minute=minute), name=f"remind_{user_id}", data=user_id)
+
+
+async def _tick(application) -> None:
+    bot.schedule_reminders(application)
+
+
+def _child(mode: str, path: Path) -> None:
+    application = Application.builder().token("123:bench").build()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    async def run() -> float:
+        storage.open_storage(path)
+        t0 = time.perf_counter()
+        if mode == "tick":
+            await _tick(application)
+        else:
+            await _per_user(application, lookup=mode == "per-user")
+        elapsed = time.perf_counter() - t0
+        await storage.close_storage()
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"startup_s": elapsed, "rss_mb": (rss_after - rss_before) / 1024}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookup-max", type=int, default=10_000,
+                        help="до скольких пользователей мерить вариант с get_jobs_by_name")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child[0], Path(args.child[1]))
+        return
+
+    print(f"{'users':>9} {'mode':>10} {'startup, s':>11} {'+RSS, MB':>9}")
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "bench.db"
+            storage.init_db(path)
+            _seed(path, users)
+            modes = ["per-user", "no-lookup", "tick"] if users <= args.lookup_max else ["no-lookup", "tick"]
+            for mode in modes:
+                out = subprocess.run(
+                    [sys.executable, "-m", "bench.scheduler_startup", "--child", mode, str(path)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                res = json.loads(out.strip().splitlines()[-1])
+                print(f"{users:>9} {mode:>10} {res['startup_s']:>11.3f} {res['rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Набор бенчмарков на синтетической базе с результатами в JSON.
+
+Меряет чтение списка (db_get с холодным и тёплым кэшем), перенос повторяющихся
+дедлайнов, отрисовку строк списка, первую страницу списка со сборкой и из кэша
+представлений, сборку календаря и полную рассылку самого
+людного слота (09:00) в поддельный бот. JSON пишется в stdout или в --out,
+сводная таблица — в stderr; с --compare к ней добавляется изменение медианы
+относительно прошлого прогона.
+
+    python -m bench.suite [--users 10000] [--per-user 20] [--repeats 5] [--out run.json]
+    python -m bench.suite --compare baseline.json --out run.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import main as bot
+import markup
+import storage
+from bench.fake_bot import FakeBot
+from bench.synthetic import add_profile_args, populate, profile_from_args
+from dispatcher import ReminderDispatcher
+
+SAMPLE_USERS = 1000
+
+
+def _result(name: str, samples: list[float], ops: int, **extra) -> dict:
+    median = statistics.median(samples)
+    return {
+        "name": name,
+        "ops": ops,
+        "repeats": len(samples),
+        "min_s": min(samples),
+        "median_s": median,
+        "mean_s": statistics.fmean(samples),
+        "max_s": max(samples),
+        "per_op_us": median / ops * 1e6 if ops else None,
+        "ops_per_s": ops / median if median else None,
+        **extra,
+    }
+
+
+async def _db_get(path: Path, users: list[int], repeats: int) -> list[dict]:
+    storage.open_storage(path)
+    cold, warm = [], []
+    for _ in range(repeats):
+        storage._cache.clear()
+        t0 = time.perf_counter()
+        for uid in users:
+            await storage.db_get(uid)
+        cold.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for uid in users:
+            await storage.db_get(uid)
+        warm.append(time.perf_counter() - t0)
+    await storage.close_storage()
+    return [
+        _result("db_get.cold", cold, len(users)),
+        _result("db_get.warm", warm, len(users)),
+    ]
+
+
+async def _advance_recurring(path: Path, tmp: Path, repeats: int, today: int) -> dict:
+    # перенос меняет базу, поэтому каждый повтор идёт на свежей копии
+    samples, moved = [], 0
+    for i in range(repeats):
+        copy = tmp / f"advance-{i}.db"
+        shutil.copy(path, copy)
+        storage.open_storage(copy)
+        t0 = time.perf_counter()
+        moved = await storage.db_advance_recurring(today)
+        samples.append(time.perf_counter() - t0)
+        await storage.close_storage()
+        copy.unlink()
+    return _result("db_advance_recurring", samples, moved, moved=moved)
+
+
+async def _load_lists(path: Path, users: list[int]) -> list[list[storage.Deadline]]:
+    storage.open_storage(path)
+    lists = [await storage.db_get(uid) for uid in users]
+    await storage.close_storage()
+    return lists
+
+
+def _render_list(lists: list[list[storage.Deadline]], repeats: int, today: int) -> dict:
+    lines = sum(len(dls) for dls in lists)
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        ctx = bot.RenderContext(today)
+        for dls in lists:
+            for i, dl in enumerate(dls):
+                bot._deadline_line(i + 1, dl, ctx)
+        samples.append(time.perf_counter() - t0)
+    return _result("render.deadline_line", samples, lines)
+
+
+async def _list_view(path: Path, users: list[int], repeats: int) -> list[dict]:
+    # первая страница «Мои дедлайны»: чтение страницы и сборка разметки против попадания в кэш
+    storage.open_storage(path)
+    build, cached = [], []
+    for _ in range(repeats):
+        bot._views.clear()
+        ctx = bot.RenderContext()
+        t0 = time.perf_counter()
+        for uid in users:
+            view = await bot._list_view(uid, "list", ctx)
+            bot._views.put(uid, storage.data_version(uid), ctx.today, "list", view)
+        build.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for uid in users:
+            bot._views.get(uid, storage.data_version(uid), ctx.today, "list")
+        cached.append(time.perf_counter() - t0)
+    await storage.close_storage()
+    return [
+        _result("list_view.build", build, len(users)),
+        _result("list_view.cached", cached, len(users)),
+    ]
+
+
+def _calendar(repeats: int) -> list[dict]:
+    months = [(2026 + i // 12, 1 + i % 12) for i in range(24)]
+    results = []
+    for name, fn in (("calendar.build", markup.build_calendar), ("calendar.cached", markup.calendar_markup)):
+        for year, month in months:
+            fn(year, month, "cancel_add")
+        samples = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            for year, month in months:
+                fn(year, month, "cancel_add")
+            samples.append(time.perf_counter() - t0)
+        results.append(_result(name, samples, len(months)))
+    return results
+
+
+async def _reminder_slot(path: Path, repeats: int, latency: float) -> dict:
+    # лимиты Telegram сняты и в боте, и в диспетчере: меряется собственная работа
+    # бота — выборка слота, сборка текстов и проход через диспетчер
+    storage.open_storage(path)
+    samples, sent = [], 0
+    for _ in range(repeats):
+        fake = FakeBot(global_rate=10 ** 9, per_chat_interval=0, latency=latency)
+        dispatcher = ReminderDispatcher(fake, concurrency=bot.SLOT_PENDING_LIMIT, rate=1e9, per_chat_interval=0)
+        # слот бывает раз в день: тексты с прошлого повтора не должны достаться из кэша
+        bot._views.clear()
+        t0 = time.perf_counter()
+        sent = await bot.send_slot_reminders(dispatcher, 9, 0)
+        samples.append(time.perf_counter() - t0)
+    await storage.close_storage()
+    return _result("reminder_slot.09:00", samples, sent, sent=sent)
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: list[dict], baseline_path: Path) -> dict[str, float]:
+    baseline = {r["name"]: r for r in json.loads(baseline_path.read_text())["results"]}
+    deltas = {}
+    for r in results:
+        old = baseline.get(r["name"])
+        if old and old["median_s"] and old["ops"] == r["ops"]:
+            deltas[r["name"]] = r["median_s"] / old["median_s"] - 1
+    return deltas
+
+
+def _print_table(results: list[dict], deltas: dict[str, float]) -> None:
+    out = sys.stderr
+    print(f"{'':>22} {'ops':>8} {'median':>10} {'us/op':>10} {'ops/s':>12}", file=out)
+    for r in results:
+        per_op = f"{r['per_op_us']:10.2f}" if r["per_op_us"] is not None else f"{'-':>10}"
+        rate = f"{r['ops_per_s']:12.0f}" if r["ops_per_s"] is not None else f"{'-':>12}"
+        line = f"{r['name']:>22} {r['ops']:>8} {r['median_s'] * 1000:8.1f}ms {per_op} {rate}"
+        if r["name"] in deltas:
+            line += f"  {deltas[r['name']]:+.1%}"
+        print(line, file=out)
+
+
+async def _run(args, path: Path, tmp: Path, today: int) -> list[dict]:
+    rng = random.Random(args.seed)
+    sample = rng.sample(range(1, args.users + 1), min(SAMPLE_USERS, args.users))
+    results = await _db_get(path, sample, args.repeats)
+    results.append(await _advance_recurring(path, tmp, args.repeats, today))
+    results.append(_render_list(await _load_lists(path, sample), args.repeats, today))
+    results.extend(await _list_view(path, sample, args.repeats))
+    results.extend(_calendar(args.repeats))
+    results.append(await _reminder_slot(path, args.repeats, args.latency))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_profile_args(parser)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка поддельного send_message, с")
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--compare", type=Path, help="JSON прошлого прогона")
+    args = parser.parse_args()
+    profile = profile_from_args(args)
+    today = storage.today_day()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "suite.db"
+        t0 = time.perf_counter()
+        populate(path, profile, today)
+        generate_s = time.perf_counter() - t0
+        results = asyncio.run(_run(args, path, Path(tmp), today))
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": storage.sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "profile": asdict(profile),
+        "repeats": args.repeats,
+        "generate_s": generate_s,
+        "results": results,
+    }
+    _print_table(results, _compare(results, args.compare) if args.compare else {})
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
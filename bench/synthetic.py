@@ -0,0 +1,111 @@
+"""Генератор синтетической базы: пользователи, их настройки и дедлайны.
+
+Распределение приближено к живому боту: большая часть пользователей ставит
+напоминание на круглое время (чаще всего 09:00), даты разбросаны вокруг сегодня
+с хвостом просроченных, доля повторяющихся задаётся параметром.
+
+    python -m bench.synthetic out.db [--users 10000] [--per-user 20] [--recurring 0.3]
+"""
+import argparse
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+import storage
+
+INSERT_BATCH = 50_000
+
+DUE_PAST_DAYS = 90
+DUE_FUTURE_DAYS = 180
+ROUND_MINUTES = (0, 15, 30, 45)
+
+
+@dataclass(frozen=True)
+class Profile:
+    users: int = 10_000
+    per_user: int = 20
+    # доля повторяющихся дедлайнов; среди них еженедельных и ежемесячных поровну
+    recurring: float = 0.3
+    # доля пользователей с напоминанием ровно в 09:00 и на прочих круглых минутах
+    peak_share: float = 0.4
+    round_share: float = 0.4
+    seed: int = 42
+
+
+def remind_time(rng: random.Random, profile: Profile) -> tuple[int, int]:
+    r = rng.random()
+    if r < profile.peak_share:
+        return 9, 0
+    if r < profile.peak_share + profile.round_share:
+        return rng.randrange(6, 23), rng.choice(ROUND_MINUTES)
+    return rng.randrange(24), rng.randrange(60)
+
+
+def _deadline(rng: random.Random, profile: Profile, today: int, uid: int, n: int) -> tuple:
+    due = today + rng.randrange(-DUE_PAST_DAYS, DUE_FUTURE_DAYS)
+    repeat = None
+    if rng.random() < profile.recurring:
+        repeat = rng.choice(("weekly", "monthly"))
+    name = f"задача {n} " + "x" * rng.randrange(40)
+    date_str = storage.from_day(due).strftime(storage.DATE_FMT)
+    return f"{uid * profile.per_user + n:08x}", uid, name, date_str, repeat, due
+
+
+def populate(path: Path | str, profile: Profile = Profile(), today: int | None = None) -> None:
+    """Создаёт схему и заполняет deadlines и settings; пользователи нумеруются с 1."""
+    today = storage.today_day() if today is None else today
+    rng = random.Random(profile.seed)
+    storage.init_db(path)
+    con = storage.connect(path)
+    settings, deadlines = [], []
+
+    def flush() -> None:
+        with con:
+            con.executemany(
+                "INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, ?, ?)", settings,
+            )
+            con.executemany(
+                "INSERT INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)",
+                deadlines,
+            )
+        settings.clear()
+        deadlines.clear()
+
+    for uid in range(1, profile.users + 1):
+        settings.append((uid, *remind_time(rng, profile)))
+        for n in range(profile.per_user):
+            deadlines.append(_deadline(rng, profile, today, uid, n))
+        if len(deadlines) >= INSERT_BATCH:
+            flush()
+    flush()
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+
+def add_profile_args(parser: argparse.ArgumentParser) -> None:
+    defaults = Profile()
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--per-user", type=int, default=defaults.per_user)
+    parser.add_argument("--recurring", type=float, default=defaults.recurring)
+    parser.add_argument("--peak-share", type=float, default=defaults.peak_share)
+    parser.add_argument("--round-share", type=float, default=defaults.round_share)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def profile_from_args(args: argparse.Namespace) -> Profile:
+    return Profile(
+        users=args.users, per_user=args.per_user, recurring=args.recurring,
+        peak_share=args.peak_share, round_share=args.round_share, seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=Path)
+    add_profile_args(parser)
+    args = parser.parse_args()
+    populate(args.path, profile_from_args(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Задержка обработки апдейтов: long polling против webhook на локальном fake Bot API.
+
+Генератор подаёт апдейты с постоянной скоростью; задержка — от создания апдейта
+до завершения обработчика (включая ответ боту через sendMessage).
+
+    python -m bench.webhook_load [--updates 2000] [--rate 500] [--connections 8]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from bench.fake_api import TOKEN, FakeBotApi
+from webhook import WEBHOOK_QUEUE_SIZE, WebhookServer
+
+SECRET = "bench-secret"
+
+
+def _app(api: FakeBotApi, latencies: list[float], webhook: bool) -> Application:
+    builder = Application.builder().token(TOKEN).base_url(api.base_url)
+    if webhook:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    application = builder.build()
+
+    async def handler(update: Update, context) -> None:
+        sent_at = float(update.message.text)
+        await update.message.reply_text("ok")
+        latencies.append(time.perf_counter() - sent_at)
+
+    application.add_handler(MessageHandler(filters.TEXT, handler))
+    return application
+
+
+async def _feed(args, emit) -> None:
+    interval = 1 / args.rate
+    start = time.perf_counter()
+    for i in range(args.updates):
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await emit(i)
+
+
+async def _wait_done(latencies: list[float], total: int) -> None:
+    while len(latencies) < total:
+        await asyncio.sleep(0.01)
+
+
+async def _polling(args) -> list[float]:
+    api = FakeBotApi()
+    await api.start()
+    latencies: list[float] = []
+    application = _app(api, latencies, webhook=False)
+    async with application:
+        await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=[Update.MESSAGE])
+        await application.start()
+
+        async def emit(i: int) -> None:
+            api.push(api.message_update(1 + i % 1000, repr(time.perf_counter())))
+
+        await _feed(args, emit)
+        await _wait_done(latencies, args.updates)
+        await application.updater.stop()
+        await application.stop()
+    await api.stop()
+    return latencies
+
+
+async def _webhook(args) -> list[float]:
+    api = FakeBotApi()
+    await api.start()
+    latencies: list[float] = []
+    application = _app(api, latencies, webhook=True)
+    async with application:
+        server = WebhookServer(application, "127.0.0.1", 0, "/telegram", SECRET)
+        await server.start()
+        await application.start()
+        conns = [await asyncio.open_connection("127.0.0.1", server.port) for _ in range(args.connections)]
+        locks = [asyncio.Lock() for _ in conns]
+
+        async def emit(i: int) -> None:
+            body = json.dumps(api.message_update(1 + i % 1000, repr(time.perf_counter()))).encode()
+            reader, writer = conns[i % len(conns)]
+            async with locks[i % len(conns)]:
+                writer.write(
+                    b"POST /telegram HTTP/1.1\r\nHost: bot\r\nContent-Type: application/json\r\n"
+                    + f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                await reader.readuntil(b"\r\n\r\n")
+
+        await _feed(args, emit)
+        await _wait_done(latencies, args.updates)
+        for _, writer in conns:
+            writer.close()
+        await server.stop()
+        await application.stop()
+    await api.stop()
+    return latencies
+
+
+def _report(label: str, latencies: list[float]) -> None:
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:>8}: p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  ({len(latencies)} updates)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500)
+    parser.add_argument("--connections", type=int, default=8)
+    args = parser.parse_args()
+
+    _report("polling", asyncio.run(_polling(args)))
+    _report("webhook", asyncio.run(_webhook(args)))
+
+
+if __name__ == "__main__":
+    main()
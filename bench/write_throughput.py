@@ -0,0 +1,103 @@
+"""Пропускная способность записи при 1, 10 и 100 одновременных писателях.
+
+Сравнивает коммит на каждую операцию (batch_size=1) с group commit
+для разных уровней durability, а затем — хранилище из 1 и нескольких шардов
+(--shards) через обычные db_add/db_update_name, в обоих режимах коммита и с
+базой в памяти как потолком самого event loop.
+
+    python -m bench.write_throughput [--ops 3000] [--shards 1,2,8]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import storage
+
+SHARD_MODES = (
+    ("group", {}),
+    ("per-op", {"batch_size": 1, "batch_delay": 0}),
+)
+
+CONFIGS = (
+    ("per-op commit", {"batch_size": 1, "batch_delay": 0, "durability": "full"}),
+    ("group, full", {"durability": "full"}),
+    ("group, normal", {"durability": "normal"}),
+    ("group, off", {"durability": "off"}),
+)
+
+
+async def _run(path: Path, writers: int, ops: int, options: dict) -> float:
+    st = storage.Storage(path, **options)
+    per_writer = max(1, ops // writers)
+    due = storage.parse_day("01.01.2030")
+
+    async def writer(uid: int) -> None:
+        for i in range(per_writer):
+            dl_id = uuid4().hex[:8]
+            await st.write(storage.q_add, uid, dl_id, f"dl {i}", due, None)
+            await st.write(storage.q_update_name, dl_id, uid, f"renamed {i}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(uid) for uid in range(writers)))
+    elapsed = time.perf_counter() - t0
+    await st.close()
+    return per_writer * writers * 2 / elapsed
+
+
+async def _run_sharded(path: Path | str, shards: int, writers: int, ops: int, options: dict) -> float:
+    storage.open_storage(path, shards, **options)
+    per_writer = max(1, ops // writers)
+    due = storage.parse_day("01.01.2030")
+
+    async def writer(uid: int) -> None:
+        for i in range(per_writer):
+            dl_id = uuid4().hex[:8]
+            await storage.db_add(uid, dl_id, f"dl {i}", due)
+            await storage.db_update_name(dl_id, uid, f"renamed {i}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(uid) for uid in range(writers)))
+    elapsed = time.perf_counter() - t0
+    await storage.close_storage()
+    return per_writer * writers * 2 / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=3000)
+    parser.add_argument("--shards", default="1,2,8", help="числа шардов через запятую")
+    parser.add_argument("--durability", choices=tuple(storage.DURABILITY_LEVELS), default="full",
+                        help="для сравнения шардов")
+    args = parser.parse_args()
+    writer_counts = (1, 10, 100)
+
+    print(f"{'':>15} " + " ".join(f"{w:>10}w" for w in writer_counts))
+    for label, options in CONFIGS:
+        row = []
+        for writers in writer_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "bench.db"
+                storage.init_db(path)
+                row.append(asyncio.run(_run(path, writers, args.ops, options)))
+        print(f"{label:>15} " + " ".join(f"{r:>9.0f}/s" for r in row))
+
+    print(f"\ndb_* через open_storage, durability={args.durability}")
+    for mode, options in SHARD_MODES:
+        options = {**options, "durability": args.durability}
+        for shards in [int(n) for n in args.shards.split(",")]:
+            row = []
+            for writers in writer_counts:
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = Path(tmp) / "bench.db"
+                    storage.init_db(path, shards)
+                    row.append(asyncio.run(_run_sharded(path, shards, writers, args.ops, options)))
+            print(f"{f'{mode}, {shards} шард.':>15} " + " ".join(f"{r:>9.0f}/s" for r in row))
+    row = [asyncio.run(_run_sharded(storage.MEMORY_PATH, 1, w, args.ops, {})) for w in writer_counts]
+    print(f"{'в памяти':>15} " + " ".join(f"{r:>9.0f}/s" for r in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""Многопроцессный режим: роутер принимает webhook и раскладывает апдейты по воркерам.
+
+Каждый воркер — обычный бот из main.py со своим файлом БД (шардом). Пользователь
+всегда попадает в один и тот же шард, поэтому его дедлайны, настройки, состояние
+диалогов и напоминания живут в одном процессе.
+
+    python cluster.py serve [--shards 4]
+    python cluster.py rebalance --from 4 --to 6        (кластер должен быть остановлен)
+    python cluster.py rebalance --from-file deadlines.db --to 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import secrets
+import signal
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from telegram import Bot
+from telegram.ext import Application
+
+import main
+from dispatcher import GLOBAL_RATE
+from storage import connect, init_db, shard_for
+from webhook import SECRET_HEADER, WEBHOOK_QUEUE_SIZE, HttpRequest, WebhookServer, run_webhook
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = 4
+SHARD_DIR = Path(__file__).resolve().parent
+SHARD_DB_NAME = "deadlines-{shard}.db"
+
+WORKER_HOST = "127.0.0.1"
+WORKER_BASE_PORT = 8090
+WORKER_START_TIMEOUT = 30.0
+WORKER_STOP_TIMEOUT = 10.0
+SUPERVISE_INTERVAL = 1.0
+
+REBALANCE_BATCH = 1000
+
+# всё, что принадлежит пользователю и переезжает вместе с ним
+USER_TABLES = (
+    ("deadlines", "id, user_id, name, date, repeat, due"),
+    ("settings", "user_id, remind_hour, remind_min, remind_exact"),
+    ("user_data", "user_id, data, updated"),
+    ("conversations", "name, key, user_id, state, updated"),
+    ("archived_deadlines", "id, user_id, name, date, repeat, due, archived"),
+)
+# у архива нет уникального ключа, и REPLACE ничего бы не заменил: строку копируем,
+# только если в цели ещё нет такой же по этим столбцам, иначе повтор после сбоя
+# между копией и удалением задвоил бы архив
+APPEND_ONLY_TABLES = {"archived_deadlines": ("user_id", "id", "due", "archived")}
+
+
+def shard_path(shard: int, directory: Path | str = SHARD_DIR) -> Path:
+    return Path(directory) / SHARD_DB_NAME.format(shard=shard)
+
+
+def update_user_id(data: dict) -> int | None:
+    # у message, callback_query и прочих апдейтов от пользователя автор лежит в "from"
+    for value in data.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"].get("id")
+    return None
+
+
+# --- воркер ---
+
+def run_worker(
+    shard: int, shards: int, port: int, secret_token: str,
+    token: str = main.TOKEN, base_url: str | None = None, directory: Path | str = SHARD_DIR,
+) -> None:
+    path = shard_path(shard, directory)
+    init_db(path)
+
+    builder = (
+        Application.builder()
+        .token(token)
+        .updater(None)
+        .update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    metrics_port = main.METRICS_PORT + shard if main.METRICS_PORT else 0
+    # лента пользователя живёт в его шарде: кэш версий у каждого воркера свой
+    feed_port = main.FEED_PORT + shard if main.FEED_PORT else 0
+    # шард кластера — один файл: внутрипроцессное шардирование (main.DB_SHARDS) здесь не нужно
+    application = main.build_application(
+        builder, db_path=path, db_shards=1, metrics_port=metrics_port, feed_port=feed_port,
+    )
+    # лимит Telegram общий на токен, воркеры делят его поровну
+    application.bot_data["send_rate"] = GLOBAL_RATE / shards
+
+    logger.info("Шард %d/%d: %s, порт %d", shard, shards, path, port)
+    run_webhook(
+        application, url=None, host=WORKER_HOST, port=port,
+        path=main.WEBHOOK_PATH, secret_token=secret_token,
+    )
+
+
+class WorkerPool:
+    """Процессы-воркеры: запуск, перезапуск упавших и остановка."""
+
+    def __init__(
+        self, shards: int, secret_token: str, token: str = main.TOKEN,
+        base_url: str | None = None, directory: Path | str = SHARD_DIR,
+        base_port: int = WORKER_BASE_PORT,
+    ):
+        self.shards = shards
+        self.ports = [base_port + i for i in range(shards)]
+        self._args = (secret_token, token, base_url, directory)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: list[multiprocessing.Process | None] = [None] * shards
+
+    def _spawn(self, shard: int) -> None:
+        secret_token, token, base_url, directory = self._args
+        proc = self._ctx.Process(
+            target=run_worker, name=f"shard-{shard}",
+            args=(shard, self.shards, self.ports[shard], secret_token, token, base_url, directory),
+        )
+        proc.start()
+        self._procs[shard] = proc
+
+    def start(self) -> None:
+        for shard in range(self.shards):
+            self._spawn(shard)
+
+    def restart_dead(self) -> None:
+        for shard, proc in enumerate(self._procs):
+            if proc is not None and not proc.is_alive():
+                logger.error("Воркер шарда %d завершился с кодом %s, перезапускаю", shard, proc.exitcode)
+                self._spawn(shard)
+
+    def stop(self) -> None:
+        # SIGTERM: run_webhook в воркере штатно останавливает приложение и закрывает БД
+        for proc in self._procs:
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for proc in self._procs:
+            if proc is not None:
+                proc.join(max(0.0, deadline - time.monotonic()))
+                if proc.is_alive():
+                    proc.kill()
+                    proc.join()
+        self._procs = [None] * self.shards
+
+
+# --- роутер ---
+
+async def _read_status(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+class WorkerLink:
+    """Keep-alive соединения роутера с одним воркером."""
+
+    def __init__(self, host: str, port: int, path: str, secret_token: str):
+        self.host = host
+        self.port = port
+        self._head = (
+            f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"{SECRET_HEADER}: {secret_token}\r\n"
+        ).encode("latin-1")
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def wait_ready(self, timeout: float = WORKER_START_TIMEOUT) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._idle.append(await asyncio.open_connection(self.host, self.port))
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    async def post(self, body: bytes) -> int:
+        # соединение из пула могло умереть вместе с перезапущенным воркером —
+        # тогда один раз пробуем на свежем
+        for reuse in (True, False):
+            if reuse and self._idle:
+                reader, writer = self._idle.pop()
+            else:
+                reuse = False
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write(self._head + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+                status = await _read_status(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reuse:
+                    raise
+                continue
+            self._idle.append((reader, writer))
+            return status
+
+    def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class ShardRouter(WebhookServer):
+    """Принимает webhook от Telegram и пересылает тело апдейта воркеру его шарда."""
+
+    def __init__(self, host: str, port: int, path: str, secret_token: str, links: list[WorkerLink]):
+        super().__init__(None, host, port, path, secret_token)
+        self.links = links
+        self.routed: Counter[int] = Counter()
+
+    async def _deliver(self, request: HttpRequest) -> int:
+        try:
+            user_id = update_user_id(json.loads(request.body))
+        except (ValueError, AttributeError):
+            return 400
+        shard = shard_for(user_id, len(self.links)) if user_id is not None else 0
+        try:
+            status = await self.links[shard].post(request.body)
+        except (OSError, asyncio.IncompleteReadError):
+            logger.warning("Шард %d недоступен, апдейт вернётся от Telegram повторно", shard)
+            status = 503
+        if status == 200:
+            self.accepted += 1
+            self.routed[shard] += 1
+        else:
+            self.rejected += 1
+        return status
+
+    async def stop(self) -> None:
+        await super().stop()
+        for link in self.links:
+            link.close()
+
+
+def serve(shards: int = SHARD_COUNT) -> None:
+    if not main.WEBHOOK_URL:
+        raise SystemExit("Кластер принимает апдейты только через webhook: задай WEBHOOK_URL в main.py")
+
+    worker_secret = secrets.token_urlsafe(32)
+    secret_token = main.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    for shard in range(shards):
+        init_db(shard_path(shard))
+    pool = WorkerPool(shards, worker_secret)
+    links = [WorkerLink(WORKER_HOST, port, main.WEBHOOK_PATH, worker_secret) for port in pool.ports]
+    router = ShardRouter(main.WEBHOOK_LISTEN, main.WEBHOOK_PORT, main.WEBHOOK_PATH, secret_token, links)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def run() -> None:
+        await asyncio.gather(*(link.wait_ready() for link in links))
+        await router.start()
+        async with Bot(main.TOKEN) as bot:
+            await bot.set_webhook(
+                url=main.WEBHOOK_URL.rstrip("/") + main.WEBHOOK_PATH, secret_token=secret_token,
+                allowed_updates=main.ALLOWED_UPDATES, drop_pending_updates=False,
+            )
+        logger.info("Кластер из %d шардов запущен", shards)
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), SUPERVISE_INTERVAL)
+            except asyncio.TimeoutError:
+                pool.restart_dead()
+
+    pool.start()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.run_until_complete(router.stop())
+        loop.close()
+        pool.stop()
+
+
+# --- перебалансировка ---
+
+def _move_users(con, target: Path, user_ids: list[int]) -> None:
+    con.execute("ATTACH DATABASE ? AS dst", (str(target),))
+    try:
+        for i in range(0, len(user_ids), REBALANCE_BATCH):
+            # сначала копия, потом удаление: между разными файлами транзакция в WAL
+            # не атомарна, но копия идемпотентна, и повторный запуск после сбоя
+            # только удалит уже скопированное из источника
+            with con:
+                con.execute("DELETE FROM temp.moving")
+                con.executemany(
+                    "INSERT INTO temp.moving (user_id) VALUES (?)",
+                    [(uid,) for uid in user_ids[i:i + REBALANCE_BATCH]],
+                )
+                for table, columns in USER_TABLES:
+                    moving = f"FROM main.{table} s WHERE s.user_id IN (SELECT user_id FROM temp.moving)"
+                    if table in APPEND_ONLY_TABLES:
+                        same = " AND ".join(f"d.{c} IS s.{c}" for c in APPEND_ONLY_TABLES[table])
+                        con.execute(
+                            f"INSERT INTO dst.{table} ({columns}) SELECT {columns} {moving} "
+                            f"AND NOT EXISTS (SELECT 1 FROM dst.{table} d WHERE {same})"
+                        )
+                    else:
+                        con.execute(f"INSERT OR REPLACE INTO dst.{table} ({columns}) SELECT {columns} {moving}")
+                    con.execute(
+                        f"DELETE FROM main.{table} WHERE user_id IN (SELECT user_id FROM temp.moving)"
+                    )
+    finally:
+        con.execute("DETACH DATABASE dst")
+
+
+def _remove_db(path: Path) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+def rebalance(
+    sources: list[Path], shards: int, directory: Path | str = SHARD_DIR, remove_drained: bool = True,
+) -> Counter[int]:
+    """Переносит пользователей из файлов sources в shards шардов; возвращает, сколько
+    пользователей приехало в каждый шард. Запускать при остановленном кластере."""
+    targets = [shard_path(i, directory).resolve() for i in range(shards)]
+    for target in targets:
+        init_db(target)
+    moved: Counter[int] = Counter()
+    for source in sources:
+        source = Path(source).resolve()
+        init_db(source)
+        con = connect(source)
+        try:
+            con.execute("CREATE TEMP TABLE moving (user_id INTEGER PRIMARY KEY)")
+            by_target: dict[int, list[int]] = defaultdict(list)
+            users = " UNION ".join(f"SELECT user_id FROM {table} WHERE user_id IS NOT NULL" for table, _ in USER_TABLES)
+            for (user_id,) in con.execute(users):
+                shard = shard_for(user_id, shards)
+                if targets[shard] != source:
+                    by_target[shard].append(user_id)
+            for shard, user_ids in sorted(by_target.items()):
+                logger.info("%s: %d пользователей -> шард %d", source.name, len(user_ids), shard)
+                _move_users(con, targets[shard], user_ids)
+                moved[shard] += len(user_ids)
+        finally:
+            con.close()
+        if remove_drained and source not in targets:
+            _remove_db(source)
+    return moved
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Шардированный запуск бота")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_p = sub.add_parser("serve", help="запустить роутер и воркеры")
+    serve_p.add_argument("--shards", type=int, default=SHARD_COUNT)
+    reb_p = sub.add_parser("rebalance", help="перераспределить пользователей по новому числу шардов")
+    source = reb_p.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from", dest="old", type=int, help="текущее число шардов")
+    source.add_argument("--from-file", type=Path, help="одиночная БД (например, deadlines.db)")
+    reb_p.add_argument("--to", dest="new", type=int, required=True)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.shards)
+        return
+    if args.from_file:
+        # опустевшую одиночную БД не трогаем, её удаление — на совести администратора
+        moved = rebalance([args.from_file], args.new, remove_drained=False)
+    else:
+        moved = rebalance([shard_path(i) for i in range(args.old)], args.new)
+    print(f"Перенесено пользователей: {sum(moved.values())}")
+    for shard in range(args.new):
+        print(f"  шард {shard}: +{moved[shard]}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram режет рассылки дольше ~30 сообщений в секунду на бота и ~1 в секунду на чат
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+DISPATCH_CONCURRENCY = 16
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        # уводим ведро в минус: никто не получит токен, пока оно не наполнится обратно.
+        # Пауза абсолютная: одновременные 429 от запросов в полёте не складываются
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class ReminderDispatcher:
+    """Рассылка исходящих напоминаний с ограничением скорости и повторами."""
+
+    def __init__(
+        self,
+        bot,
+        concurrency: int = DISPATCH_CONCURRENCY,
+        rate: float = GLOBAL_RATE,
+        per_chat_interval: float = PER_CHAT_INTERVAL,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._bucket = TokenBucket(rate)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chat_next: dict[int, float] = {}
+
+    def stats(self) -> dict[str, int]:
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed}
+
+    async def _wait_chat(self, chat_id: int) -> None:
+        now = time.monotonic()
+        if len(self._chat_next) > 10_000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        start = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = start + self.per_chat_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_chat(chat_id)
+                await self._bucket.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    # flood control действует на весь бот, поэтому тормозим всех
+                    self._bucket.pause(delay)
+                    self._chat_next[chat_id] = time.monotonic() + delay
+                except (BadRequest, Forbidden) as e:
+                    logger.warning("Не удалось отправить сообщение в чат %s: %s", chat_id, e)
+                    self.failed += 1
+                    return False
+                except NetworkError:
+                    await asyncio.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                except Exception:
+                    logger.exception("Ошибка при отправке сообщения в чат %s", chat_id)
+                    self.failed += 1
+                    return False
+                else:
+                    self.sent += 1
+                    return True
+                if attempt < self.max_retries:
+                    self.retried += 1
+        logger.warning("Не удалось отправить сообщение в чат %s после %d попыток",
+                       chat_id, self.max_retries + 1)
+        self.failed += 1
+        return False
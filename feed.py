@@ -0,0 +1,277 @@
+"""Подписка на дедлайны из календаря: .ics по секретной ссылке пользователя.
+
+Ссылка — /feed/<user_id>/<токен>.ics, токен — HMAC от user_id на FEED_SECRET,
+так что хранить его не нужно. Календарные клиенты опрашивают ленту каждые
+несколько минут, поэтому готовая лента лежит в кэше под версией данных
+пользователя (storage.data_version): пока дедлайны не менялись, запрос — это
+сверка версии и ETag без обращения к БД, а с If-None-Match — просто 304.
+
+Лента хранится кусками по FEED_CHUNK_EVENTS событий и пишется в сокет по
+кускам с drain(), не склеиваясь в одну строку.
+
+Повторы: weekly — RRULE:FREQ=WEEKLY; monthly с днём до 28 — FREQ=MONTHLY.
+Ежемесячный дедлайн на 29–31 число бот переносит по _next_month («прилипая»
+к самому короткому месяцу на пути), а RRULE такие месяцы пропускал бы, поэтому
+даты до первого дня ≤ 28 идут отдельным событием через RDATE, а дальше — вторым
+событием с FREQ=MONTHLY.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+from collections import OrderedDict
+from datetime import date
+from typing import Iterator
+
+from storage import Deadline, _next_month, data_version, db_get, from_day
+from webhook import MAX_HEADER_BYTES, read_request, write_head, write_response
+
+logger = logging.getLogger(__name__)
+
+FEED_PATH = "/feed"
+FEED_TOKEN_LENGTH = 32
+FEED_CHUNK_EVENTS = 256
+FEED_CACHE_BUDGET_BYTES = 32 * 1024 * 1024
+FEED_MAX_AGE = 300
+FEED_UID_DOMAIN = "deadline-tracker-bot"
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+PRODID = "-//Deadline Tracker Bot//RU"
+ICS_LINE_OCTETS = 75
+
+
+def feed_token(secret: str, user_id: int) -> str:
+    return hmac.new(secret.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()[:FEED_TOKEN_LENGTH]
+
+
+def feed_path(secret: str, user_id: int) -> str:
+    return f"{FEED_PATH}/{user_id}/{feed_token(secret, user_id)}.ics"
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: строки не длиннее 75 октетов, продолжение — с пробела; режем по символам,
+    # чтобы не разорвать многобайтовую букву
+    if len(line.encode()) <= ICS_LINE_OCTETS:
+        return line
+    parts, current, size = [], [], 0
+    for ch in line:
+        n = len(ch.encode())
+        if size + n > ICS_LINE_OCTETS:
+            parts.append("".join(current))
+            current, size = [" "], 1
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return "\r\n".join(parts)
+
+
+def _ics_date(d: date) -> str:
+    return d.strftime("%Y%m%d")
+
+
+def _monthly_series(d: date) -> tuple[list[date], date]:
+    """Даты до первой с днём ≤ 28 и саму эту дату: с неё _next_month совпадает с FREQ=MONTHLY."""
+    head = []
+    while d.day > 28:
+        head.append(d)
+        d = _next_month(d)
+    return head, d
+
+
+def _event(uid: str, name: str, start: date, rrule: str | None = None, rdates: list[date] = ()) -> str:
+    # DTSTAMP обязателен; берём его от даты, а не от времени сборки, чтобы одинаковые
+    # данные давали одинаковую ленту и тот же ETag и после рестарта
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@{FEED_UID_DOMAIN}",
+        f"DTSTAMP:{_ics_date(start)}T000000Z",
+        f"DTSTART;VALUE=DATE:{_ics_date(start)}",
+        _fold(f"SUMMARY:{_escape(name)}"),
+    ]
+    if rdates:
+        lines.append(_fold("RDATE;VALUE=DATE:" + ",".join(_ics_date(d) for d in rdates)))
+    if rrule:
+        lines.append(f"RRULE:{rrule}")
+    lines.append("END:VEVENT")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _events(dl: Deadline) -> str:
+    start = from_day(dl.due)
+    if dl.repeat == "weekly":
+        return _event(dl.id, dl.name, start, "FREQ=WEEKLY")
+    if dl.repeat != "monthly":
+        return _event(dl.id, dl.name, start)
+    head, stable = _monthly_series(start)
+    if not head:
+        return _event(dl.id, dl.name, start, "FREQ=MONTHLY")
+    return (_event(dl.id, dl.name, head[0], rdates=head[1:])
+            + _event(f"{dl.id}-m", dl.name, stable, "FREQ=MONTHLY"))
+
+
+def render_feed(rows: list[Deadline]) -> Iterator[bytes]:
+    yield (
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+        f"PRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\n"
+        "X-WR-CALNAME:Дедлайны\r\n"
+    ).encode()
+    chunk = []
+    for dl in rows:
+        # дедлайны с неразобранной старой датой в ленту не попадают
+        if dl.due is None:
+            continue
+        chunk.append(_events(dl))
+        if len(chunk) >= FEED_CHUNK_EVENTS:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+    yield b"END:VCALENDAR\r\n"
+
+
+class Feed:
+    __slots__ = ("version", "etag", "chunks", "size")
+
+    def __init__(self, version: int, chunks: list[bytes]):
+        digest = hashlib.blake2b(digest_size=12)
+        for chunk in chunks:
+            digest.update(chunk)
+        self.version = version
+        self.etag = f'"{digest.hexdigest()}"'
+        self.chunks = chunks
+        self.size = sum(len(c) for c in chunks)
+
+
+class FeedCache:
+    """LRU готовых лент с ограничением по суммарному размеру."""
+
+    def __init__(self, budget: int = FEED_CACHE_BUDGET_BYTES):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: OrderedDict[int, Feed] = OrderedDict()
+
+    def get(self, user_id: int, version: int) -> Feed | None:
+        feed = self._entries.get(user_id)
+        if feed is None or feed.version != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return feed
+
+    def put(self, user_id: int, feed: Feed) -> None:
+        old = self._entries.get(user_id)
+        if old is not None and old.version > feed.version:
+            return
+        if old is not None:
+            self.size -= self._entries.pop(user_id).size
+        if feed.size > self.budget:
+            return
+        self._entries[user_id] = feed
+        self.size += feed.size
+        while self.size > self.budget:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users": len(self._entries), "bytes": self.size, "hits": self.hits,
+            "misses": self.misses, "not_modified": self.not_modified,
+        }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in header.split(","))
+
+
+class FeedServer:
+    """Отдаёт ленты по GET/HEAD FEED_PATH/<user_id>/<токен>.ics."""
+
+    def __init__(self, host: str, port: int, secret: str):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.cache = FeedCache()
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_HEADER_BYTES,
+        )
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Ленты календаря: http://%s:%s%s/", self.host, self.port, FEED_PATH)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # календарные клиенты держат keep-alive: закрываем их соединения сами
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _user_for(self, path: str) -> int | None:
+        parts = path.split("?", 1)[0].removeprefix(FEED_PATH + "/").split("/")
+        if len(parts) != 2 or not parts[1].endswith(".ics"):
+            return None
+        try:
+            user_id = int(parts[0])
+        except ValueError:
+            return None
+        if not hmac.compare_digest(parts[1].removesuffix(".ics"), feed_token(self.secret, user_id)):
+            return None
+        return user_id
+
+    async def feed(self, user_id: int) -> Feed:
+        # версию снимаем до чтения: изменение после неё даст новую версию
+        version = data_version(user_id)
+        feed = self.cache.get(user_id, version)
+        if feed is None:
+            feed = Feed(version, list(render_feed(await db_get(user_id))))
+            self.cache.put(user_id, feed)
+        return feed
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                keep_alive = request.keep_alive
+                user_id = self._user_for(request.path) if request.path.startswith(FEED_PATH + "/") else None
+                if user_id is None:
+                    write_response(writer, 404, keep_alive=keep_alive)
+                elif request.method not in ("GET", "HEAD"):
+                    write_response(writer, 405, keep_alive=keep_alive)
+                else:
+                    feed = await self.feed(user_id)
+                    headers = {"ETag": feed.etag, "Cache-Control": f"private, max-age={FEED_MAX_AGE}"}
+                    if _etag_matches(request.headers.get("if-none-match", ""), feed.etag):
+                        self.cache.not_modified += 1
+                        write_response(writer, 304, headers=headers, keep_alive=keep_alive)
+                    else:
+                        headers["Content-Type"] = CONTENT_TYPE
+                        write_head(writer, 200, feed.size, headers, keep_alive)
+                        if request.method == "GET":
+                            for chunk in feed.chunks:
+                                writer.write(chunk)
+                                await writer.drain()
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, OverflowError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(task)
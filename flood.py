@@ -0,0 +1,231 @@
+"""Защита от флуда входящими апдейтами и склейка листания календаря.
+
+FloodGuard стоит обработчиком в группе -1, то есть раньше всех остальных, и
+решает, пропускать ли апдейт дальше. Отброшенный апдейт останавливается
+ApplicationHandlerStop и не доходит до обработчиков, поэтому никаких вызовов
+API по нему не будет. На отброшенный callback-запрос бот не отвечает: часики
+на кнопке клиент уберёт сам. Отбрасываются два вида апдейтов:
+
+- сверх личного маркерного бакета пользователя: FLOOD_RATE апдейтов в секунду
+  с запасом FLOOD_BURST;
+- повторное нажатие той же кнопки в той же версии сообщения (edit_date) в
+  пределах DUPLICATE_WINDOW. Первое нажатие уже обработано или обрабатывается,
+  а второе пришло со старой клавиатуры.
+
+Листание календаря (◀/▶) под эти правила не попадает, его склеивает CalendarNav.
+Первое нажатие правит клавиатуру сразу. Нажатия, пришедшие, пока правка в
+полёте или после неё не прошло NAV_EDIT_INTERVAL, только запоминают месяц, и
+следующей правкой уходит последний из них. Если клавиатура уже показывает этот
+месяц, правки нет вовсе.
+
+В stats() api_calls_saved — вызовы API, которых не было. Считается по одному
+на каждый отброшенный апдейт, который взял бы какой-нибудь обработчик, и по
+одному на каждую несостоявшуюся правку календаря.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from telegram import InlineKeyboardMarkup, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# человек не нажимает чаще пары раз в секунду подолгу; запаса хватает на быстрое
+# пролистывание списка и на весь диалог добавления подряд
+FLOOD_RATE = 2.0
+FLOOD_BURST = 10
+DUPLICATE_WINDOW = 1.0
+NAV_EDIT_INTERVAL = 0.5
+NAV_PREFIXES = ("cal_p_", "cal_n_")
+# кнопки, обработчики которых сообщение не правят: ожидающее листание им не мешает
+QUIET_CALLBACKS = ("cal_ignore",)
+# сколько пользователей и нажатий помнить, прежде чем выбросить устаревшие записи
+GUARD_TRACKED = 10_000
+
+
+@dataclass(eq=False)
+class _Nav:
+    message: object
+    shown: InlineKeyboardMarkup | None
+    target: InlineKeyboardMarkup | None = None
+    editing: bool = False
+    settling: bool = False
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+
+class CalendarNav:
+    """Правки клавиатуры календаря по сообщениям: не больше одной в полёте и одной в ожидании."""
+
+    def __init__(self, interval: float = NAV_EDIT_INTERVAL):
+        self.interval = interval
+        self.edits = 0
+        self.coalesced = 0
+        self._navs: dict[tuple[int, int], _Nav] = {}
+
+    def stats(self) -> dict[str, int]:
+        return {"nav_edits": self.edits, "nav_coalesced": self.coalesced, "nav_pending": len(self._navs)}
+
+    def show(self, message, markup: InlineKeyboardMarkup, create_task=asyncio.create_task) -> None:
+        """Показать в сообщении календарь markup; правка уходит в фоне через create_task."""
+        key = (message.chat_id, message.message_id)
+        nav = self._navs.get(key)
+        if nav is not None:
+            if nav.target is not None:
+                # ожидавший месяц так и не будет показан
+                self.coalesced += 1
+            nav.target = markup
+            return
+        nav = self._navs[key] = _Nav(message, message.reply_markup, markup)
+        nav.task = create_task(self._flush(key, nav))
+
+    async def settle(self, chat_id: int, message_id: int) -> None:
+        """Отменить ожидающую правку и дождаться той, что в полёте: дальше сообщение правит другой обработчик."""
+        key = (chat_id, message_id)
+        nav = self._navs.get(key)
+        if nav is None:
+            return
+        if nav.target is not None:
+            self.coalesced += 1
+            nav.target = None
+        nav.settling = True
+        if not nav.editing:
+            # задача могла ещё не начаться: отменённая до первого шага, она не дойдёт
+            # до finally в _flush, так что запись убираем сами
+            if self._navs.get(key) is nav:
+                del self._navs[key]
+            nav.task.cancel()
+        await asyncio.wait([nav.task])
+
+    async def _flush(self, key: tuple[int, int], nav: _Nav) -> None:
+        try:
+            while nav.target is not None:
+                markup, nav.target = nav.target, None
+                if markup == nav.shown:
+                    self.coalesced += 1
+                    continue
+                nav.editing = True
+                try:
+                    await nav.message.edit_reply_markup(reply_markup=markup)
+                    self.edits += 1
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    # пробуем снова, если за это время не нажали дальше
+                    if nav.target is None:
+                        nav.target = markup
+                    if nav.settling:
+                        break
+                    await asyncio.sleep(delay)
+                    continue
+                except BadRequest as e:
+                    # «message is not modified»: клавиатура уже такая, остальное — сообщения больше нет
+                    if "not modified" not in e.message:
+                        logger.warning("Не удалось перелистнуть календарь в чате %s: %s", key[0], e)
+                        break
+                except TelegramError as e:
+                    logger.warning("Не удалось перелистнуть календарь в чате %s: %s", key[0], e)
+                    break
+                finally:
+                    nav.editing = False
+                nav.shown = markup
+                if nav.settling:
+                    break
+                await asyncio.sleep(self.interval)
+        finally:
+            if self._navs.get(key) is nav:
+                del self._navs[key]
+
+
+class FloodGuard:
+    """Фильтр входящих апдейтов: личный маркерный бакет и отсев повторных нажатий."""
+
+    def __init__(self, rate: float = FLOOD_RATE, burst: float = FLOOD_BURST,
+                 window: float = DUPLICATE_WINDOW, nav: CalendarNav | None = None):
+        # rate = 0 — без ограничения частоты, повторы отсеиваются всё равно
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.nav = nav
+        self.passed = 0
+        self.flood = 0
+        self.duplicate = 0
+        self.saved = 0
+        self._buckets: dict[int, tuple[float, float]] = {}
+        self._presses: dict[tuple, float] = {}
+        self._prune_at = GUARD_TRACKED
+
+    def stats(self) -> dict[str, int]:
+        stats = {
+            "passed": self.passed, "flood": self.flood, "duplicate": self.duplicate,
+            "users": len(self._buckets),
+        }
+        saved = self.saved
+        if self.nav is not None:
+            stats.update(self.nav.stats())
+            saved += self.nav.coalesced
+        stats["api_calls_saved"] = saved
+        return stats
+
+    def _prune(self, now: float) -> None:
+        idle = self.burst / self.rate if self.rate else 0.0
+        self._buckets = {u: b for u, b in self._buckets.items() if now - b[1] < idle}
+        self._presses = {k: t for k, t in self._presses.items() if now - t < self.window}
+        self._prune_at = max(GUARD_TRACKED, 2 * max(len(self._buckets), len(self._presses)))
+
+    def _allow(self, user_id: int, now: float) -> bool:
+        if not self.rate:
+            return True
+        tokens, updated = self._buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self._buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def _repeated(self, query, now: float) -> bool:
+        message = query.message
+        if message is None:
+            return False
+        key = (message.chat.id, message.message_id, getattr(message, "edit_date", None), query.data)
+        last = self._presses.get(key)
+        self._presses[key] = now
+        return last is not None and now - last < self.window
+
+    def _dropped(self, update: Update, application) -> None:
+        # каждый обработчик бота делает хотя бы один вызов (query.answer() или ответ
+        # сообщением); правки сверх этого зависят от обработчика и не считаются
+        if any(
+            handler.check_update(update)
+            for group, handlers in application.handlers.items() if group >= 0
+            for handler in handlers
+        ):
+            self.saved += 1
+
+    async def filter_update(self, update: Update, context) -> None:
+        user = update.effective_user
+        if user is None:
+            return
+        now = time.monotonic()
+        if len(self._buckets) > self._prune_at or len(self._presses) > self._prune_at:
+            self._prune(now)
+        query = update.callback_query
+        if query is not None and query.data and query.data.startswith(NAV_PREFIXES):
+            # листание склеивает CalendarNav, и последнее нажатие терять нельзя
+            self.passed += 1
+            return
+        if not self._allow(user.id, now):
+            self.flood += 1
+            self._dropped(update, context.application)
+            raise ApplicationHandlerStop
+        if query is not None and query.data and self._repeated(query, now):
+            self.duplicate += 1
+            self._dropped(update, context.application)
+            raise ApplicationHandlerStop
+        self.passed += 1
+        if (query is not None and query.message is not None and self.nav is not None
+                and query.data not in QUIET_CALLBACKS):
+            await self.nav.settle(query.message.chat.id, query.message.message_id)
@@ -0,0 +1,203 @@
+"""Импорт дедлайнов из присланного файла: CSV или iCalendar (.ics).
+
+Файл читается построчно с диска, так что в памяти держится только текущая
+пачка строк. Разбор идёт в отдельном потоке, пачки по IMPORT_BATCH строк
+уходят в БД обычными записями Storage — каждая одной операцией внутри group
+commit, поэтому другие чаты продолжают писать между пачками.
+
+CSV: столбцы «название, дата ДД.ММ.ГГГГ, повтор» (повтор можно не указывать),
+разделитель — запятая, точка с запятой или табуляция; строку заголовка можно
+оставить, столбцы тогда ищутся по её названиям.
+
+iCalendar: VEVENT с DTSTART и VTODO с DUE; RRULE с FREQ=WEEKLY или MONTHLY без
+INTERVAL становится повтором (COUNT и UNTIL не учитываются — серия становится
+бессрочной), изменённые экземпляры серий (RECURRENCE-ID) пропускаются.
+"""
+import asyncio
+import csv
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from storage import IMPORT_BATCH, db_import, parse_day, to_day
+
+logger = logging.getLogger(__name__)
+
+IMPORT_MAX_BYTES = 20 * 1024 * 1024  # больше Bot API всё равно не даст скачать
+IMPORT_NAME_LIMIT = 256
+CSV_SNIFF_BYTES = 4096
+CSV_DELIMITERS = ",;\t"
+
+REPEAT_ALIASES = {
+    "": None, "-": None, "нет": None, "none": None, "no": None,
+    "weekly": "weekly", "еженед.": "weekly", "еженедельно": "weekly", "неделя": "weekly",
+    "monthly": "monthly", "ежемес.": "monthly", "ежемесячно": "monthly", "месяц": "monthly",
+}
+CSV_COLUMNS = {
+    "name": ("name", "title", "summary", "название", "дедлайн", "задача"),
+    "date": ("date", "due", "дата", "срок"),
+    "repeat": ("repeat", "повтор", "повторение"),
+}
+ICS_FREQ = {"WEEKLY": "weekly", "MONTHLY": "monthly"}
+
+Record = tuple[str, int, str | None]
+
+
+@dataclass
+class ImportStats:
+    imported: int = 0
+    skipped: int = 0
+    duplicates: int = 0
+
+
+def kind_of(file_name: str | None) -> str | None:
+    return {".csv": "csv", ".ics": "ics"}.get(Path(file_name or "").suffix.lower())
+
+
+def _record(name: str, due: int | None, repeat: str | None, stats: ImportStats) -> Record | None:
+    name = " ".join(name.split())
+    if due is None or not name or len(name) > IMPORT_NAME_LIMIT:
+        stats.skipped += 1
+        return None
+    return name, due, repeat
+
+
+def _csv_layout(header: list[str]) -> tuple[int, int, int | None] | None:
+    cells = [c.strip().lower() for c in header]
+    found = {}
+    for column, aliases in CSV_COLUMNS.items():
+        for i, cell in enumerate(cells):
+            if cell in aliases:
+                found[column] = i
+                break
+    if "name" not in found or "date" not in found:
+        return None
+    return found["name"], found["date"], found.get("repeat")
+
+
+def parse_csv(path: Path, stats: ImportStats) -> Iterator[Record]:
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        sample = f.read(CSV_SNIFF_BYTES)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            dialect = csv.excel
+        name_i, date_i, repeat_i = 0, 1, 2
+        first = True
+        for row in csv.reader(f, dialect):
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if first:
+                first = False
+                layout = _csv_layout(row)
+                if layout is not None:
+                    name_i, date_i, repeat_i = layout
+                    continue
+            if len(row) <= max(name_i, date_i):
+                stats.skipped += 1
+                continue
+            raw_repeat = row[repeat_i].strip().lower() if repeat_i is not None and len(row) > repeat_i else ""
+            if raw_repeat not in REPEAT_ALIASES:
+                stats.skipped += 1
+                continue
+            record = _record(row[name_i], parse_day(row[date_i].strip()), REPEAT_ALIASES[raw_repeat], stats)
+            if record is not None:
+                yield record
+
+
+def _unfolded(f) -> Iterator[str]:
+    # RFC 5545: длинные строки переносятся, продолжение начинается с пробела или табуляции
+    current = None
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _ics_text(value: str) -> str:
+    return (value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_day(value: str) -> int | None:
+    # и DATE (20260120), и DATE-TIME (20260120T090000Z) — берём календарную дату
+    try:
+        return to_day(datetime.strptime(value[:8], "%Y%m%d").date())
+    except ValueError:
+        return None
+
+
+def _ics_repeat(rule: str) -> tuple[bool, str | None]:
+    parts = dict(p.split("=", 1) for p in rule.upper().split(";") if "=" in p)
+    repeat = ICS_FREQ.get(parts.get("FREQ", ""))
+    # «по понедельникам и средам» одним повтором не выразить
+    if repeat is None or parts.get("INTERVAL", "1") != "1" or "," in parts.get("BYDAY", ""):
+        return False, None
+    return True, repeat
+
+
+def parse_ics(path: Path, stats: ImportStats) -> Iterator[Record]:
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        component = None
+        props: dict[str, str] = {}
+        for line in _unfolded(f):
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+            name = key.split(";", 1)[0].upper()
+            if name == "BEGIN" and value.upper() in ("VEVENT", "VTODO"):
+                component, props = value.upper(), {}
+            elif name == "END" and component is not None and value.upper() == component:
+                date_value = props.get("DTSTART" if component == "VEVENT" else "DUE") or props.get("DTSTART")
+                component = None
+                if "RECURRENCE-ID" in props:
+                    stats.skipped += 1
+                    continue
+                ok, repeat = _ics_repeat(props["RRULE"]) if "RRULE" in props else (True, None)
+                if not ok or date_value is None:
+                    stats.skipped += 1
+                    continue
+                record = _record(_ics_text(props.get("SUMMARY", "")), _ics_day(date_value), repeat, stats)
+                if record is not None:
+                    yield record
+            elif component is not None and name not in props:
+                props[name] = value
+
+
+PARSERS = {"csv": parse_csv, "ics": parse_ics}
+
+
+def _next_batch(records: Iterator[Record]) -> list[Record]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= IMPORT_BATCH:
+            break
+    return batch
+
+
+async def import_file(user_id: int, path: Path, kind: str) -> ImportStats:
+    """Разбирает файл пачками в потоке и пишет каждую пачку отдельной операцией db_import."""
+    stats = ImportStats()
+    records = PARSERS[kind](path, stats)
+    try:
+        while True:
+            batch = await asyncio.to_thread(_next_batch, records)
+            if not batch:
+                break
+            inserted = await db_import(user_id, batch)
+            stats.imported += inserted
+            stats.duplicates += len(batch) - inserted
+    finally:
+        records.close()
+    logger.info("Импорт %s для %s: %s", kind, user_id, stats)
+    return stats
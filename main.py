@@ -1,6 +1,9 @@
-import calendar as cal_mod
+import asyncio
 import logging
-import sqlite3
+import secrets
+import tempfile
+import time
+import zlib
 from datetime import datetime, time as dt_time, timedelta
 from pathlib import Path
 from uuid import uuid4
@@ -9,8 +12,6 @@ from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    ReplyKeyboardMarkup,
-    KeyboardButton,
 )
 from telegram.ext import (
     Application,
@@ -19,9 +20,70 @@ from telegram.ext import (
     ConversationHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
 
+from dispatcher import GLOBAL_RATE, ReminderDispatcher
+from feed import FeedServer, feed_path
+from flood import FLOOD_RATE, CalendarNav, FloodGuard
+from importer import IMPORT_MAX_BYTES, import_file, kind_of
+from markup import (
+    BTN_ADD,
+    BTN_HELP,
+    BTN_LIST,
+    BTN_SETTINGS,
+    AFTER_ADD_KB,
+    BACK_TO_MENU_KB,
+    CANCEL_ADD_KB,
+    CANCEL_EDIT_KB,
+    CANCEL_SETTIME_KB,
+    EMPTY_LIST_KB,
+    LIST_OR_MENU_KB,
+    MAIN_MENU_KB,
+    PERSISTENT_KB,
+    REMINDER_KB,
+    REPEAT_KB,
+    calendar_markup,
+    warm_calendars,
+)
+from metrics import (
+    InstrumentedRequest,
+    MetricsServer,
+    enable as enable_metrics,
+    instrument_handlers,
+    register_gauges,
+    watch_jobs,
+)
+from persistence import SqlitePersistence
+from sqltrace import SLOW_QUERY_MS, enable as enable_sql_trace, tracer as sql_tracer
+from storage import (
+    init_db,
+    open_storage,
+    close_storage,
+    db_add,
+    db_get_deadline,
+    db_get_page,
+    db_delete,
+    db_update_date,
+    db_update_name,
+    db_advance_recurring,
+    db_archive_expired,
+    db_get_archive_page,
+    db_get_remind_time,
+    db_set_remind_time,
+    db_iter_slot_deadlines,
+    cache_stats,
+    data_clock,
+    data_version,
+    Deadline,
+    from_day,
+    parse_day,
+    today_day,
+)
+from views import RenderCache, View, shows
+from webhook import WEBHOOK_QUEUE_SIZE, run_webhook
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     level=logging.INFO,
@@ -30,163 +92,56 @@ logger = logging.getLogger(__name__)
 
 TOKEN = "YOUR_BOT_TOKEN"
 
-DB_PATH = Path(__file__).resolve().parent / "deadlines.db"
-
-
-def _conn() -> sqlite3.Connection:
-    return sqlite3.connect(DB_PATH)
-
-
-def init_db() -> None:
-    with _conn() as con:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS deadlines (
-                id      TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                name    TEXT NOT NULL,
-                date    TEXT NOT NULL
-            )
-            """
-        )
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS settings (
-                user_id     INTEGER PRIMARY KEY,
-                remind_hour INTEGER NOT NULL DEFAULT 9,
-                remind_min  INTEGER NOT NULL DEFAULT 0
-            )
-            """
-        )
-        cols = [r[1] for r in con.execute("PRAGMA table_info(deadlines)").fetchall()]
-        if "repeat" not in cols:
-            con.execute("ALTER TABLE deadlines ADD COLUMN repeat TEXT")
-
-
-def db_add(user_id: int, dl_id: str, name: str, date: str, repeat: str | None = None) -> None:
-    with _conn() as con:
-        con.execute(
-            "INSERT INTO deadlines (id, user_id, name, date, repeat) VALUES (?, ?, ?, ?, ?)",
-            (dl_id, user_id, name, date, repeat),
-        )
-
-
-def db_get(user_id: int) -> list[dict]:
-    with _conn() as con:
-        rows = con.execute(
-            "SELECT id, name, date, repeat FROM deadlines WHERE user_id = ?",
-            (user_id,),
-        ).fetchall()
-    return [{"id": r[0], "name": r[1], "date": r[2], "repeat": r[3]} for r in rows]
-
-
-def db_delete(dl_id: str, user_id: int) -> str | None:
-    with _conn() as con:
-        row = con.execute(
-            "SELECT name FROM deadlines WHERE id = ? AND user_id = ?",
-            (dl_id, user_id),
-        ).fetchone()
-        if row is None:
-            return None
-        con.execute("DELETE FROM deadlines WHERE id = ? AND user_id = ?", (dl_id, user_id))
-        return row[0]
-
-
-def db_update_date(dl_id: str, user_id: int, new_date: str) -> str | None:
-    with _conn() as con:
-        row = con.execute(
-            "SELECT name FROM deadlines WHERE id = ? AND user_id = ?",
-            (dl_id, user_id),
-        ).fetchone()
-        if row is None:
-            return None
-        con.execute(
-            "UPDATE deadlines SET date = ? WHERE id = ? AND user_id = ?",
-            (new_date, dl_id, user_id),
-        )
-        return row[0]
-
-
-def db_update_name(dl_id: str, user_id: int, new_name: str) -> str | None:
-    with _conn() as con:
-        row = con.execute(
-            "SELECT name FROM deadlines WHERE id = ? AND user_id = ?",
-            (dl_id, user_id),
-        ).fetchone()
-        if row is None:
-            return None
-        con.execute(
-            "UPDATE deadlines SET name = ? WHERE id = ? AND user_id = ?",
-            (new_name, dl_id, user_id),
-        )
-        return row[0]
-
-
-def db_all_deadlines() -> list[tuple]:
-    with _conn() as con:
-        return con.execute("SELECT id, user_id, name, date, repeat FROM deadlines").fetchall()
-
-
-def _next_month(d):
-    month = d.month + 1
-    year = d.year
-    if month > 12:
-        month = 1
-        year += 1
-    day = min(d.day, cal_mod.monthrange(year, month)[1])
-    return d.replace(year=year, month=month, day=day)
-
-
-def db_advance_recurring(user_id: int) -> None:
-    today = datetime.now().date()
-    with _conn() as con:
-        rows = con.execute(
-            "SELECT id, date, repeat FROM deadlines WHERE user_id = ? AND repeat IS NOT NULL",
-            (user_id,),
-        ).fetchall()
-        for dl_id, date_str, repeat in rows:
-            try:
-                d = datetime.strptime(date_str, "%d.%m.%Y").date()
-            except ValueError:
-                continue
-            if d >= today:
-                continue
-            while d < today:
-                if repeat == "weekly":
-                    d += timedelta(days=7)
-                elif repeat == "monthly":
-                    d = _next_month(d)
-                else:
-                    break
-            con.execute(
-                "UPDATE deadlines SET date = ? WHERE id = ?",
-                (d.strftime("%d.%m.%Y"), dl_id),
-            )
-
-
-def db_get_remind_time(user_id: int) -> tuple[int, int]:
-    with _conn() as con:
-        row = con.execute(
-            "SELECT remind_hour, remind_min FROM settings WHERE user_id = ?", (user_id,),
-        ).fetchone()
-    return (row[0], row[1]) if row else (9, 0)
-
-
-def db_set_remind_time(user_id: int, hour: int, minute: int) -> None:
-    with _conn() as con:
-        con.execute(
-            """
-            INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET remind_hour = ?, remind_min = ?
-            """,
-            (user_id, hour, minute, hour, minute),
-        )
-
-
-def db_all_remind_settings() -> list[tuple[int, int, int]]:
-    with _conn() as con:
-        return con.execute("SELECT user_id, remind_hour, remind_min FROM settings").fetchall()
-
+# больше 1 — пользователи раскладываются по DB_SHARDS файлам deadlines-N.db (раскладка
+# та же, что у cluster.py), у каждого свой писатель; менять на живой базе — через
+# cluster.py rebalance. В одном процессе group commit в один файл быстрее
+# (bench.write_throughput): шарды дробят пачки, а упор — в сам event loop;
+# шарды окупаются, когда коммиты не группируются и файлы лежат на разных дисках
+DB_SHARDS = 1
+
+# пустой WEBHOOK_URL — long polling; иначе бот поднимает свой HTTP-сервер и
+# регистрирует этот адрес в Telegram (TLS обычно снимает балансировщик перед ботом)
+WEBHOOK_URL = ""
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = ""
+
+# 0 — метрики выключены; иначе на METRICS_LISTEN:METRICS_PORT/metrics отдаются
+# гистограммы в формате Prometheus (у воркера кластера порт METRICS_PORT + шард)
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 0
+# столько же соединений PTB держит по умолчанию для обычных запросов
+METRICS_POOL_SIZE = 256
+
+# трассировка SQL: запросы дольше SQL_SLOW_MS пишутся в лог с параметрами, а сводка
+# по суммарному времени — раз в SQL_REPORT_INTERVAL секунд и при остановке
+SQL_TRACE = False
+SQL_SLOW_MS = SLOW_QUERY_MS
+SQL_REPORT_INTERVAL = 3600
+
+# подписка на дедлайны из календаря: 0 — выключена; иначе на FEED_LISTEN:FEED_PORT
+# отдаются .ics по ссылкам с HMAC на FEED_SECRET (секрет постоянный: сменить его —
+# значит отозвать все выданные ссылки). Пользователю ссылка показывается от FEED_URL —
+# внешнего адреса ленты, обязательного при FEED_PORT; {port} в нём заменяется на порт,
+# у воркера кластера порт FEED_PORT + шард
+FEED_URL = ""
+FEED_LISTEN = "0.0.0.0"
+FEED_PORT = 0
+FEED_SECRET = ""
+
+# разовые дедлайны, просроченные больше чем на ARCHIVE_AFTER_DAYS дней, раз в сутки
+# уходят в архив (/archive) и больше не читаются списком и напоминаниями;
+# первый проход — через ARCHIVE_STARTUP_DELAY секунд после запуска
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_STARTUP_DELAY = 60
+
+# входящие апдейты одного пользователя — не чаще FLOOD_RATE в секунду (0 — без
+# ограничения); повторы той же кнопки отсеиваются всегда, а листание календаря
+# склеивается в одну правку на последний месяц (flood.py)
+FLOOD_UPDATE_RATE = FLOOD_RATE
+
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
 
 ADD_NAME, ADD_DATE, ADD_REPEAT = range(3)
 EDIT_DATE = 10
@@ -199,165 +154,183 @@ MONTHS_RU = {
     9: "сентября", 10: "октября", 11: "ноября", 12: "декабря",
 }
 
-MONTHS_RU_NOM = {
-    1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
-    5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
-    9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь",
-}
-
 REPEAT_LABELS = {"weekly": "еженед.", "monthly": "ежемес."}
 
-BTN_ADD = "Добавить дедлайн"
-BTN_LIST = "Мои дедлайны"
-BTN_SETTINGS = "Время напоминания"
-BTN_HELP = "Помощь"
-
-DAYS_HEADER = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
-
-def calculate_days(date_str: str):
-    try:
-        deadline = datetime.strptime(date_str, "%d.%m.%Y").date()
-        today = datetime.now().date()
-        return (deadline - today).days, deadline
-    except ValueError:
-        return None, None
-
+REMINDER_CATCHUP_MINUTES = 15
+
+# В круглые слоты (:00, :15, :30, :45) приходит почти вся толпа. Тем, кто остался
+# на времени по умолчанию, дайджесты собираем заранее, а отправку размазываем по
+# окну с постоянной для пользователя задержкой. Кто выбрал время сам
+# (settings.remind_exact), получает напоминание ровно в него, даже круглое.
+REMINDER_SMOOTH_STEP = 15
+REMINDER_SMOOTH_WINDOW = 10 * 60
+REMINDER_PRECOMPUTE_LEAD = 2
+
+# Telegram: не больше 4096 символов в сообщении и ~100 кнопок в клавиатуре;
+# на строку списка уходит 3 кнопки, ещё 4 — на навигацию и меню
+TEXT_LIMIT = 4096
+LIST_PAGE_SIZE = 10
+LIST_MAX_ROWS = 32
+LIST_HEADER = "Твои дедлайны:"
+ARCHIVE_HEADER = "Архив дедлайнов:"
+LIST_TEXT_RESERVE = 32
+SLOT_PENDING_LIMIT = 256
+
+# отрисованные списки и напоминания под (версия данных пользователя, день)
+_views = RenderCache()
+# ожидающие и идущие правки клавиатуры календаря по сообщениям
+_calendar_nav = CalendarNav()
+
+
+class RenderContext:
+    """Один снимок «сегодня» на запрос или на весь слот рассылки.
+
+    Подпись даты («5 января») считается один раз на день: в списке и тем более в
+    дайджестах слота у многих строк одни и те же даты.
+    """
+
+    __slots__ = ("today", "_labels")
+
+    def __init__(self, today: int | None = None):
+        self.today = today_day() if today is None else today
+        self._labels: dict[int, str] = {}
+
+    def day_label(self, due: int) -> str:
+        label = self._labels.get(due)
+        if label is None:
+            d = from_day(due)
+            label = self._labels[due] = f"{d.day} {MONTHS_RU[d.month]}"
+        return label
+
+    def date_label(self, dl: Deadline) -> str:
+        return dl.date if dl.due is None else self.day_label(dl.due)
+
+    def status(self, due: int | None) -> str:
+        if due is None:
+            return ""
+        days = due - self.today
+        if days < 0:
+            return f"просрочен на {-days} дн."
+        if days == 0:
+            return "СЕГОДНЯ!"
+        if days == 1:
+            return "ЗАВТРА!"
+        return f"через {days} дн."
 
-def format_date(date_str: str) -> str:
-    try:
-        d = datetime.strptime(date_str, "%d.%m.%Y")
-        return f"{d.day} {MONTHS_RU[d.month]}"
-    except Exception:
-        return date_str
 
+def _repeat_tag(repeat: str | None) -> str:
+    label = REPEAT_LABELS.get(repeat)
+    return f" [{label}]" if label else ""
 
-def _persistent_kb() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [
-            [KeyboardButton(BTN_ADD), KeyboardButton(BTN_LIST)],
-            [KeyboardButton(BTN_SETTINGS), KeyboardButton(BTN_HELP)],
-        ],
-        resize_keyboard=True,
-        is_persistent=True,
-    )
 
+def _deadline_line(idx: int, dl: Deadline, ctx: RenderContext) -> str:
+    return f"{idx}. {dl.name}{_repeat_tag(dl.repeat)} — {ctx.date_label(dl)} ({ctx.status(dl.due)})"
 
-def _main_menu_markup() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Добавить дедлайн", callback_data="menu_add")],
-        [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-    ])
-
-
-def _deadline_line(idx: int, dl: dict) -> str:
-    days, _ = calculate_days(dl["date"])
-    fd = format_date(dl["date"])
-    if days is None:
-        status = ""
-    elif days < 0:
-        status = f"просрочен на {abs(days)} дн."
-    elif days == 0:
-        status = "СЕГОДНЯ!"
-    elif days == 1:
-        status = "ЗАВТРА!"
-    else:
-        status = f"через {days} дн."
-    repeat_tag = ""
-    if dl.get("repeat") in REPEAT_LABELS:
-        repeat_tag = f" [{REPEAT_LABELS[dl['repeat']]}]"
-    return f"{idx}. {dl['name']}{repeat_tag} — {fd} ({status})"
-
-
-def _job_name(user_id: int) -> str:
-    return f"remind_{user_id}"
 
+def _parse_cal_nav(data: str) -> tuple[int, int]:
+    raw = data.split("_", 2)[2]
+    month_s, year_s = raw.split(".")
+    return int(month_s), int(year_s)
 
-def _build_calendar(year: int, month: int, cancel_cb: str = "cancel_add") -> InlineKeyboardMarkup:
-    rows: list[list[InlineKeyboardButton]] = []
 
-    prev_m, prev_y = month - 1, year
-    if prev_m < 1:
-        prev_m, prev_y = 12, year - 1
-    next_m, next_y = month + 1, year
-    if next_m > 12:
-        next_m, next_y = 1, year + 1
+async def _cal_ignore(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
 
-    rows.append([
-        InlineKeyboardButton("◀", callback_data=f"cal_p_{prev_m:02d}.{prev_y}"),
-        InlineKeyboardButton(f"{MONTHS_RU_NOM[month]} {year}", callback_data="cal_ignore"),
-        InlineKeyboardButton("▶", callback_data=f"cal_n_{next_m:02d}.{next_y}"),
-    ])
 
-    rows.append([
-        InlineKeyboardButton(d, callback_data="cal_ignore") for d in DAYS_HEADER
-    ])
+async def _reminder_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    state = context.job.data
+    now = datetime.now(context.job_queue.scheduler.timezone).replace(second=0, microsecond=0)
+    last = state["last"]
+    if now <= last:
+        return
+    missed = int((now - last).total_seconds() // 60)
+    if missed > REMINDER_CATCHUP_MINUTES:
+        logger.warning("Пропущено %d минут напоминаний, догоняем только последние %d",
+                       missed, REMINDER_CATCHUP_MINUTES)
+        last = now - timedelta(minutes=REMINDER_CATCHUP_MINUTES)
+    state["last"] = now
+    # повторы переносим в ту же полночь, в которую сменяется today_day(), и до того,
+    # как собран хоть один слот нового дня
+    day = today_day()
+    if day != state["day"]:
+        state["day"] = day
+        await _advance_recurring(day)
+    dispatcher = context.bot_data["dispatcher"]
+    digests = state["digests"]
+    while last < now:
+        last += timedelta(minutes=1)
+        # «сегодня» слота — по тем же местным часам, что и у списков (today_day),
+        # а не по дате в поясе планировщика
+        slot_day = today_day(last)
+        if not smoothed_slot(last.minute):
+            await send_slot_reminders(dispatcher, last.hour, last.minute, slot_day)
+            continue
+        slot_digests = digests.pop(last, None)
+        if slot_digests is None:
+            slot_digests = await build_slot_digests(last.hour, last.minute, slot_day)
+        context.application.create_task(
+            send_smoothed_reminders(dispatcher, slot_digests, last.timestamp()),
+            name=f"reminders_{last:%H%M}",
+        )
+        await send_slot_reminders(dispatcher, last.hour, last.minute, slot_day, exact=True)
+    for slot in [s for s in digests if s <= now]:
+        del digests[slot]
 
-    for week in cal_mod.monthcalendar(year, month):
-        row = []
-        for day in week:
-            if day == 0:
-                row.append(InlineKeyboardButton(" ", callback_data="cal_ignore"))
-            else:
-                date_str = f"{day:02d}.{month:02d}.{year}"
-                row.append(InlineKeyboardButton(str(day), callback_data=f"cal_d_{date_str}"))
-        rows.append(row)
+    ahead = now + timedelta(minutes=REMINDER_PRECOMPUTE_LEAD)
+    # слоты следующего дня заранее не собираем: повторы к ним ещё не перенесены
+    if smoothed_slot(ahead.minute) and ahead not in digests and today_day(ahead) == day:
+        digests[ahead] = await build_slot_digests(ahead.hour, ahead.minute, day)
 
-    rows.append([InlineKeyboardButton("Отмена", callback_data=cancel_cb)])
 
-    return InlineKeyboardMarkup(rows)
+def schedule_reminders(application) -> None:
+    jq = application.job_queue
+    now = datetime.now(jq.scheduler.timezone).replace(second=0, microsecond=0)
+    jq.run_repeating(
+        _reminder_tick,
+        interval=60,
+        first=now + timedelta(minutes=1),
+        name="reminder_tick",
+        data={"last": now, "digests": {}, "day": today_day()},
+    )
 
 
-def _parse_cal_nav(data: str) -> tuple[int, int]:
-    raw = data.split("_", 2)[2]
-    month_s, year_s = raw.split(".")
-    return int(month_s), int(year_s)
+async def _advance_recurring(today: int | None = None) -> None:
+    moved = await db_advance_recurring(today)
+    if moved:
+        logger.info("Перенесено повторяющихся дедлайнов: %d", moved)
 
 
-async def _cal_ignore(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
+async def _archive_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    archived = await db_archive_expired(ARCHIVE_AFTER_DAYS)
+    if archived:
+        logger.info("В архив перенесено дедлайнов: %d", archived)
 
 
-def schedule_user_reminder(application, user_id: int, hour: int, minute: int) -> None:
+def schedule_archive(application) -> None:
     jq = application.job_queue
-    for job in jq.get_jobs_by_name(_job_name(user_id)):
-        job.schedule_removal()
-    jq.run_daily(
-        _send_user_reminder,
-        time=dt_time(hour=hour, minute=minute, second=0),
-        name=_job_name(user_id),
-        data=user_id,
-    )
-
+    jq.run_once(_archive_job, when=ARCHIVE_STARTUP_DELAY, name="archive_startup")
+    jq.run_daily(_archive_job, time=dt_time(hour=0, minute=10), name="archive")
 
-def schedule_all_reminders(application) -> None:
-    for user_id, hour, minute in db_all_remind_settings():
-        schedule_user_reminder(application, user_id, hour, minute)
 
+async def _sql_report_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    logger.info("Сводка SQL по суммарному времени:\n%s", sql_tracer().report())
 
-async def _send_user_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
-    user_id = context.job.data
 
-    db_advance_recurring(user_id)
+def schedule_sql_report(application) -> None:
+    application.job_queue.run_repeating(
+        _sql_report_job, interval=SQL_REPORT_INTERVAL, first=SQL_REPORT_INTERVAL, name="sql_report",
+    )
 
-    user_dls = db_get(user_id)
-    if not user_dls:
-        return
 
+def _reminder_text(user_dls: list[Deadline], ctx: RenderContext) -> str | None:
     overdue, today_list, tomorrow_list, week_list = [], [], [], []
 
     for dl in user_dls:
-        days, _ = calculate_days(dl["date"])
-        if days is None:
-            continue
-        fd = format_date(dl["date"])
-        repeat_tag = ""
-        if dl.get("repeat") in REPEAT_LABELS:
-            repeat_tag = f" [{REPEAT_LABELS[dl['repeat']]}]"
-        line = f"- {dl['name']}{repeat_tag} ({fd})"
+        days = dl.due - ctx.today
+        line = f"- {dl.name}{_repeat_tag(dl.repeat)} ({ctx.day_label(dl.due)})"
 
         if days < 0:
-            overdue.append(f"{line} — просрочен на {abs(days)} дн.")
+            overdue.append(f"{line} — просрочен на {-days} дн.")
         elif days == 0:
             today_list.append(line)
         elif days == 1:
@@ -366,7 +339,7 @@ async def _send_user_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
             week_list.append(f"{line} — через {days} дн.")
 
     if not overdue and not today_list and not tomorrow_list and not week_list:
-        return
+        return None
 
     parts = []
     if overdue:
@@ -378,27 +351,95 @@ async def _send_user_reminder(context: ContextTypes.DEFAULT_TYPE) -> None:
     if week_list:
         parts.append("НА ЭТОЙ НЕДЕЛЕ:\n" + "\n".join(week_list))
 
-    text = "Напоминание о дедлайнах:\n\n" + "\n\n".join(parts)
-    keyboard = [[InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")]]
-    try:
-        await context.bot.send_message(
-            chat_id=user_id, text=text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-        )
-    except Exception:
-        logger.warning("Не удалось отправить напоминание пользователю %s", user_id)
+    return "Напоминание о дедлайнах:\n\n" + "\n\n".join(parts)
+
+
+def _cached_reminder_text(user_id: int, user_dls: list[Deadline], ctx: RenderContext, stamp: int) -> str | None:
+    version = data_version(user_id)
+    view = _views.get(user_id, version, ctx.today, "reminder")
+    if view is not None:
+        return view[0] or None
+    text = _reminder_text(user_dls, ctx)
+    # строки слота читаются после stamp = data_clock(): если с тех пор пользователь
+    # не менялся, они и есть данные этой версии
+    if version <= stamp:
+        _views.put(user_id, version, ctx.today, "reminder", (text or "", REMINDER_KB))
+    return text
+
+
+async def _send_user_reminder(dispatcher: ReminderDispatcher, user_id: int, text: str) -> None:
+    await dispatcher.send(user_id, text, reply_markup=REMINDER_KB)
+
+
+def smoothed_slot(minute: int) -> bool:
+    return minute % REMINDER_SMOOTH_STEP == 0
+
+
+def reminder_jitter(user_id: int, window: float = REMINDER_SMOOTH_WINDOW) -> float:
+    # crc32, а не hash(): задержка пользователя одна и та же между рестартами и процессами
+    return zlib.crc32(user_id.to_bytes(8, "big", signed=True)) % int(window * 1000) / 1000
+
+
+async def build_slot_digests(
+    hour: int, minute: int, today: int, window: float = REMINDER_SMOOTH_WINDOW,
+) -> list[tuple[float, int, str]]:
+    digests = []
+    ctx = RenderContext(today)
+    stamp = data_clock()
+    async for user_id, user_dls in db_iter_slot_deadlines(hour, minute, today + 7, exact=False):
+        text = _cached_reminder_text(user_id, user_dls, ctx, stamp)
+        if text is not None:
+            digests.append((reminder_jitter(user_id, window), user_id, text))
+    digests.sort()
+    return digests
+
+
+async def send_smoothed_reminders(
+    dispatcher: ReminderDispatcher, digests: list[tuple[float, int, str]], start: float,
+) -> int:
+    pending: set[asyncio.Task] = set()
+    for offset, user_id, text in digests:
+        delay = start + offset - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(pending) >= SLOT_PENDING_LIMIT:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.create_task(_send_user_reminder(dispatcher, user_id, text)))
+    if pending:
+        await asyncio.wait(pending)
+    return len(digests)
+
+
+async def send_slot_reminders(
+    dispatcher: ReminderDispatcher, hour: int, minute: int, today: int | None = None, exact: bool | None = None,
+) -> int:
+    ctx = RenderContext(today)
+    pending: set[asyncio.Task] = set()
+    queued = 0
+    stamp = data_clock()
+    async for user_id, user_dls in db_iter_slot_deadlines(hour, minute, ctx.today + 7, exact=exact):
+        text = _cached_reminder_text(user_id, user_dls, ctx, stamp)
+        if text is None:
+            continue
+        if len(pending) >= SLOT_PENDING_LIMIT:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.create_task(_send_user_reminder(dispatcher, user_id, text)))
+        queued += 1
+    if pending:
+        await asyncio.wait(pending)
+    return queued
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    hour, minute = db_get_remind_time(user_id)
+    hour, minute = await db_get_remind_time(user_id)
     text = (
         "Deadline Tracker Bot\n\n"
         "Привет! Я помогу тебе не забывать о важных дедлайнах.\n\n"
         f"Напоминания: ежедневно в {hour:02d}:{minute:02d}\n"
         "Формат даты: ДД.ММ.ГГГГ или выбор через календарь."
     )
-    await update.message.reply_text(text, reply_markup=_persistent_kb())
+    await update.message.reply_text(text, reply_markup=PERSISTENT_KB)
 
 
 async def menu_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -406,7 +447,7 @@ async def menu_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     await query.message.edit_text(
         "Deadline Tracker Bot\n\nВыбери действие:",
-        reply_markup=_main_menu_markup(),
+        reply_markup=MAIN_MENU_KB,
     )
 
 
@@ -418,7 +459,10 @@ HELP_TEXT = (
     "- Повторяющиеся дедлайны (еженедельно, ежемесячно)\n"
     "- Редактирование названия и даты\n"
     "- Ежедневные напоминания о ближайших дедлайнах (7 дней)\n"
-    "- Настройка времени напоминания\n\n"
+    "- Настройка времени напоминания\n"
+    "- Импорт дедлайнов из файла .csv или .ics (/import)\n"
+    f"- Архив: разовые дедлайны, прошедшие больше {ARCHIVE_AFTER_DAYS} дней назад, "
+    "убираются из списка в /archive\n\n"
     "Кнопки внизу экрана:\n"
     "- Добавить дедлайн — создать новый дедлайн\n"
     "- Мои дедлайны — список всех дедлайнов\n"
@@ -429,72 +473,276 @@ HELP_TEXT = (
     "/add — добавить дедлайн\n"
     "/list — мои дедлайны\n"
     "/help — справка\n"
+    "/import — как загрузить дедлайны из файла\n"
+    "/feed — ссылка для подписки в календаре\n"
+    "/archive — архив давно прошедших дедлайнов\n"
     "/cancel — отмена текущего действия\n\n"
     "Формат даты: ДД.ММ.ГГГГ или выбор через календарь."
 )
 
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(HELP_TEXT, reply_markup=_persistent_kb())
+    await update.message.reply_text(HELP_TEXT, reply_markup=PERSISTENT_KB)
 
 
-async def list_deadlines(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    if query:
-        await query.answer()
-        user_id = query.from_user.id
-    else:
-        user_id = update.effective_user.id
+IMPORT_HELP_TEXT = (
+    "Импорт дедлайнов\n\n"
+    "Пришли файл документом:\n"
+    "- .csv — столбцы «название; дата ДД.ММ.ГГГГ; повтор», повтор: weekly, monthly "
+    "или пусто; строка заголовка не обязательна\n"
+    "- .ics — календарь из Google, Outlook или расписания вуза: события и задачи "
+    "с датами, еженедельные и ежемесячные серии станут повторяющимися дедлайнами\n\n"
+    "Дедлайны с тем же названием и датой, что уже есть, второй раз не добавятся."
+)
 
-    db_advance_recurring(user_id)
-    user_dls = db_get(user_id)
+# пользователи, у которых прямо сейчас идёт импорт: второй файл ждёт окончания первого
+_importing: set[int] = set()
 
-    if not user_dls:
-        keyboard = [
-            [InlineKeyboardButton("Добавить дедлайн", callback_data="menu_add")],
-            [InlineKeyboardButton("В меню", callback_data="menu_start")],
-        ]
-        text = "У тебя пока нет дедлайнов."
-        if query:
-            await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        else:
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        return
 
-    sorted_dls = sorted(
-        user_dls,
-        key=lambda x: datetime.strptime(x["date"], "%d.%m.%Y"),
+async def feed_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    base = context.bot_data.get("feed_url")
+    if base is None:
+        await update.message.reply_text("Подписка на календарь на этом сервере не включена.")
+        return
+    url = base + feed_path(FEED_SECRET, update.effective_user.id)
+    await update.message.reply_text(
+        "Ссылка для подписки в календаре (Google, Apple, Outlook — «Добавить по URL»):\n\n"
+        f"{url}\n\n"
+        "Календарь сам подтягивает изменения. Не пересылай ссылку: по ней видны все твои дедлайны.",
+        disable_web_page_preview=True,
     )
 
-    lines = [_deadline_line(i + 1, dl) for i, dl in enumerate(sorted_dls)]
-    text = "Твои дедлайны:\n\n" + "\n".join(lines)
+
+async def import_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(IMPORT_HELP_TEXT, reply_markup=PERSISTENT_KB)
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    document = update.message.document
+    kind = kind_of(document.file_name)
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text("Файл слишком большой: Telegram отдаёт ботам файлы до 20 МБ.")
+        return
+    if user_id in _importing:
+        await update.message.reply_text("Предыдущий файл ещё импортируется, пришли этот чуть позже.")
+        return
+
+    _importing.add(user_id)
+    try:
+        status = await update.message.reply_text("Импортирую дедлайны…")
+        # на диск, а не в память: разбор читает файл построчно
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / f"upload.{kind}"
+            file = await document.get_file()
+            await file.download_to_drive(path)
+            stats = await import_file(user_id, path, kind)
+    except Exception:
+        logger.exception("Импорт файла %s от %s не удался", document.file_name, user_id)
+        await update.message.reply_text("Не удалось импортировать файл.")
+        return
+    finally:
+        _importing.discard(user_id)
+
+    text = f"Импорт завершён.\n\nДобавлено: {stats.imported}"
+    if stats.duplicates:
+        text += f"\nУже были в списке: {stats.duplicates}"
+    if stats.skipped:
+        text += f"\nПропущено (нет даты или названия, неподдерживаемый повтор): {stats.skipped}"
+    await status.edit_text(text, reply_markup=MAIN_MENU_KB)
+
+
+def _list_cursor(dl: Deadline) -> str:
+    return f"{dl.due}_{dl.id}"
+
+
+def _parse_list_cursor(data: str) -> tuple[str, int, tuple[int, str]]:
+    direction, page, due, dl_id = data.removeprefix("list_").split("_")
+    return direction, int(page), (int(due), dl_id)
+
+
+def _fit_page(dls: list[Deadline], ctx: RenderContext, render=_deadline_line, header: str = LIST_HEADER) -> list[str]:
+    lines: list[str] = []
+    length = len(header) + LIST_TEXT_RESERVE
+    for i, dl in enumerate(dls[:LIST_MAX_ROWS]):
+        line = render(i + 1, dl, ctx)
+        if lines and length + len(line) + 1 > TEXT_LIMIT:
+            break
+        if length + len(line) + 1 > TEXT_LIMIT:
+            line = line[:TEXT_LIMIT - length - 2] + "…"
+        lines.append(line)
+        length += len(line) + 1
+    return lines
+
+
+async def _list_view(user_id: int, key: str, ctx: RenderContext) -> View:
+    page, user_dls = 1, []
+    has_prev = has_next = False
+    if key.startswith("list_"):
+        direction, page, cursor = _parse_list_cursor(key)
+        if direction == "p":
+            user_dls = await db_get_page(user_id, LIST_PAGE_SIZE + 1, before=cursor)
+            has_prev = len(user_dls) > LIST_PAGE_SIZE
+            user_dls = user_dls[-LIST_PAGE_SIZE:]
+            has_next = True
+            if not has_prev:
+                page = 1
+        else:
+            user_dls = await db_get_page(user_id, LIST_PAGE_SIZE + 1, after=cursor)
+            has_next = len(user_dls) > LIST_PAGE_SIZE
+            user_dls = user_dls[:LIST_PAGE_SIZE]
+            has_prev = page > 1
+    if not user_dls:
+        # первая страница, либо страница опустела после удалений
+        page, has_prev = 1, False
+        user_dls = await db_get_page(user_id, LIST_PAGE_SIZE + 1)
+        has_next = len(user_dls) > LIST_PAGE_SIZE
+        user_dls = user_dls[:LIST_PAGE_SIZE]
+
+    if not user_dls:
+        return "У тебя пока нет дедлайнов.", EMPTY_LIST_KB
+
+    lines = _fit_page(user_dls, ctx)
+    if len(lines) < len(user_dls):
+        user_dls = user_dls[:len(lines)]
+        has_next = True
+    header = LIST_HEADER
+    if has_prev or has_next:
+        header = f"Твои дедлайны (стр. {page}):"
+    text = header + "\n\n" + "\n".join(lines)
 
     buttons: list[list[InlineKeyboardButton]] = []
-    for i, dl in enumerate(sorted_dls):
+    for i, dl in enumerate(user_dls):
         buttons.append([
-            InlineKeyboardButton(f"{i+1} — Название", callback_data=f"editname_{dl['id']}"),
-            InlineKeyboardButton(f"{i+1} — Дата", callback_data=f"editdate_{dl['id']}"),
-            InlineKeyboardButton(f"{i+1} — Удалить", callback_data=f"delete_{dl['id']}"),
+            InlineKeyboardButton(f"{i+1} — Название", callback_data=f"editname_{dl.id}"),
+            InlineKeyboardButton(f"{i+1} — Дата", callback_data=f"editdate_{dl.id}"),
+            InlineKeyboardButton(f"{i+1} — Удалить", callback_data=f"delete_{dl.id}"),
         ])
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("◀", callback_data=f"list_p_{page - 1}_{_list_cursor(user_dls[0])}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("▶", callback_data=f"list_n_{page + 1}_{_list_cursor(user_dls[-1])}"))
+    if nav:
+        buttons.append(nav)
     buttons.append([InlineKeyboardButton("Добавить дедлайн", callback_data="menu_add")])
-    buttons.append([InlineKeyboardButton("В меню", callback_data="menu_start")])
+    buttons.append([
+        InlineKeyboardButton("Архив", callback_data="archive"),
+        InlineKeyboardButton("В меню", callback_data="menu_start"),
+    ])
+    return text, InlineKeyboardMarkup(buttons)
+
+
+def _archive_line(idx: int, dl: Deadline, ctx: RenderContext) -> str:
+    # в архиве даты за разные годы, поэтому год пишем всегда
+    return f"{idx}. {dl.name} — {ctx.day_label(dl.due)} {from_day(dl.due).year}"
+
+
+def _parse_archive_cursor(data: str) -> tuple[str, int, tuple[int, str]]:
+    direction, page, due, dl_id = data.removeprefix("arch_").split("_")
+    return direction, int(page), (int(due), dl_id)
+
+
+async def _archive_view(user_id: int, key: str, ctx: RenderContext) -> View:
+    page, user_dls = 1, []
+    has_newer = has_older = False
+    if key.startswith("arch_"):
+        direction, page, cursor = _parse_archive_cursor(key)
+        if direction == "n":
+            user_dls = await db_get_archive_page(user_id, LIST_PAGE_SIZE + 1, newer=cursor)
+            has_newer = len(user_dls) > LIST_PAGE_SIZE
+            user_dls = user_dls[-LIST_PAGE_SIZE:]
+            has_older = True
+            if not has_newer:
+                page = 1
+        else:
+            user_dls = await db_get_archive_page(user_id, LIST_PAGE_SIZE + 1, older=cursor)
+            has_older = len(user_dls) > LIST_PAGE_SIZE
+            user_dls = user_dls[:LIST_PAGE_SIZE]
+            has_newer = page > 1
+    if not user_dls:
+        page, has_newer = 1, False
+        user_dls = await db_get_archive_page(user_id, LIST_PAGE_SIZE + 1)
+        has_older = len(user_dls) > LIST_PAGE_SIZE
+        user_dls = user_dls[:LIST_PAGE_SIZE]
+
+    if not user_dls:
+        return (
+            f"Архив пуст: сюда попадают разовые дедлайны через {ARCHIVE_AFTER_DAYS} дней после срока.",
+            LIST_OR_MENU_KB,
+        )
+
+    lines = _fit_page(user_dls, ctx, _archive_line, ARCHIVE_HEADER)
+    if len(lines) < len(user_dls):
+        user_dls = user_dls[:len(lines)]
+        has_older = True
+    header = ARCHIVE_HEADER
+    if has_newer or has_older:
+        header = f"Архив дедлайнов (стр. {page}):"
+    text = header + "\n\n" + "\n".join(lines)
+
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton("◀", callback_data=f"arch_n_{page - 1}_{_list_cursor(user_dls[0])}"))
+    if has_older:
+        nav.append(InlineKeyboardButton("▶", callback_data=f"arch_o_{page + 1}_{_list_cursor(user_dls[-1])}"))
+    buttons = [nav] if nav else []
+    buttons.append([
+        InlineKeyboardButton("Мои дедлайны", callback_data="menu_list"),
+        InlineKeyboardButton("В меню", callback_data="menu_start"),
+    ])
+    return text, InlineKeyboardMarkup(buttons)
+
+
+async def _show_view(update: Update, key: str, build) -> None:
+    query = update.callback_query
+    if query:
+        await query.answer()
+        user_id = query.from_user.id
+    else:
+        user_id = update.effective_user.id
+
+    # версию снимаем до чтения страницы: запись после неё даст новую версию
+    ctx = RenderContext()
+    version = data_version(user_id)
+    view = _views.get(user_id, version, ctx.today, key)
+    if view is None:
+        view = await build(user_id, key, ctx)
+        _views.put(user_id, version, ctx.today, key, view)
+    text, markup = view
 
     if query:
-        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        if shows(query.message, text, markup):
+            # повторное нажатие на уже показанный список: Telegram всё равно ответил бы
+            # «message is not modified»
+            _views.unchanged += 1
+            return
+        await query.message.edit_text(text, reply_markup=markup)
     else:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        await update.message.reply_text(text, reply_markup=markup)
+
+
+async def list_deadlines(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    key = query.data if query and query.data.startswith("list_") else "list"
+    await _show_view(update, key, _list_view)
+
+
+async def archive_deadlines(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    key = query.data if query and query.data.startswith("arch_") else "archive"
+    await _show_view(update, key, _archive_view)
 
 
 async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [[InlineKeyboardButton("Отмена", callback_data="cancel_add")]]
     if update.callback_query:
         await update.callback_query.answer()
         await update.callback_query.message.reply_text(
-            "Введи название дедлайна:", reply_markup=InlineKeyboardMarkup(keyboard),
+            "Введи название дедлайна:", reply_markup=CANCEL_ADD_KB,
         )
     else:
         await update.message.reply_text(
-            "Введи название дедлайна:", reply_markup=InlineKeyboardMarkup(keyboard),
+            "Введи название дедлайна:", reply_markup=CANCEL_ADD_KB,
         )
     return ADD_NAME
 
@@ -502,7 +750,7 @@ async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["deadline_name"] = update.message.text
     now = datetime.now()
-    markup = _build_calendar(now.year, now.month, cancel_cb="cancel_add")
+    markup = calendar_markup(now.year, now.month, cancel_cb="cancel_add")
     await update.message.reply_text(
         "Выбери дату дедлайна или введи вручную (ДД.ММ.ГГГГ):",
         reply_markup=markup,
@@ -511,24 +759,17 @@ async def add_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    date_str = update.message.text.strip()
-
-    days_left, _ = calculate_days(date_str)
-    if days_left is None:
+    due = parse_day(update.message.text.strip())
+    if due is None:
         await update.message.reply_text(
             "Неверный формат даты!\nФормат: ДД.ММ.ГГГГ\nПример: 20.01.2026\n\nПопробуй ещё раз:"
         )
         return ADD_DATE
 
-    context.user_data["deadline_date"] = date_str
+    context.user_data["deadline_due"] = due
 
-    keyboard = [
-        [InlineKeyboardButton("Нет", callback_data="repeat_none")],
-        [InlineKeyboardButton("Еженедельно", callback_data="repeat_weekly")],
-        [InlineKeyboardButton("Ежемесячно", callback_data="repeat_monthly")],
-    ]
     await update.message.reply_text(
-        "Повторяющийся дедлайн?", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Повторяющийся дедлайн?", reply_markup=REPEAT_KB,
     )
     return ADD_REPEAT
 
@@ -536,22 +777,15 @@ async def add_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def add_date_cal_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    date_str = query.data.removeprefix("cal_d_")
-
-    days_left, _ = calculate_days(date_str)
-    if days_left is None:
+    due = parse_day(query.data.removeprefix("cal_d_"))
+    if due is None:
         await query.message.edit_text("Ошибка даты. Попробуй ещё раз.")
         return ADD_DATE
 
-    context.user_data["deadline_date"] = date_str
+    context.user_data["deadline_due"] = due
 
-    keyboard = [
-        [InlineKeyboardButton("Нет", callback_data="repeat_none")],
-        [InlineKeyboardButton("Еженедельно", callback_data="repeat_weekly")],
-        [InlineKeyboardButton("Ежемесячно", callback_data="repeat_monthly")],
-    ]
     await query.message.edit_text(
-        "Повторяющийся дедлайн?", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Повторяющийся дедлайн?", reply_markup=REPEAT_KB,
     )
     return ADD_REPEAT
 
@@ -560,8 +794,8 @@ async def add_date_cal_nav(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     month, year = _parse_cal_nav(query.data)
-    markup = _build_calendar(year, month, cancel_cb="cancel_add")
-    await query.message.edit_reply_markup(reply_markup=markup)
+    markup = calendar_markup(year, month, cancel_cb="cancel_add")
+    _calendar_nav.show(query.message, markup, context.application.create_task)
     return ADD_DATE
 
 
@@ -577,52 +811,40 @@ async def add_repeat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     repeat = repeat_map.get(query.data)
 
     user_id = query.from_user.id
-    name = context.user_data["deadline_name"]
-    date_str = context.user_data["deadline_date"]
+    name = context.user_data.get("deadline_name")
+    due = context.user_data.get("deadline_due")
+    if due is None and "deadline_date" in context.user_data:
+        # диалог начат до перехода на номер дня и пережил рестарт
+        due = parse_day(context.user_data["deadline_date"])
+    if name is None or due is None:
+        # кнопка со старого сообщения: диалог уже закончен или его данные потеряны
+        await query.message.edit_text(
+            "Данные дедлайна потерялись, начни добавление заново.", reply_markup=BACK_TO_MENU_KB,
+        )
+        return ConversationHandler.END
     dl_id = uuid4().hex[:8]
 
-    db_add(user_id, dl_id, name, date_str, repeat)
+    await db_add(user_id, dl_id, name, due, repeat)
 
-    days_left, _ = calculate_days(date_str)
-    fd = format_date(date_str)
-    if days_left < 0:
-        status = f"просрочен на {abs(days_left)} дн."
-    elif days_left == 0:
-        status = "СЕГОДНЯ!"
-    elif days_left == 1:
-        status = "ЗАВТРА!"
-    else:
-        status = f"через {days_left} дн."
-
-    repeat_info = ""
-    if repeat in REPEAT_LABELS:
-        repeat_info = f" [{REPEAT_LABELS[repeat]}]"
+    ctx = RenderContext()
+    text = f"Дедлайн добавлен!\n\n{name}{_repeat_tag(repeat)} — {ctx.day_label(due)} ({ctx.status(due)})"
 
-    text = f"Дедлайн добавлен!\n\n{name}{repeat_info} — {fd} ({status})"
-
-    keyboard = [
-        [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-        [InlineKeyboardButton("Добавить ещё", callback_data="menu_add")],
-        [InlineKeyboardButton("В меню", callback_data="menu_start")],
-    ]
-    await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.message.edit_text(text, reply_markup=AFTER_ADD_KB)
     return ConversationHandler.END
 
 
 async def add_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await query.message.edit_text(
-        "Добавление дедлайна отменено.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Добавление дедлайна отменено.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
 
 async def add_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await update.message.reply_text(
-        "Добавление дедлайна отменено.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Добавление дедлайна отменено.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
@@ -633,15 +855,11 @@ async def delete_deadline_callback(update: Update, context: ContextTypes.DEFAULT
     user_id = query.from_user.id
     dl_id = query.data.removeprefix("delete_")
 
-    deleted_name = db_delete(dl_id, user_id)
+    deleted_name = await db_delete(dl_id, user_id)
     if deleted_name:
-        keyboard = [
-            [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-            [InlineKeyboardButton("В меню", callback_data="menu_start")],
-        ]
         await query.message.edit_text(
             f"Дедлайн \"{deleted_name}\" удалён.",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=LIST_OR_MENU_KB,
         )
     else:
         await query.message.edit_text("Дедлайн не найден.")
@@ -653,8 +871,7 @@ async def editdate_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     dl_id = query.data.removeprefix("editdate_")
     user_id = query.from_user.id
 
-    user_dls = db_get(user_id)
-    target = next((dl for dl in user_dls if dl["id"] == dl_id), None)
+    target = await db_get_deadline(user_id, dl_id)
     if target is None:
         await query.message.edit_text("Дедлайн не найден.")
         return ConversationHandler.END
@@ -662,10 +879,10 @@ async def editdate_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["edit_dl_id"] = dl_id
 
     now = datetime.now()
-    markup = _build_calendar(now.year, now.month, cancel_cb="cancel_edit")
+    markup = calendar_markup(now.year, now.month, cancel_cb="cancel_edit")
     await query.message.edit_text(
-        f"Изменение даты для: {target['name']}\n"
-        f"Текущая дата: {format_date(target['date'])}\n\n"
+        f"Изменение даты для: {target.name}\n"
+        f"Текущая дата: {RenderContext().date_label(target)}\n\n"
         "Выбери новую дату или введи вручную (ДД.ММ.ГГГГ):",
         reply_markup=markup,
     )
@@ -674,28 +891,23 @@ async def editdate_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def editdate_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    date_str = update.message.text.strip()
+    due = parse_day(update.message.text.strip())
     dl_id = context.user_data.get("edit_dl_id")
 
-    days_left, _ = calculate_days(date_str)
-    if days_left is None:
+    if due is None:
         await update.message.reply_text(
             "Неверный формат даты!\nФормат: ДД.ММ.ГГГГ\nПример: 20.01.2026\n\nПопробуй ещё раз:"
         )
         return EDIT_DATE
 
-    name = db_update_date(dl_id, user_id, date_str)
+    name = await db_update_date(dl_id, user_id, due)
     if name is None:
         await update.message.reply_text("Дедлайн не найден.")
         return ConversationHandler.END
 
-    keyboard = [
-        [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-        [InlineKeyboardButton("В меню", callback_data="menu_start")],
-    ]
     await update.message.reply_text(
-        f"Дата обновлена!\n\n{name} — {format_date(date_str)}",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        f"Дата обновлена!\n\n{name} — {RenderContext().day_label(due)}",
+        reply_markup=LIST_OR_MENU_KB,
     )
     return ConversationHandler.END
 
@@ -705,25 +917,19 @@ async def editdate_cal_pick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     user_id = query.from_user.id
     dl_id = context.user_data.get("edit_dl_id")
-    date_str = query.data.removeprefix("cal_d_")
-
-    days_left, _ = calculate_days(date_str)
-    if days_left is None:
+    due = parse_day(query.data.removeprefix("cal_d_"))
+    if due is None:
         await query.message.edit_text("Ошибка даты.")
         return ConversationHandler.END
 
-    name = db_update_date(dl_id, user_id, date_str)
+    name = await db_update_date(dl_id, user_id, due)
     if name is None:
         await query.message.edit_text("Дедлайн не найден.")
         return ConversationHandler.END
 
-    keyboard = [
-        [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-        [InlineKeyboardButton("В меню", callback_data="menu_start")],
-    ]
     await query.message.edit_text(
-        f"Дата обновлена!\n\n{name} — {format_date(date_str)}",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        f"Дата обновлена!\n\n{name} — {RenderContext().day_label(due)}",
+        reply_markup=LIST_OR_MENU_KB,
     )
     return ConversationHandler.END
 
@@ -732,8 +938,8 @@ async def editdate_cal_nav(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     month, year = _parse_cal_nav(query.data)
-    markup = _build_calendar(year, month, cancel_cb="cancel_edit")
-    await query.message.edit_reply_markup(reply_markup=markup)
+    markup = calendar_markup(year, month, cancel_cb="cancel_edit")
+    _calendar_nav.show(query.message, markup, context.application.create_task)
     return EDIT_DATE
 
 
@@ -743,17 +949,15 @@ async def editname_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     dl_id = query.data.removeprefix("editname_")
     user_id = query.from_user.id
 
-    user_dls = db_get(user_id)
-    target = next((dl for dl in user_dls if dl["id"] == dl_id), None)
+    target = await db_get_deadline(user_id, dl_id)
     if target is None:
         await query.message.edit_text("Дедлайн не найден.")
         return ConversationHandler.END
 
     context.user_data["edit_dl_id"] = dl_id
-    keyboard = [[InlineKeyboardButton("Отмена", callback_data="cancel_edit")]]
     await query.message.edit_text(
-        f"Текущее название: {target['name']}\n\nВведи новое название:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        f"Текущее название: {target.name}\n\nВведи новое название:",
+        reply_markup=CANCEL_EDIT_KB,
     )
     return EDIT_NAME
 
@@ -763,18 +967,14 @@ async def editname_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_name = update.message.text.strip()
     dl_id = context.user_data.get("edit_dl_id")
 
-    old_name = db_update_name(dl_id, user_id, new_name)
+    old_name = await db_update_name(dl_id, user_id, new_name)
     if old_name is None:
         await update.message.reply_text("Дедлайн не найден.")
         return ConversationHandler.END
 
-    keyboard = [
-        [InlineKeyboardButton("Мои дедлайны", callback_data="menu_list")],
-        [InlineKeyboardButton("В меню", callback_data="menu_start")],
-    ]
     await update.message.reply_text(
         f"Название обновлено!\n\n\"{old_name}\" -> \"{new_name}\"",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=LIST_OR_MENU_KB,
     )
     return ConversationHandler.END
 
@@ -782,29 +982,26 @@ async def editname_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def edit_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await query.message.edit_text(
-        "Изменение отменено.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Изменение отменено.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
 
 async def edit_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await update.message.reply_text(
-        "Изменение отменено.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Изменение отменено.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
 
 async def set_time_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    hour, minute = db_get_remind_time(user_id)
-    keyboard = [[InlineKeyboardButton("Отмена", callback_data="cancel_settime")]]
+    hour, minute = await db_get_remind_time(user_id)
     await update.message.reply_text(
         f"Текущее время напоминания: {hour:02d}:{minute:02d}\n\n"
         "Введи новое время в формате ЧЧ:ММ\nНапример: 09:00 или 21:30",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=CANCEL_SETTIME_KB,
     )
     return SET_TIME
 
@@ -823,14 +1020,12 @@ async def set_time_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return SET_TIME
 
-    db_set_remind_time(user_id, hour, minute)
-    schedule_user_reminder(context.application, user_id, hour, minute)
+    await db_set_remind_time(user_id, hour, minute)
 
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await update.message.reply_text(
         f"Время напоминания установлено: {hour:02d}:{minute:02d}\n\n"
         "Каждый день в это время я напомню о ближайших дедлайнах.",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
@@ -838,25 +1033,99 @@ async def set_time_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def set_time_cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await query.message.edit_text(
-        "Настройка времени отменена.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Настройка времени отменена.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
 
 async def set_time_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [[InlineKeyboardButton("В меню", callback_data="menu_start")]]
     await update.message.reply_text(
-        "Настройка времени отменена.", reply_markup=InlineKeyboardMarkup(keyboard),
+        "Настройка времени отменена.", reply_markup=BACK_TO_MENU_KB,
     )
     return ConversationHandler.END
 
 
-def main():
-    init_db()
+async def _post_init(application) -> None:
+    # воркер кластера подкладывает сюда путь к своему шарду и свою долю общего лимита отправки
+    open_storage(application.bot_data.get("db_path"), application.bot_data.get("db_shards", 1))
+    warm_calendars(datetime.now().date())
+    dispatcher = ReminderDispatcher(
+        application.bot, rate=application.bot_data.get("send_rate", GLOBAL_RATE),
+    )
+    application.bot_data["dispatcher"] = dispatcher
+    metrics_port = application.bot_data.get("metrics_port")
+    if metrics_port:
+        server = MetricsServer(METRICS_LISTEN, metrics_port)
+        await server.start()
+        application.bot_data["metrics_server"] = server
+        watch_jobs(application.job_queue.scheduler)
+        register_gauges("bot_deadline_cache", "Состояние кэша дедлайнов", cache_stats)
+        register_gauges("bot_reminder_dispatch", "Счётчики рассылки напоминаний", dispatcher.stats)
+        register_gauges("bot_render_cache", "Состояние кэша отрисованных сообщений", _views.stats)
+        register_gauges(
+            "bot_flood_guard", "Отброшенные апдейты и сэкономленные вызовы API",
+            application.bot_data["flood_guard"].stats,
+        )
+    feed_port = application.bot_data.get("feed_port")
+    if feed_port:
+        feed_server = FeedServer(FEED_LISTEN, feed_port, FEED_SECRET)
+        await feed_server.start()
+        application.bot_data["feed_server"] = feed_server
+        application.bot_data["feed_url"] = FEED_URL.format(port=feed_server.port).rstrip("/")
+        if metrics_port:
+            register_gauges("bot_feed_cache", "Состояние кэша лент календаря", feed_server.cache.stats)
+    # дальше повторы переносит _reminder_tick при смене дня
+    await _advance_recurring()
+    schedule_archive(application)
+    schedule_reminders(application)
+    if sql_tracer() is not None:
+        schedule_sql_report(application)
+
+
+async def _post_shutdown(application) -> None:
+    for name in ("metrics_server", "feed_server"):
+        server = application.bot_data.pop(name, None)
+        if server is not None:
+            await server.stop()
+    await close_storage()
+    if sql_tracer() is not None:
+        logger.info("Сводка SQL по суммарному времени:\n%s", sql_tracer().report())
+
+
+def build_application(
+    builder, db_path: Path | None = None, db_shards: int = DB_SHARDS,
+    metrics_port: int = METRICS_PORT, feed_port: int = FEED_PORT,
+    flood_rate: float = FLOOD_UPDATE_RATE,
+) -> Application:
+    if feed_port and not FEED_SECRET:
+        raise ValueError("FEED_PORT задан, а FEED_SECRET пуст: ссылки на ленты было бы не проверить")
+    if feed_port and not FEED_URL:
+        # адрес прослушивания (обычно 0.0.0.0) календарный клиент открыть не сможет
+        raise ValueError("FEED_PORT задан, а FEED_URL пуст: ссылку на ленту нечем было бы показать")
+    if SQL_TRACE:
+        # до сборки приложения: persistence открывает БД ещё в initialize
+        enable_sql_trace(SQL_SLOW_MS)
+    if metrics_port:
+        enable_metrics()
+        builder = builder.request(InstrumentedRequest(connection_pool_size=METRICS_POOL_SIZE))
+    application = (
+        builder
+        .persistence(SqlitePersistence(db_path, shards=db_shards))
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+    if db_path is not None:
+        application.bot_data["db_path"] = db_path
+    application.bot_data["db_shards"] = db_shards
+    if feed_port:
+        application.bot_data["feed_port"] = feed_port
 
-    application = Application.builder().token(TOKEN).build()
+    # группа -1 обрабатывается раньше всех: отброшенный апдейт дальше не идёт
+    guard = FloodGuard(flood_rate, nav=_calendar_nav)
+    application.bot_data["flood_guard"] = guard
+    application.add_handler(TypeHandler(Update, guard.filter_update), group=-1)
 
     add_conv = ConversationHandler(
         entry_points=[
@@ -879,6 +1148,8 @@ def main():
             CallbackQueryHandler(add_cancel_callback, pattern="^cancel_add$"),
         ],
         per_message=False,
+        name="add",
+        persistent=True,
     )
 
     editdate_conv = ConversationHandler(
@@ -898,6 +1169,8 @@ def main():
             CallbackQueryHandler(edit_cancel_callback, pattern="^cancel_edit$"),
         ],
         per_message=False,
+        name="editdate",
+        persistent=True,
     )
 
     editname_conv = ConversationHandler(
@@ -912,6 +1185,8 @@ def main():
             CallbackQueryHandler(edit_cancel_callback, pattern="^cancel_edit$"),
         ],
         per_message=False,
+        name="editname",
+        persistent=True,
     )
 
     time_conv = ConversationHandler(
@@ -926,11 +1201,20 @@ def main():
             CallbackQueryHandler(set_time_cancel_callback, pattern="^cancel_settime$"),
         ],
         per_message=False,
+        name="settime",
+        persistent=True,
     )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_cmd))
     application.add_handler(MessageHandler(filters.Text([BTN_HELP]), help_cmd))
+    application.add_handler(CommandHandler("import", import_help))
+    application.add_handler(CommandHandler("feed", feed_cmd))
+    # block=False: импорт большого файла идёт секунды и не должен держать очередь апдейтов
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv") | filters.Document.FileExtension("ics"),
+        import_document, block=False,
+    ))
     application.add_handler(add_conv)
     application.add_handler(editdate_conv)
     application.add_handler(editname_conv)
@@ -938,13 +1222,39 @@ def main():
     application.add_handler(CommandHandler("list", list_deadlines))
     application.add_handler(MessageHandler(filters.Text([BTN_LIST]), list_deadlines))
     application.add_handler(CallbackQueryHandler(list_deadlines, pattern="^menu_list$"))
+    application.add_handler(CallbackQueryHandler(list_deadlines, pattern=r"^list_[np]_\d+_-?\d+_[a-f0-9]{8}$"))
+    application.add_handler(CommandHandler("archive", archive_deadlines))
+    application.add_handler(CallbackQueryHandler(archive_deadlines, pattern="^archive$"))
+    application.add_handler(CallbackQueryHandler(archive_deadlines, pattern=r"^arch_[on]_\d+_-?\d+_[a-f0-9]{8}$"))
     application.add_handler(CallbackQueryHandler(menu_start, pattern="^menu_start$"))
     application.add_handler(CallbackQueryHandler(delete_deadline_callback, pattern=r"^delete_[a-f0-9]{8}$"))
+    if metrics_port:
+        instrument_handlers(application)
+        application.bot_data["metrics_port"] = metrics_port
+    return application
 
-    schedule_all_reminders(application)
+
+def main():
+    init_db(shards=DB_SHARDS)
+
+    builder = Application.builder().token(TOKEN)
+    if WEBHOOK_URL:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    application = build_application(builder)
 
     print("Бот запущен!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        run_webhook(
+            application,
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            host=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or secrets.token_urlsafe(32),
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+import calendar as cal_mod
+from datetime import date
+from functools import lru_cache
+
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    ReplyKeyboardMarkup,
+    KeyboardButton,
+)
+
+# Разметка в PTB неизменяема после создания, поэтому одни и те же объекты
+# можно отдавать во все сообщения сразу.
+
+MONTHS_RU_NOM = {
+    1: "Январь", 2: "Февраль", 3: "Март", 4: "Апрель",
+    5: "Май", 6: "Июнь", 7: "Июль", 8: "Август",
+    9: "Сентябрь", 10: "Октябрь", 11: "Ноябрь", 12: "Декабрь",
+}
+
+BTN_ADD = "Добавить дедлайн"
+BTN_LIST = "Мои дедлайны"
+BTN_SETTINGS = "Время напоминания"
+BTN_HELP = "Помощь"
+
+DAYS_HEADER = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+CALENDAR_CACHE_SIZE = 64
+CALENDAR_CANCEL_CBS = ("cancel_add", "cancel_edit")
+WARM_MONTHS_BEFORE = 1
+WARM_MONTHS_AFTER = 6
+
+
+def _inline(*rows: tuple[tuple[str, str], ...]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in rows
+    ])
+
+
+PERSISTENT_KB = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton(BTN_ADD), KeyboardButton(BTN_LIST)],
+        [KeyboardButton(BTN_SETTINGS), KeyboardButton(BTN_HELP)],
+    ],
+    resize_keyboard=True,
+    is_persistent=True,
+)
+
+MAIN_MENU_KB = _inline(
+    (("Добавить дедлайн", "menu_add"),),
+    (("Мои дедлайны", "menu_list"),),
+)
+
+REPEAT_KB = _inline(
+    (("Нет", "repeat_none"),),
+    (("Еженедельно", "repeat_weekly"),),
+    (("Ежемесячно", "repeat_monthly"),),
+)
+
+EMPTY_LIST_KB = _inline(
+    (("Добавить дедлайн", "menu_add"),),
+    (("Архив", "archive"), ("В меню", "menu_start")),
+)
+
+AFTER_ADD_KB = _inline(
+    (("Мои дедлайны", "menu_list"),),
+    (("Добавить ещё", "menu_add"),),
+    (("В меню", "menu_start"),),
+)
+
+LIST_OR_MENU_KB = _inline(
+    (("Мои дедлайны", "menu_list"),),
+    (("В меню", "menu_start"),),
+)
+
+REMINDER_KB = _inline((("Мои дедлайны", "menu_list"),))
+BACK_TO_MENU_KB = _inline((("В меню", "menu_start"),))
+CANCEL_ADD_KB = _inline((("Отмена", "cancel_add"),))
+CANCEL_EDIT_KB = _inline((("Отмена", "cancel_edit"),))
+CANCEL_SETTIME_KB = _inline((("Отмена", "cancel_settime"),))
+
+
+def build_calendar(year: int, month: int, cancel_cb: str = "cancel_add") -> InlineKeyboardMarkup:
+    rows: list[list[InlineKeyboardButton]] = []
+
+    prev_m, prev_y = month - 1, year
+    if prev_m < 1:
+        prev_m, prev_y = 12, year - 1
+    next_m, next_y = month + 1, year
+    if next_m > 12:
+        next_m, next_y = 1, year + 1
+
+    rows.append([
+        InlineKeyboardButton("◀", callback_data=f"cal_p_{prev_m:02d}.{prev_y}"),
+        InlineKeyboardButton(f"{MONTHS_RU_NOM[month]} {year}", callback_data="cal_ignore"),
+        InlineKeyboardButton("▶", callback_data=f"cal_n_{next_m:02d}.{next_y}"),
+    ])
+
+    rows.append([
+        InlineKeyboardButton(d, callback_data="cal_ignore") for d in DAYS_HEADER
+    ])
+
+    for week in cal_mod.monthcalendar(year, month):
+        row = []
+        for day in week:
+            if day == 0:
+                row.append(InlineKeyboardButton(" ", callback_data="cal_ignore"))
+            else:
+                date_str = f"{day:02d}.{month:02d}.{year}"
+                row.append(InlineKeyboardButton(str(day), callback_data=f"cal_d_{date_str}"))
+        rows.append(row)
+
+    rows.append([InlineKeyboardButton("Отмена", callback_data=cancel_cb)])
+
+    return InlineKeyboardMarkup(rows)
+
+
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def calendar_markup(year: int, month: int, cancel_cb: str = "cancel_add") -> InlineKeyboardMarkup:
+    return build_calendar(year, month, cancel_cb)
+
+
+def warm_calendars(today: date) -> None:
+    for offset in range(-WARM_MONTHS_BEFORE, WARM_MONTHS_AFTER + 1):
+        y, m = divmod(today.month - 1 + offset, 12)
+        for cancel_cb in CALENDAR_CANCEL_CBS:
+            calendar_markup(today.year + y, m + 1, cancel_cb)
@@ -0,0 +1,317 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Гистограммы задержек и счётчики ошибок по обработчикам и по функциям db_*,
+отставание задач JobQueue от расписания и время исходящих запросов к Bot API.
+Пока метрики не включены через enable(), обёртки db_* сразу передают вызов
+дальше, а обработчики, запросы и планировщик не оборачиваются вовсе.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Iterator
+
+from apscheduler.events import (
+    EVENT_JOB_ADDED,
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from telegram.request import HTTPXRequest
+
+from webhook import read_request, write_response
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# запросы к SQLite укладываются в доли миллисекунды, обработчики и Bot API — в десятки
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SLOW_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, count in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {count:g}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; счёт хранится по корзинам, а не накопленным."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = SLOW_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработчика апдейта", ("handler",), SLOW_BUCKETS)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+DB_SECONDS = Histogram("bot_db_seconds", "Время вызова db_*", ("function",), FAST_BUCKETS)
+DB_ERRORS = Counter("bot_db_errors_total", "Исключения в db_*", ("function",))
+JOB_LAG_SECONDS = Histogram("bot_job_lag_seconds", "Отставание запуска задачи от расписания", ("job",), LAG_BUCKETS)
+JOB_MISSED = Counter("bot_job_missed_total", "Пропущенные запуски задач", ("job",))
+TELEGRAM_SECONDS = Histogram("bot_telegram_request_seconds", "Время запроса к Bot API", ("method",), SLOW_BUCKETS)
+TELEGRAM_RESPONSES = Counter("bot_telegram_responses_total", "Ответы Bot API по кодам", ("method", "code"))
+
+METRICS = (
+    HANDLER_SECONDS, HANDLER_ERRORS, DB_SECONDS, DB_ERRORS,
+    JOB_LAG_SECONDS, JOB_MISSED, TELEGRAM_SECONDS, TELEGRAM_RESPONSES,
+)
+
+# имя -> (справка, функция -> {ключ: значение}); снимаются в момент запроса /metrics
+_gauges: dict[str, tuple[str, object]] = {}
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def register_gauges(name: str, help: str, collect) -> None:
+    _gauges[name] = (help, collect)
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, (help, collect) in _gauges.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(collect().items()):
+            lines.append(f'{name}{{key="{_escape(key)}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+
+def observe_db(fn):
+    """Декоратор для db_*: время и ошибки по имени функции, пока метрики включены.
+
+    У асинхронных генераторов считается только время внутри генератора, без того,
+    что делает вызывающий между итерациями.
+    """
+    name = fn.__name__
+
+    if inspect.isasyncgenfunction(fn):
+        @wraps(fn)
+        async def gen_wrapper(*args, **kwargs):
+            if not _enabled:
+                async for item in fn(*args, **kwargs):
+                    yield item
+                return
+            agen = fn(*args, **kwargs)
+            spent = 0.0
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = await agen.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        spent += time.perf_counter() - started
+                    yield item
+            except Exception:
+                DB_ERRORS.inc((name,))
+                raise
+            finally:
+                await agen.aclose()
+                DB_SECONDS.observe((name,), spent)
+
+        return gen_wrapper
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if not _enabled:
+            return await fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc((name,))
+            raise
+        finally:
+            DB_SECONDS.observe((name,), time.perf_counter() - started)
+
+    return wrapper
+
+
+def _timed_handler(handler) -> None:
+    callback = handler.callback
+    name = callback.__name__
+
+    @wraps(callback)
+    async def timed(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # не ошибка: так FloodGuard отбрасывает апдейт
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc((name,))
+            raise
+        finally:
+            HANDLER_SECONDS.observe((name,), time.perf_counter() - started)
+
+    handler.callback = timed
+
+
+def walk_handlers(application) -> Iterator:
+    """Все обработчики с колбэками во всех группах, включая вложенные в диалоги."""
+    def walk(handlers) -> Iterator:
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                yield from walk(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    yield from walk(state_handlers)
+                yield from walk(handler.fallbacks)
+            else:
+                yield handler
+
+    for group in application.handlers.values():
+        yield from walk(group)
+
+
+def instrument_handlers(application) -> None:
+    """Оборачивает колбэки всех зарегистрированных обработчиков, включая вложенные в диалоги."""
+    for handler in walk_handlers(application):
+        _timed_handler(handler)
+
+
+def watch_jobs(scheduler) -> None:
+    # SUBMITTED приходит, когда задача отдана исполнителю, — это и есть фактический запуск.
+    # Разовую задачу планировщик убирает ещё до SUBMITTED, поэтому имена запоминаем при
+    # добавлении и забываем, только когда отработала задача, которой больше нет в расписании
+    names: dict[str, str] = {job.id: job.name for job in scheduler.get_jobs()}
+
+    def on_event(event) -> None:
+        if event.code == EVENT_JOB_ADDED:
+            job = scheduler.get_job(event.job_id)
+            names[event.job_id] = job.name if job is not None else "unknown"
+        elif event.code & (EVENT_JOB_EXECUTED | EVENT_JOB_ERROR):
+            if scheduler.get_job(event.job_id) is None:
+                names.pop(event.job_id, None)
+        elif event.code == EVENT_JOB_MISSED:
+            JOB_MISSED.inc((names.get(event.job_id, "unknown"),))
+        else:
+            lag = (datetime.now(timezone.utc) - max(event.scheduled_run_times)).total_seconds()
+            JOB_LAG_SECONDS.observe((names.get(event.job_id, "unknown"),), max(0.0, lag))
+
+    scheduler.add_listener(
+        on_event,
+        EVENT_JOB_ADDED | EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR,
+    )
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который меряет каждый вызов Bot API и считает коды ответов."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        code = "error"
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            return code, payload
+        finally:
+            TELEGRAM_SECONDS.observe((api_method,), time.perf_counter() - started)
+            TELEGRAM_RESPONSES.inc((api_method, str(code)))
+
+
+class MetricsServer:
+    """Отдаёт render() по GET /metrics."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Метрики: http://%s:%s%s", self.host, self.port, METRICS_PATH)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await read_request(reader)
+            if request is None:
+                return
+            if request.path.split("?", 1)[0] != METRICS_PATH:
+                write_response(writer, 404, keep_alive=False)
+            elif request.method != "GET":
+                write_response(writer, 405, keep_alive=False)
+            else:
+                write_response(writer, 200, render().encode(), headers={"Content-Type": CONTENT_TYPE},
+                               keep_alive=False)
+            await writer.drain()
+        except (ConnectionError, ValueError, OverflowError):
+            pass
+        finally:
+            writer.close()
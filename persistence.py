@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+from itertools import islice
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import db_load_conversations, db_load_user_data, db_save_persistence, open_storage
+
+logger = logging.getLogger(__name__)
+
+# PTB отдаёт изменения раз в PERSISTENCE_UPDATE_INTERVAL — это только перекладывание
+# ссылок в буфер; в БД буфер уходит пачками раз в PERSISTENCE_FLUSH_INTERVAL
+PERSISTENCE_UPDATE_INTERVAL = 1.0
+PERSISTENCE_FLUSH_INTERVAL = 5.0
+PERSISTENCE_FLUSH_BATCH = 1000
+# скольких пользователей помнить прочитанными; давно не писавшие перечитаются из БД
+PERSISTENCE_LOADED_MAX = 100_000
+
+# недоговорённый диалог старше суток при рестарте не восстанавливаем
+CONVERSATION_TTL = 24 * 3600
+
+
+class SqlitePersistence(BasePersistence):
+    """Состояния ConversationHandler и user_data в той же SQLite-базе, что и дедлайны.
+
+    Запись отложенная: изменения копятся в памяти и сбрасываются пачкой по таймеру
+    и при остановке. user_data читается лениво, при первом апдейте от пользователя,
+    а из диалогов при старте поднимаются только незавершённые и свежие, так что
+    время запуска не зависит от числа пользователей.
+    """
+
+    def __init__(
+        self, path: Path | str | None = None, flush_interval: float = PERSISTENCE_FLUSH_INTERVAL, shards: int = 1,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=PERSISTENCE_UPDATE_INTERVAL,
+        )
+        self.path = path
+        self.shards = shards
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        # прочитанные из БД пользователи, от давно не писавших к недавним
+        self._loaded: dict[int, None] = {}
+        # None в буфере означает удаление записи
+        self._users: dict[int, dict | None] = {}
+        self._conversations: dict[tuple[str, str], tuple[int | None, object]] = {}
+        self._flusher: asyncio.Task | None = None
+
+    def _start(self) -> None:
+        # вызывается из Application.initialize, раньше post_init, поэтому БД открываем сами
+        open_storage(self.path, self.shards)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def get_user_data(self) -> dict[int, dict]:
+        self._start()
+        return {}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        self._start()
+        rows = await db_load_conversations(name, int(time.time()) - CONVERSATION_TTL)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        # при per_user=True пользователь — последний элемент ключа; по нему cluster.py переносит шарды
+        self._conversations[name, json.dumps(key)] = (key[-1] if key else None, new_state)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._users[user_id] = data or None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._users[user_id] = None
+        self._loaded.pop(user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded:
+            # в конец очереди: первыми забываются давно не писавшие
+            del self._loaded[user_id]
+            self._loaded[user_id] = None
+            return
+        # несброшенная запись в буфере новее БД, в том числе удаление
+        raw = None if user_id in self._users else await db_load_user_data(user_id)
+        if raw:
+            for key, value in json.loads(raw).items():
+                user_data.setdefault(key, value)
+        self._loaded[user_id] = None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush()
+            except Exception:
+                logger.exception("Не удалось сохранить состояние диалогов")
+
+    async def _flush(self) -> None:
+        if not self._users and not self._conversations:
+            return
+        users, self._users = self._users, {}
+        convs, self._conversations = self._conversations, {}
+        now = int(time.time())
+
+        user_rows, user_deletes = [], []
+        for user_id, data in users.items():
+            if data is None:
+                user_deletes.append((user_id,))
+                continue
+            try:
+                user_rows.append((user_id, json.dumps(data, ensure_ascii=False), now))
+            except (TypeError, ValueError):
+                logger.error("user_data пользователя %s не сериализуется в JSON, пропускаю", user_id)
+        conv_rows, conv_deletes = [], []
+        for (name, key), (user_id, state) in convs.items():
+            if state is None:
+                conv_deletes.append((name, key, user_id))
+            else:
+                conv_rows.append((name, key, user_id, json.dumps(state), now))
+
+        batch = PERSISTENCE_FLUSH_BATCH
+        total = max(len(user_rows), len(user_deletes), len(conv_rows), len(conv_deletes))
+        try:
+            for i in range(0, total, batch):
+                await db_save_persistence(
+                    user_rows[i:i + batch], user_deletes[i:i + batch],
+                    conv_rows[i:i + batch], conv_deletes[i:i + batch],
+                )
+        except Exception:
+            # возвращаем в буфер всё, что не перезаписано более свежими изменениями
+            for user_id, data in users.items():
+                self._users.setdefault(user_id, data)
+            for key, value in convs.items():
+                self._conversations.setdefault(key, value)
+            raise
+        self.flushed += len(users) + len(convs)
+        self._forget_loaded()
+
+    def _forget_loaded(self) -> None:
+        # забывать можно только тех, чьи изменения уже в БД, иначе перечитывание
+        # вернуло бы в user_data удалённые ключи
+        excess = len(self._loaded) - PERSISTENCE_LOADED_MAX
+        if excess <= 0:
+            return
+        stale = list(islice((u for u in self._loaded if u not in self._users), excess))
+        for user_id in stale:
+            del self._loaded[user_id]
+
+    async def flush(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self._flush()
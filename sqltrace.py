@@ -0,0 +1,308 @@
+"""Трассировка SQL и проверка планов запросов.
+
+В режиме трассировки каждое соединение из storage.connect() меряет свои
+execute/executemany: запросы дольше порога пишутся в лог вместе с параметрами,
+а по всем запросам копится сводка — число вызовов, суммарное и худшее время.
+Строки SELECT при этом выбираются сразу в execute, чтобы в замер попало и
+чтение результата, поэтому режим диагностический, а не для постоянной работы.
+
+explain прогоняет все известные q_* на копии схемы внутри откатываемой
+транзакции, снимает EXPLAIN QUERY PLAN для каждого их запроса и помечает полные
+просмотры таблиц и сортировки без индекса.
+
+    python sqltrace.py explain [deadlines.db]
+"""
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = 50.0
+TOP_STATEMENTS = 15
+PARAMS_LOG_LIMIT = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(sql: str) -> str:
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class Tracer:
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_s = slow_ms / 1000
+        self._lock = threading.Lock()
+        # текст запроса -> [вызовы, суммарное время, худшее время]
+        self._stats: dict[str, list] = {}
+
+    def record(self, sql: str, params, elapsed: float) -> None:
+        key = _normalize(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+        if elapsed >= self.slow_s:
+            logger.warning("Медленный запрос %.1f мс: %s; параметры: %.*s",
+                           elapsed * 1000, key, PARAMS_LOG_LIMIT, repr(params))
+
+    def top(self, limit: int = TOP_STATEMENTS) -> list[tuple[str, int, float, float]]:
+        with self._lock:
+            rows = [(sql, n, total, worst) for sql, (n, total, worst) in self._stats.items()]
+        rows.sort(key=lambda r: r[2], reverse=True)
+        return rows[:limit]
+
+    def report(self, limit: int = TOP_STATEMENTS) -> str:
+        lines = [f"{'вызовов':>9} {'всего, мс':>11} {'средн., мс':>11} {'макс., мс':>10}  запрос"]
+        for sql, n, total, worst in self.top(limit):
+            lines.append(f"{n:>9} {total * 1000:>11.1f} {total / n * 1000:>11.3f} {worst * 1000:>10.1f}  {sql}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class _Rows:
+    """Уже выбранный результат с интерфейсом курсора, которым пользуются q_*."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._rows = cursor.fetchall()
+        self._pos = 0
+        self.description = cursor.description
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size: int = 1) -> list:
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self) -> list:
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        while self._pos < len(self._rows):
+            yield self.fetchone()
+
+
+_tracer: Tracer | None = None
+
+
+class TracingConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        if cursor.description is not None:
+            cursor = _Rows(cursor)
+        _tracer.record(sql, parameters, time.perf_counter() - started)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters, /):
+        # генератор параметров нельзя ни показать в логе, ни перечитать — фиксируем его списком
+        params = list(seq_of_parameters)
+        started = time.perf_counter()
+        cursor = super().executemany(sql, params)
+        _tracer.record(sql, params[:3], time.perf_counter() - started)
+        return cursor
+
+
+def enable(slow_ms: float = SLOW_QUERY_MS) -> Tracer:
+    """Включает трассировку для всех соединений, открытых после вызова."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(slow_ms)
+        storage.set_connection_factory(TracingConnection)
+    return _tracer
+
+
+def tracer() -> Tracer | None:
+    return _tracer
+
+
+# --- планы запросов ---
+
+SAMPLE_USER = 1
+SAMPLE_ID = "00000000"
+
+
+def known_queries(today: int) -> list[tuple[str, object, tuple, bool]]:
+    """(имя, функция, аргументы, читает ли всю таблицу намеренно) для каждого q_*.
+
+    Порядок важен: изменения и удаление идут по строке-образцу, которую вставляет
+    explain, поэтому ветки «строка найдена» тоже попадают в план.
+    """
+    page = (today, SAMPLE_ID)
+    return [
+        ("q_get", storage.q_get, (SAMPLE_USER,), False),
+        ("q_get_until", storage.q_get_until, (SAMPLE_USER, today + 7), False),
+        ("q_get_page", storage.q_get_page, (SAMPLE_USER, 11), False),
+        ("q_get_page after", storage.q_get_page, (SAMPLE_USER, 11, page), False),
+        ("q_get_page before", storage.q_get_page, (SAMPLE_USER, 11, None, page), False),
+        ("q_add", storage.q_add, (SAMPLE_USER, "ffffffff", "образец", today + 365, None), False),
+        ("q_import", storage.q_import, (SAMPLE_USER, [("образец", today, None), ("другой", today, "weekly")]), False),
+        ("q_update_date", storage.q_update_date, (SAMPLE_ID, SAMPLE_USER, today + 365), False),
+        ("q_update_name", storage.q_update_name, (SAMPLE_ID, SAMPLE_USER, "образец"), False),
+        ("q_delete", storage.q_delete, (SAMPLE_ID, SAMPLE_USER), False),
+        ("q_all_deadlines", storage.q_all_deadlines, (), True),
+        ("q_advance_recurring", storage.q_advance_recurring, (today, 1), False),
+        ("q_archive_expired", storage.q_archive_expired, (today + 366, today, 1), False),
+        ("q_get_archive_page", storage.q_get_archive_page, (SAMPLE_USER, 11), False),
+        ("q_get_archive_page older", storage.q_get_archive_page, (SAMPLE_USER, 11, page), False),
+        ("q_get_archive_page newer", storage.q_get_archive_page, (SAMPLE_USER, 11, None, page), False),
+        ("q_get_remind_time", storage.q_get_remind_time, (SAMPLE_USER,), False),
+        ("q_set_remind_time", storage.q_set_remind_time, (SAMPLE_USER, 9, 0), False),
+        ("q_users_at", storage.q_users_at, (9, 0), False),
+        ("q_slot_deadlines", storage.q_slot_deadlines, (9, 0, today + 7, 0, 100), False),
+        ("q_slot_deadlines exact", storage.q_slot_deadlines, (9, 0, today + 7, 0, 100, True), False),
+        ("q_all_remind_settings", storage.q_all_remind_settings, (), True),
+        ("q_load_user_data", storage.q_load_user_data, (SAMPLE_USER,), False),
+        ("q_load_conversations", storage.q_load_conversations, ("add", 0), False),
+        ("q_drop_stale_conversations", storage.q_drop_stale_conversations, ("add", 0), False),
+        ("q_save_persistence", storage.q_save_persistence, (
+            [(SAMPLE_USER, "{}", 0)], [(SAMPLE_USER + 1,)],
+            [("add", "[1, 1]", SAMPLE_USER, "0", 0)], [("add", "[2, 2]", SAMPLE_USER)],
+        ), False),
+    ]
+
+
+@dataclass
+class StatementPlan:
+    sql: str
+    plan: list[str]
+    flags: list[str] = field(default_factory=list)
+
+
+@dataclass
+class QueryPlan:
+    name: str
+    expected_scan: bool
+    statements: list[StatementPlan] = field(default_factory=list)
+
+    @property
+    def flagged(self) -> bool:
+        return any(s.flags for s in self.statements) and not self.expected_scan
+
+
+class _ExplainConnection(sqlite3.Connection):
+    """Перед каждым запросом снимает его EXPLAIN QUERY PLAN, затем выполняет как обычно."""
+
+    statements: list[StatementPlan]
+
+    def _explain(self, sql: str, params) -> None:
+        key = _normalize(sql)
+        if not key.upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return
+        rows = super().execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        self.statements.append(StatementPlan(key, [r[3] for r in rows]))
+
+    def execute(self, sql, parameters=(), /):
+        self._explain(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        params = list(seq_of_parameters)
+        if params:
+            self._explain(sql, params[0])
+        return super().executemany(sql, params)
+
+
+def _flags(plan: list[str]) -> list[str]:
+    flags = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            flags.append(f"полный просмотр таблицы: {detail}")
+        elif detail.startswith("SCAN ") and "INDEX" in detail:
+            flags.append(f"просмотр всего индекса: {detail}")
+        elif detail.startswith("USE TEMP B-TREE"):
+            flags.append(f"сортировка без индекса: {detail}")
+    return flags
+
+
+def explain(path: Path | str) -> list[QueryPlan]:
+    con = sqlite3.connect(path, factory=_ExplainConnection, isolation_level=None)
+    today = storage.today_day()
+    plans = []
+    try:
+        con.execute("BEGIN")
+        sqlite3.Connection.execute(
+            con,
+            "INSERT OR IGNORE INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)",
+            (SAMPLE_ID, SAMPLE_USER, "образец", "01.01.2000", "monthly", today - 400),
+        )
+        for name, fn, args, expected_scan in known_queries(today):
+            con.statements = []
+            fn(con, *args)
+            plan = QueryPlan(name, expected_scan, con.statements)
+            for statement in plan.statements:
+                statement.flags = _flags(statement.plan)
+            plans.append(plan)
+    finally:
+        con.execute("ROLLBACK")
+        con.close()
+    return plans
+
+
+def _print_plans(plans: list[QueryPlan]) -> None:
+    for plan in plans:
+        if plan.flagged:
+            mark = "!!"
+        elif plan.expected_scan:
+            mark = "ok (читает всю таблицу намеренно)"
+        else:
+            mark = "ok"
+        print(f"{plan.name}: {mark}")
+        for statement in plan.statements:
+            print(f"    {statement.sql}")
+            for detail in statement.plan:
+                print(f"      {detail}")
+            if not plan.expected_scan:
+                for flag in statement.flags:
+                    print(f"      !! {flag}")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description="Трассировка и планы SQL-запросов бота")
+    sub = parser.add_subparsers(dest="command", required=True)
+    explain_p = sub.add_parser("explain", help="EXPLAIN QUERY PLAN для всех известных запросов")
+    explain_p.add_argument("path", type=Path, nargs="?", help="БД (по умолчанию свежая схема)")
+    args = parser.parse_args()
+
+    if args.path is not None:
+        if not args.path.exists():
+            raise SystemExit(f"Нет файла {args.path}")
+        plans = explain(args.path)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "explain.db"
+            storage.init_db(path)
+            plans = explain(path)
+    _print_plans(plans)
+    flagged = [p.name for p in plans if p.flagged]
+    if flagged:
+        print(f"\nЗапросы без подходящего индекса: {', '.join(flagged)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
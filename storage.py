@@ -0,0 +1,1263 @@
+import asyncio
+import calendar as cal_mod
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import NamedTuple
+from uuid import uuid4
+
+from metrics import observe_db
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = Path(__file__).resolve().parent / "deadlines.db"
+# open_storage(MEMORY_PATH) — база целиком в памяти, без файлов и потоков
+MEMORY_PATH = ":memory:"
+
+# пул читателей на процесс; при нескольких шардах он делится между ними
+READER_POOL_SIZE = 4
+
+# group commit: пачка сбрасывается, как только набралось WRITE_BATCH_SIZE операций
+# или прошло WRITE_BATCH_DELAY секунд с первой из них
+WRITE_BATCH_SIZE = 256
+WRITE_BATCH_DELAY = 0.002
+
+# full — fsync на каждый коммит; normal — в WAL последние коммиты могут потеряться
+# при отключении питания, но база остаётся целой; off — без fsync вообще
+DURABILITY_LEVELS = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+WRITE_DURABILITY = "normal"
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+)
+
+
+# подменяется на sqltrace.TracingConnection в режиме трассировки
+_connection_factory: type[sqlite3.Connection] = sqlite3.Connection
+
+
+def set_connection_factory(factory: type[sqlite3.Connection]) -> None:
+    """Класс соединения для всех последующих connect(); уже открытые соединения не меняются."""
+    global _connection_factory
+    _connection_factory = factory
+
+
+def connect(path: Path | str | None = None) -> sqlite3.Connection:
+    con = sqlite3.connect(path or DB_PATH, check_same_thread=False, factory=_connection_factory)
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+    return con
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    # jump consistent hash (Lamping, Veach): при переходе с N на N+1 шардов
+    # переезжает только ~1/(N+1) пользователей, а не почти все, как при user_id % N
+    key = user_id & 0xFFFFFFFFFFFFFFFF
+    bucket, j = -1, 0
+    while j < shards:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_paths(path: Path | str | None, shards: int) -> list[Path]:
+    """Файлы шардов: deadlines.db -> deadlines-0.db … deadlines-{N-1}.db рядом с ним,
+    как у воркеров cluster.py; один шард — сам файл.
+    """
+    path = Path(path or DB_PATH)
+    if shards == 1:
+        return [path]
+    return [path.with_name(f"{path.stem}-{i}{path.suffix}") for i in range(shards)]
+
+
+DATE_FMT = "%d.%m.%Y"
+EPOCH = date(1970, 1, 1)
+
+SCHEMA_VERSION = 6
+MIGRATE_BATCH = 500
+ADVANCE_BATCH = 5000
+# архивирование и возврат места идут мелкими операциями писателя, чтобы между
+# ними проходили обычные записи пользователей. Пачка на 500 строк — ~40 мс
+# (bench.archive): строки разбросаны по файлу, и почти всё время уходит на запись
+# затронутых страниц; пачки крупнее быстрее в сумме, но дольше держат чужие записи
+ARCHIVE_BATCH = 500
+VACUUM_STEP_PAGES = 256
+# одна пачка импорта — одна операция писателя на ~0.2 с (bench.import_load): 50k строк
+# проходят за десяток транзакций, а чужие записи ждут не дольше одной пачки
+IMPORT_BATCH = 5000
+# не больше SQLITE_MAX_VARIABLE_NUMBER по умолчанию в старых сборках
+ID_CHECK_CHUNK = 900
+SLOT_CHUNK = 2000
+
+CACHE_BUDGET_BYTES = 32 * 1024 * 1024
+# Deadline с id и due около 170 Б (bench.deadline_records); остальное — запас на кириллицу в названии
+ROW_COST = 250
+
+_WEEKLY_NEXT = "due + ((:today - due + 6) / 7) * 7"
+
+
+def to_day(d: date) -> int:
+    return (d - EPOCH).days
+
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=day)
+
+
+def today_day(moment: datetime | None = None) -> int:
+    """Номер местного дня для moment (по умолчанию — сейчас).
+
+    Время с часовым поясом (часы планировщика) переводится в местное: «сегодня»
+    у списков, напоминаний и переноса повторов должно сменяться в одну полночь.
+    """
+    if moment is None:
+        moment = datetime.now()
+    elif moment.tzinfo is not None:
+        moment = moment.astimezone()
+    return to_day(moment.date())
+
+
+def parse_day(date_str: str) -> int | None:
+    try:
+        return to_day(datetime.strptime(date_str, DATE_FMT).date())
+    except ValueError:
+        return None
+
+
+def _schema_version(con) -> int:
+    con.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = con.execute("SELECT version FROM schema_version").fetchone()
+    if row is None:
+        con.execute("INSERT INTO schema_version (version) VALUES (0)")
+        return 0
+    return row[0]
+
+
+def _migrate_due(con) -> None:
+    with con:
+        cols = [r[1] for r in con.execute("PRAGMA table_info(deadlines)").fetchall()]
+        if "due" not in cols:
+            con.execute("ALTER TABLE deadlines ADD COLUMN due INTEGER")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_deadlines_user_due ON deadlines (user_id, due)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_deadlines_repeat_due ON deadlines (repeat, due)")
+    # заполняем due короткими транзакциями, чтобы не держать блокировку записи;
+    # строки с нечитаемой датой остаются с NULL и пропускаются по id
+    last_id = ""
+    while True:
+        rows = con.execute(
+            "SELECT id, date FROM deadlines WHERE due IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, MIGRATE_BATCH),
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with con:
+            con.executemany(
+                "UPDATE deadlines SET due = ? WHERE id = ?",
+                [(parse_day(date_str), dl_id) for dl_id, date_str in rows],
+            )
+
+
+def _migrate_settings_time_index(con) -> None:
+    with con:
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_settings_time ON settings (remind_hour, remind_min)"
+        )
+
+
+def _migrate_user_due_id_index(con) -> None:
+    # id в индексе делает постраничный обход по (due, id) покрывающим и без сортировки
+    with con:
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deadlines_user_due_id ON deadlines (user_id, due, id)"
+        )
+        con.execute("DROP INDEX IF EXISTS idx_deadlines_user_due")
+
+
+def _migrate_persistence(con) -> None:
+    with con:
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id INTEGER PRIMARY KEY,
+                data    TEXT NOT NULL,
+                updated INTEGER NOT NULL
+            )
+            """
+        )
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                name    TEXT NOT NULL,
+                key     TEXT NOT NULL,
+                user_id INTEGER,
+                state   TEXT NOT NULL,
+                updated INTEGER NOT NULL,
+                PRIMARY KEY (name, key)
+            ) WITHOUT ROWID
+            """
+        )
+
+
+def _migrate_archive(con) -> None:
+    # id в архиве не уникален: новый дедлайн может получить id давно архивированного
+    with con:
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archived_deadlines (
+                id       TEXT NOT NULL,
+                user_id  INTEGER NOT NULL,
+                name     TEXT NOT NULL,
+                date     TEXT NOT NULL,
+                repeat   TEXT,
+                due      INTEGER,
+                archived INTEGER NOT NULL
+            )
+            """
+        )
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_archived_user_due_id ON archived_deadlines (user_id, due, id)"
+        )
+    # auto_vacuum меняется только пересборкой файла; делаем её один раз, дальше
+    # освободившиеся после архивирования страницы возвращает incremental_vacuum
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        con.execute("VACUUM")
+
+
+def _migrate_remind_exact(con) -> None:
+    # remind_exact = 1 — время выбрано самим пользователем и приходит минута в минуту;
+    # строки без выбора (время по умолчанию) сглаживаются. Всё, что уже лежит в
+    # settings, записано через /settime, поэтому помечается как выбор пользователя
+    cols = [r[1] for r in con.execute("PRAGMA table_info(settings)").fetchall()]
+    with con:
+        if "remind_exact" not in cols:
+            con.execute("ALTER TABLE settings ADD COLUMN remind_exact INTEGER NOT NULL DEFAULT 0")
+            con.execute("UPDATE settings SET remind_exact = 1")
+        # круглый слот делится на точных и сглаживаемых прямо по индексу, без чтения
+        # строк; idx_settings_time остаётся для обхода всего слота по user_id
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS idx_settings_time_exact ON settings (remind_hour, remind_min, remind_exact)"
+        )
+
+
+MIGRATIONS = {
+    1: _migrate_due,
+    2: _migrate_settings_time_index,
+    3: _migrate_user_due_id_index,
+    4: _migrate_persistence,
+    5: _migrate_archive,
+    6: _migrate_remind_exact,
+}
+
+
+def _init_schema(con) -> None:
+    with con:
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deadlines (
+                id      TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                name    TEXT NOT NULL,
+                date    TEXT NOT NULL
+            )
+            """
+        )
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS settings (
+                user_id     INTEGER PRIMARY KEY,
+                remind_hour INTEGER NOT NULL DEFAULT 9,
+                remind_min  INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        cols = [r[1] for r in con.execute("PRAGMA table_info(deadlines)").fetchall()]
+        if "repeat" not in cols:
+            con.execute("ALTER TABLE deadlines ADD COLUMN repeat TEXT")
+        version = _schema_version(con)
+    # миграции идемпотентны: версия поднимается только после успешного шага,
+    # так что прерванная миграция просто повторится при следующем запуске
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info("Миграция схемы БД до версии %d", target)
+        MIGRATIONS[target](con)
+        with con:
+            con.execute("UPDATE schema_version SET version = ?", (target,))
+
+
+def init_db(path: Path | str | None = None, shards: int = 1) -> None:
+    for shard_path in shard_paths(path, shards):
+        con = connect(shard_path)
+        try:
+            _init_schema(con)
+        finally:
+            con.close()
+
+
+def _next_month(d):
+    month = d.month + 1
+    year = d.year
+    if month > 12:
+        month = 1
+        year += 1
+    day = min(d.day, cal_mod.monthrange(year, month)[1])
+    return d.replace(year=year, month=month, day=day)
+
+
+# Запросы ниже работают с уже открытым соединением и не коммитят сами:
+# транзакцией управляет Storage.
+
+
+def _normalized(due: int, repeat: str | None, today: int | None = None) -> tuple[str, int]:
+    # дата приходит уже разобранной в номер дня; строку для столбца date собираем из него
+    today = today_day() if today is None else today
+    if repeat is not None and due < today:
+        due = to_day(next_occurrence(from_day(due), repeat, from_day(today)))
+    return from_day(due).strftime(DATE_FMT), due
+
+
+def q_add(con, user_id: int, dl_id: str, name: str, due: int, repeat: str | None = None) -> None:
+    date, due = _normalized(due, repeat)
+    con.execute(
+        "INSERT INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)",
+        (dl_id, user_id, name, date, repeat, due),
+    )
+
+
+def _fresh_ids(con, n: int) -> list[str]:
+    # id — первые 8 hex-символов uuid4, как у обычного добавления; на десятках тысяч
+    # строк за раз совпадение с уже существующим id вполне вероятно, поэтому проверяем
+    ids: set[str] = set()
+    while len(ids) < n:
+        fresh = list({uuid4().hex[:8] for _ in range(n - len(ids))} - ids)
+        for i in range(0, len(fresh), ID_CHECK_CHUNK):
+            chunk = fresh[i:i + ID_CHECK_CHUNK]
+            taken = con.execute(
+                f"SELECT id FROM deadlines WHERE id IN ({','.join('?' * len(chunk))})", chunk,
+            ).fetchall()
+            ids.update(chunk)
+            ids.difference_update(r[0] for r in taken)
+    return list(ids)
+
+
+def q_import(con, user_id: int, rows: list[tuple[str, int, str | None]]) -> int:
+    """Добавляет пачку (название, день, повтор) и возвращает, сколько строк вставлено.
+
+    Строка с тем же названием и той же (уже перенесённой на ближайшее повторение)
+    датой, что у существующего дедлайна пользователя, считается дубликатом и
+    пропускается — в том числе повтор внутри самой пачки. Пары (название, день)
+    пользователя читаются одним запросом: проверка NOT EXISTS на каждую строку
+    перебирала бы все его дедлайны на тот же день.
+    """
+    today = today_day()
+    seen = set(con.execute("SELECT name, due FROM deadlines WHERE user_id = ?", (user_id,)))
+    fresh = []
+    for name, due, repeat in rows:
+        date, due = _normalized(due, repeat, today)
+        if (name, due) in seen:
+            continue
+        seen.add((name, due))
+        fresh.append((user_id, name, date, repeat, due))
+    ids = _fresh_ids(con, len(fresh))
+    con.executemany(
+        "INSERT INTO deadlines (id, user_id, name, date, repeat, due) VALUES (?, ?, ?, ?, ?, ?)",
+        [(dl_id, *row) for dl_id, row in zip(ids, fresh)],
+    )
+    return len(fresh)
+
+
+class Deadline(NamedTuple):
+    """Строка дедлайна. Дата уже разобрана в номер дня due; исходная строка date
+    читается из БД, только когда разобрать её не удалось (тогда due — None).
+    """
+
+    id: str
+    name: str
+    date: str | None
+    repeat: str | None
+    due: int | None
+
+
+# строку даты тянем из БД, только если по ней нечего показать, кроме неё самой
+DEADLINE_COLS = "id, name, CASE WHEN due IS NULL THEN date END, repeat, due"
+_make_deadline = Deadline._make
+
+
+def q_get(con, user_id: int) -> list[Deadline]:
+    rows = con.execute(
+        f"SELECT {DEADLINE_COLS} FROM deadlines WHERE user_id = ? ORDER BY due, id",
+        (user_id,),
+    ).fetchall()
+    return list(map(_make_deadline, rows))
+
+
+def q_get_until(con, user_id: int, until_day: int) -> list[Deadline]:
+    rows = con.execute(
+        f"SELECT {DEADLINE_COLS} FROM deadlines "
+        "WHERE user_id = ? AND due <= ? ORDER BY due, id",
+        (user_id, until_day),
+    ).fetchall()
+    return list(map(_make_deadline, rows))
+
+
+def q_get_page(
+    con, user_id: int, limit: int,
+    after: tuple[int, str] | None = None, before: tuple[int, str] | None = None,
+) -> list[Deadline]:
+    cols = f"SELECT {DEADLINE_COLS} FROM deadlines WHERE user_id = ?"
+    if before is not None:
+        rows = con.execute(
+            cols + " AND (due, id) < (?, ?) ORDER BY due DESC, id DESC LIMIT ?",
+            (user_id, *before, limit),
+        ).fetchall()
+        rows.reverse()
+    elif after is not None:
+        rows = con.execute(
+            cols + " AND (due, id) > (?, ?) ORDER BY due, id LIMIT ?",
+            (user_id, *after, limit),
+        ).fetchall()
+    else:
+        rows = con.execute(cols + " ORDER BY due, id LIMIT ?", (user_id, limit)).fetchall()
+    return list(map(_make_deadline, rows))
+
+
+def q_delete(con, dl_id: str, user_id: int) -> str | None:
+    row = con.execute(
+        "SELECT name FROM deadlines WHERE id = ? AND user_id = ?",
+        (dl_id, user_id),
+    ).fetchone()
+    if row is None:
+        return None
+    con.execute("DELETE FROM deadlines WHERE id = ? AND user_id = ?", (dl_id, user_id))
+    return row[0]
+
+
+def q_update_date(con, dl_id: str, user_id: int, due: int) -> str | None:
+    row = con.execute(
+        "SELECT name, repeat FROM deadlines WHERE id = ? AND user_id = ?",
+        (dl_id, user_id),
+    ).fetchone()
+    if row is None:
+        return None
+    new_date, due = _normalized(due, row[1])
+    con.execute(
+        "UPDATE deadlines SET date = ?, due = ? WHERE id = ? AND user_id = ?",
+        (new_date, due, dl_id, user_id),
+    )
+    return row[0]
+
+
+def q_update_name(con, dl_id: str, user_id: int, new_name: str) -> str | None:
+    row = con.execute(
+        "SELECT name FROM deadlines WHERE id = ? AND user_id = ?",
+        (dl_id, user_id),
+    ).fetchone()
+    if row is None:
+        return None
+    con.execute(
+        "UPDATE deadlines SET name = ? WHERE id = ? AND user_id = ?",
+        (new_name, dl_id, user_id),
+    )
+    return row[0]
+
+
+def q_all_deadlines(con) -> list[tuple]:
+    return con.execute("SELECT id, user_id, name, date, repeat FROM deadlines").fetchall()
+
+
+def next_occurrence(d: date, repeat: str | None, today: date) -> date:
+    """Первая дата повторения не раньше today — то же, что шагать _next_month в цикле."""
+    if d >= today:
+        return d
+    if repeat == "weekly":
+        return d + timedelta(days=-(-(today - d).days // 7) * 7)
+    if repeat != "monthly":
+        return d
+    steps = (today.year - d.year) * 12 + today.month - d.month
+    # _next_month «прилипает» к самому короткому месяцу на пути, поэтому день
+    # может только уменьшаться; короче 28 дней месяцев нет, а за 4 года
+    # обязательно встретится февраль на 28
+    day = d.day
+    if day > 28:
+        if steps > 48:
+            day = 28
+        else:
+            for i in range(1, steps + 1):
+                y, m = divmod(d.month - 1 + i, 12)
+                day = min(day, cal_mod.monthrange(d.year + y, m + 1)[1])
+    y, m = divmod(d.month - 1 + steps, 12)
+    result = date(d.year + y, m + 1, day)
+    if result < today:
+        result = _next_month(result)
+    return result
+
+
+def q_advance_recurring(con, today: int, limit: int) -> int:
+    """Переносит до limit просроченных еженедельных и ежемесячных дедлайнов на ближайшее повторение."""
+    weekly = con.execute(
+        f"""
+        UPDATE deadlines
+        SET due = {_WEEKLY_NEXT},
+            date = strftime('%d.%m.%Y', ({_WEEKLY_NEXT}) * 86400, 'unixepoch')
+        WHERE id IN (
+            SELECT id FROM deadlines WHERE repeat = 'weekly' AND due < :today LIMIT :limit
+        )
+        """,
+        {"today": today, "limit": limit},
+    ).rowcount
+    rows = con.execute(
+        "SELECT id, due FROM deadlines WHERE repeat = 'monthly' AND due < ? LIMIT ?",
+        (today, limit),
+    ).fetchall()
+    today_d = from_day(today)
+    updates = []
+    for dl_id, due in rows:
+        d = next_occurrence(from_day(due), "monthly", today_d)
+        updates.append((to_day(d), d.strftime(DATE_FMT), dl_id))
+    con.executemany("UPDATE deadlines SET due = ?, date = ? WHERE id = ?", updates)
+    return weekly + len(updates)
+
+
+def q_archive_expired(con, before_day: int, archived_day: int, limit: int) -> list[int]:
+    """Переносит до limit разовых дедлайнов со сроком раньше before_day в архив.
+
+    Возвращает пользователей, чьи дедлайны перенесены (по строке на дедлайн).
+    """
+    rows = con.execute(
+        "SELECT id, user_id FROM deadlines WHERE repeat IS NULL AND due < ? LIMIT ?",
+        (before_day, limit),
+    ).fetchall()
+    if not rows:
+        return []
+    con.executemany(
+        "INSERT INTO archived_deadlines (id, user_id, name, date, repeat, due, archived) "
+        "SELECT id, user_id, name, date, repeat, due, ? FROM deadlines WHERE id = ?",
+        [(archived_day, dl_id) for dl_id, _ in rows],
+    )
+    con.executemany("DELETE FROM deadlines WHERE id = ?", [(dl_id,) for dl_id, _ in rows])
+    return [user_id for _, user_id in rows]
+
+
+def q_incremental_vacuum(con, pages: int) -> int:
+    """Возвращает в ОС до pages свободных страниц; результат — сколько вернули."""
+    free = con.execute("PRAGMA freelist_count").fetchone()[0]
+    # модуль sqlite3 делает один шаг прагмы, а шаг освобождает одну страницу,
+    # поэтому incremental_vacuum(N) за вызов вернул бы одну; зовём по странице
+    for _ in range(min(pages, free)):
+        con.execute("PRAGMA incremental_vacuum(1)")
+    return free - con.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def q_get_archive_page(
+    con, user_id: int, limit: int,
+    older: tuple[int, str] | None = None, newer: tuple[int, str] | None = None,
+) -> list[Deadline]:
+    """Страница архива от свежих к старым, с курсором по (due, id), как q_get_page."""
+    cols = f"SELECT {DEADLINE_COLS} FROM archived_deadlines WHERE user_id = ?"
+    if newer is not None:
+        rows = con.execute(
+            cols + " AND (due, id) > (?, ?) ORDER BY due, id LIMIT ?",
+            (user_id, *newer, limit),
+        ).fetchall()
+        rows.reverse()
+    elif older is not None:
+        rows = con.execute(
+            cols + " AND (due, id) < (?, ?) ORDER BY due DESC, id DESC LIMIT ?",
+            (user_id, *older, limit),
+        ).fetchall()
+    else:
+        rows = con.execute(cols + " ORDER BY due DESC, id DESC LIMIT ?", (user_id, limit)).fetchall()
+    return list(map(_make_deadline, rows))
+
+
+def q_get_remind_time(con, user_id: int) -> tuple[int, int]:
+    row = con.execute(
+        "SELECT remind_hour, remind_min FROM settings WHERE user_id = ?", (user_id,),
+    ).fetchone()
+    return (row[0], row[1]) if row else (9, 0)
+
+
+def q_set_remind_time(con, user_id: int, hour: int, minute: int) -> None:
+    con.execute(
+        """
+        INSERT INTO settings (user_id, remind_hour, remind_min, remind_exact) VALUES (?, ?, ?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET remind_hour = ?, remind_min = ?, remind_exact = 1
+        """,
+        (user_id, hour, minute, hour, minute),
+    )
+
+
+def q_users_at(con, hour: int, minute: int) -> list[int]:
+    rows = con.execute(
+        "SELECT user_id FROM settings WHERE remind_hour = ? AND remind_min = ?",
+        (hour, minute),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def q_slot_deadlines(
+    con, hour: int, minute: int, until_day: int, from_user: int, limit: int, exact: bool | None = None,
+) -> list[tuple]:
+    # exact = None — все пользователи слота, иначе только выбравшие время сами (True) или нет
+    only = "" if exact is None else "AND s.remind_exact = ?"
+    return con.execute(
+        f"""
+        SELECT s.user_id, d.id, d.name, CASE WHEN d.due IS NULL THEN d.date END, d.repeat, d.due
+        FROM settings s JOIN deadlines d ON d.user_id = s.user_id
+        WHERE s.remind_hour = ? AND s.remind_min = ? AND s.user_id >= ? AND d.due <= ? {only}
+        ORDER BY s.user_id, d.due
+        LIMIT ?
+        """,
+        (hour, minute, from_user, until_day, *([] if exact is None else [int(exact)]), limit),
+    ).fetchall()
+
+
+def q_all_remind_settings(con) -> list[tuple[int, int, int]]:
+    return con.execute("SELECT user_id, remind_hour, remind_min FROM settings").fetchall()
+
+
+def q_load_user_data(con, user_id: int) -> str | None:
+    row = con.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def q_load_conversations(con, name: str, since: int) -> list[tuple[str, str]]:
+    return con.execute(
+        "SELECT key, state FROM conversations WHERE name = ? AND updated >= ?", (name, since),
+    ).fetchall()
+
+
+def q_drop_stale_conversations(con, name: str, before: int) -> int:
+    return con.execute(
+        "DELETE FROM conversations WHERE name = ? AND updated < ?", (name, before),
+    ).rowcount
+
+
+def q_save_persistence(
+    con, users: list[tuple], user_deletes: list[tuple], convs: list[tuple], conv_deletes: list[tuple],
+) -> None:
+    con.executemany(
+        """
+        INSERT INTO user_data (user_id, data, updated) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated = excluded.updated
+        """,
+        users,
+    )
+    con.executemany("DELETE FROM user_data WHERE user_id = ?", user_deletes)
+    con.executemany(
+        """
+        INSERT INTO conversations (name, key, user_id, state, updated) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated = excluded.updated
+        """,
+        convs,
+    )
+    # в удалениях третьим идёт пользователь — по нему шард, в самом запросе он не нужен
+    con.executemany(
+        "DELETE FROM conversations WHERE name = ? AND key = ?", [(name, key) for name, key, _ in conv_deletes],
+    )
+
+
+class Storage:
+    """Долгоживущие соединения: один писатель и пул читателей, каждый в своём потоке.
+
+    Все изменения проходят через одну задачу-писателя, которая собирает их в пачки
+    и применяет одной транзакцией (group commit). Каждая операция выполняется в своём
+    SAVEPOINT, поэтому ошибка одной не откатывает остальные.
+    """
+
+    def __init__(
+        self,
+        path: Path | str | None = None,
+        readers: int = READER_POOL_SIZE,
+        batch_size: int = WRITE_BATCH_SIZE,
+        batch_delay: float = WRITE_BATCH_DELAY,
+        durability: str = WRITE_DURABILITY,
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"unknown durability level: {durability!r}")
+        self.path = path or DB_PATH
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.durability = durability
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-writer", initializer=self._open, initargs=(False,),
+        )
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader", initializer=self._open, initargs=(True,),
+        )
+        self._pending: list[tuple] = []
+        self._wakeup: asyncio.Event | None = None
+        self._full: asyncio.Event | None = None
+        self._writer_task: asyncio.Task | None = None
+        self._closing = False
+
+    def _open(self, read_only: bool) -> None:
+        con = connect(self.path)
+        if read_only:
+            con.execute("PRAGMA query_only = ON")
+        else:
+            con.isolation_level = None
+            con.execute(f"PRAGMA synchronous = {DURABILITY_LEVELS[self.durability]}")
+        self._local.con = con
+        with self._conns_lock:
+            self._conns.append(con)
+
+    def _run_batch(self, batch: list[tuple]) -> list[tuple[bool, object]]:
+        con = self._local.con
+        outcomes = []
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args, _ in batch:
+                con.execute("SAVEPOINT op")
+                try:
+                    result = fn(con, *args)
+                except Exception as e:
+                    con.execute("ROLLBACK TO op")
+                    con.execute("RELEASE op")
+                    outcomes.append((False, e))
+                else:
+                    con.execute("RELEASE op")
+                    outcomes.append((True, result))
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        return outcomes
+
+    def _run_read(self, fn, args):
+        return fn(self._local.con, *args)
+
+    async def _writer_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_batch = 0
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                if self._closing:
+                    return
+                continue
+            # ждём добора, только пока пачка меньше предыдущей: одиночный писатель
+            # не платит задержкой за group commit, а все ожидающие уже в очереди
+            expected = min(last_batch, self.batch_size)
+            if self.batch_delay > 0 and len(self._pending) < expected and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.batch_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch = self._pending[:self.batch_size]
+            self._pending = self._pending[self.batch_size:]
+            last_batch = len(batch)
+            self._wakeup.set()
+            try:
+                outcomes = await loop.run_in_executor(self._writer, self._run_batch, batch)
+            except Exception as e:
+                logger.exception("Не удалось записать пачку из %d операций", len(batch))
+                outcomes = [(False, e)] * len(batch)
+            for (_, _, fut), (ok, value) in zip(batch, outcomes):
+                if fut.cancelled():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+    async def write(self, fn, *args):
+        if self._closing:
+            raise RuntimeError("storage is closed")
+        if self._writer_task is None:
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((fn, args, fut))
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        self._wakeup.set()
+        return await fut
+
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._writer_task is not None:
+            self._wakeup.set()
+            self._full.set()
+            await self._writer_task
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._conns_lock:
+            for con in self._conns:
+                con.close()
+            self._conns.clear()
+
+
+class StorageBackend(ABC):
+    """Хранилище, в которое db_* отправляют q_*-функции.
+
+    Данные пользователя целиком живут в одном шарде: shard(user_id) — движок с
+    write(fn, *args) и read(fn, *args), как у Storage, shards — все движки для
+    обходов по всем пользователям. Строки без пользователя (диалоги с user_id None)
+    лежат в шарде 0.
+    """
+
+    shards: list
+
+    @abstractmethod
+    def index(self, user_id: int | None) -> int:
+        ...
+
+    def shard(self, user_id: int | None):
+        return self.shards[self.index(user_id)]
+
+    async def scan(self, fn, *args) -> list:
+        """Читает fn во всех шардах одновременно и склеивает списки результатов."""
+        parts = await asyncio.gather(*(shard.read(fn, *args) for shard in self.shards))
+        return [row for part in parts for row in part]
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+
+class SqliteBackend(StorageBackend):
+    """Пользователи разложены по файлам SQLite через shard_for, у каждого файла свой
+    Storage — свой писатель с group commit и свои читатели, так что записи разных
+    шардов не ждут одну блокировку. Один путь — обычная одна база.
+    """
+
+    def __init__(self, paths: list[Path | str], **options):
+        options.setdefault("readers", -(-READER_POOL_SIZE // len(paths)))
+        self.shards = [Storage(path, **options) for path in paths]
+
+    def index(self, user_id: int | None) -> int:
+        if user_id is None or len(self.shards) == 1:
+            return 0
+        return shard_for(user_id, len(self.shards))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(shard.close() for shard in self.shards))
+
+
+class MemoryBackend(StorageBackend):
+    """Вся база в одном соединении SQLite в памяти: та же схема и те же q_*-функции,
+    но без файлов и потоков — запросы выполняются прямо в event loop. Для прогонов,
+    которым не нужен диск (bench.e2e_load --memory).
+    """
+
+    def __init__(self):
+        self._con = connect(MEMORY_PATH)
+        _init_schema(self._con)
+        self._con.isolation_level = None
+        self.shards = [self]
+
+    def index(self, user_id: int | None) -> int:
+        return 0
+
+    async def write(self, fn, *args):
+        con = self._con
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(con, *args)
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+        return result
+
+    async def read(self, fn, *args):
+        return fn(self._con, *args)
+
+    async def close(self) -> None:
+        self._con.close()
+
+
+class DeadlineCache:
+    """LRU-кэш списков дедлайнов по пользователям с ограничением по памяти.
+
+    Размер строки оценивается грубо (ROW_COST + длина названия), этого хватает,
+    чтобы держать кэш в пределах бюджета. Для чтений в процессе загрузки хранится
+    поколение пользователя: если между началом чтения и его концом пришла запись,
+    прочитанные строки в кэш не попадут.
+
+    Кроме того, кэш ведёт версии данных пользователей для кэшей поверх них (отрисованные
+    списки): каждое изменение присваивает пользователю новое значение общих часов,
+    а clear() поднимает нижнюю границу версий сразу для всех.
+    """
+
+    def __init__(self, budget: int = CACHE_BUDGET_BYTES):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[int, tuple[list[Deadline], dict[str, Deadline], int]] = OrderedDict()
+        self._loading: dict[int, list[int]] = {}
+        self._clock = 0
+        self._floor = 0
+        self._versions: dict[int, int] = {}
+
+    @staticmethod
+    def _cost(rows: list[Deadline]) -> int:
+        return sum(ROW_COST + len(r.name) for r in rows)
+
+    def get(self, user_id: int) -> tuple[list[Deadline], dict[str, Deadline]] | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return entry[0], entry[1]
+
+    def begin_load(self, user_id: int) -> int:
+        state = self._loading.setdefault(user_id, [0, 0])
+        state[0] += 1
+        return state[1]
+
+    def finish_load(self, user_id: int, rows: list[Deadline] | None, generation: int) -> None:
+        state = self._loading[user_id]
+        state[0] -= 1
+        if state[0] == 0:
+            del self._loading[user_id]
+        if rows is not None and state[1] == generation:
+            self._put(user_id, rows)
+
+    def _put(self, user_id: int, rows: list[Deadline]) -> None:
+        cost = self._cost(rows)
+        if cost > self.budget:
+            return
+        self._drop(user_id)
+        self._entries[user_id] = (rows, {r.id: r for r in rows}, cost)
+        self.size += cost
+        while self.size > self.budget:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def _drop(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, self._floor)
+
+    def clock(self) -> int:
+        return self._clock
+
+    def invalidate(self, user_id: int) -> None:
+        state = self._loading.get(user_id)
+        if state is not None:
+            state[1] += 1
+        self._drop(user_id)
+        self._clock += 1
+        self._versions[user_id] = self._clock
+
+    def clear(self) -> None:
+        for state in self._loading.values():
+            state[1] += 1
+        self._entries.clear()
+        self.size = 0
+        # словарь версий не растёт дольше, чем от одного clear() до другого
+        self._clock += 1
+        self._floor = self._clock
+        self._versions.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users": len(self._entries), "bytes": self.size, "hits": self.hits,
+            "misses": self.misses, "evictions": self.evictions,
+        }
+
+
+_storage: StorageBackend | None = None
+_cache = DeadlineCache()
+
+
+def open_storage(path: Path | str | None = None, shards: int = 1, **options) -> StorageBackend:
+    """Хранилище процесса: path == MEMORY_PATH — в памяти, иначе SQLite в shards файлах
+    (shard_paths); options — параметры Storage каждого шарда.
+    """
+    global _storage
+    if _storage is None:
+        if str(path) == MEMORY_PATH:
+            _storage = MemoryBackend()
+        else:
+            _storage = SqliteBackend(shard_paths(path, shards), **options)
+    return _storage
+
+
+async def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        await _storage.close()
+        _storage = None
+    _cache.clear()
+
+
+def cache_stats() -> dict[str, int]:
+    return _cache.stats()
+
+
+def data_version(user_id: int) -> int:
+    """Версия дедлайнов пользователя: меняется при каждом их изменении в этом процессе.
+
+    Снимать её нужно до чтения данных, которые кладутся в кэш под этой версией.
+    """
+    return _cache.version(user_id)
+
+
+def data_clock() -> int:
+    """Последняя выданная версия; у пользователя, не менявшегося с этого момента, версия не больше."""
+    return _cache.clock()
+
+
+def _get_storage() -> StorageBackend:
+    return _storage or open_storage()
+
+
+async def _cached(user_id: int) -> tuple[list[Deadline], dict[str, Deadline]]:
+    entry = _cache.get(user_id)
+    if entry is not None:
+        return entry
+    generation = _cache.begin_load(user_id)
+    rows = None
+    try:
+        rows = await _get_storage().shard(user_id).read(q_get, user_id)
+    finally:
+        _cache.finish_load(user_id, rows, generation)
+    return rows, {r.id: r for r in rows}
+
+
+@observe_db
+async def db_add(user_id: int, dl_id: str, name: str, due: int, repeat: str | None = None) -> None:
+    try:
+        await _get_storage().shard(user_id).write(q_add, user_id, dl_id, name, due, repeat)
+    finally:
+        _cache.invalidate(user_id)
+
+
+@observe_db
+async def db_import(user_id: int, rows: list[tuple[str, int, str | None]]) -> int:
+    try:
+        return await _get_storage().shard(user_id).write(q_import, user_id, rows)
+    finally:
+        _cache.invalidate(user_id)
+
+
+@observe_db
+async def db_get(user_id: int) -> list[Deadline]:
+    rows, _ = await _cached(user_id)
+    return rows
+
+
+@observe_db
+async def db_get_deadline(user_id: int, dl_id: str) -> Deadline | None:
+    _, by_id = await _cached(user_id)
+    return by_id.get(dl_id)
+
+
+@observe_db
+async def db_get_until(user_id: int, until_day: int) -> list[Deadline]:
+    return await _get_storage().shard(user_id).read(q_get_until, user_id, until_day)
+
+
+@observe_db
+async def db_get_page(
+    user_id: int, limit: int,
+    after: tuple[int, str] | None = None, before: tuple[int, str] | None = None,
+) -> list[Deadline]:
+    return await _get_storage().shard(user_id).read(q_get_page, user_id, limit, after, before)
+
+
+@observe_db
+async def db_delete(dl_id: str, user_id: int) -> str | None:
+    try:
+        return await _get_storage().shard(user_id).write(q_delete, dl_id, user_id)
+    finally:
+        _cache.invalidate(user_id)
+
+
+@observe_db
+async def db_update_date(dl_id: str, user_id: int, due: int) -> str | None:
+    try:
+        return await _get_storage().shard(user_id).write(q_update_date, dl_id, user_id, due)
+    finally:
+        _cache.invalidate(user_id)
+
+
+@observe_db
+async def db_update_name(dl_id: str, user_id: int, new_name: str) -> str | None:
+    try:
+        return await _get_storage().shard(user_id).write(q_update_name, dl_id, user_id, new_name)
+    finally:
+        _cache.invalidate(user_id)
+
+
+@observe_db
+async def db_all_deadlines() -> list[tuple]:
+    return await _get_storage().scan(q_all_deadlines)
+
+
+@observe_db
+async def db_advance_recurring(today: int | None = None) -> int:
+    # пачками, чтобы между ними проходили обычные записи пользователей; шарды — параллельно
+    today = today_day() if today is None else today
+
+    async def advance(shard) -> int:
+        total = 0
+        while True:
+            n = await shard.write(q_advance_recurring, today, ADVANCE_BATCH)
+            if n:
+                _cache.clear()
+            total += n
+            if n == 0:
+                return total
+
+    return sum(await asyncio.gather(*(advance(shard) for shard in _get_storage().shards)))
+
+
+@observe_db
+async def db_archive_expired(after_days: int, today: int | None = None) -> int:
+    """Убирает в архив разовые дедлайны, просроченные больше чем на after_days дней,
+    и возвращает освободившееся место в файлах БД.
+    """
+    today = today_day() if today is None else today
+
+    async def archive(shard) -> int:
+        total = 0
+        while True:
+            users = await shard.write(q_archive_expired, today - after_days, today, ARCHIVE_BATCH)
+            for user_id in set(users):
+                _cache.invalidate(user_id)
+            total += len(users)
+            if not users:
+                break
+        while await shard.write(q_incremental_vacuum, VACUUM_STEP_PAGES):
+            pass
+        return total
+
+    return sum(await asyncio.gather(*(archive(shard) for shard in _get_storage().shards)))
+
+
+@observe_db
+async def db_get_archive_page(
+    user_id: int, limit: int,
+    older: tuple[int, str] | None = None, newer: tuple[int, str] | None = None,
+) -> list[Deadline]:
+    return await _get_storage().shard(user_id).read(q_get_archive_page, user_id, limit, older, newer)
+
+
+@observe_db
+async def db_get_remind_time(user_id: int) -> tuple[int, int]:
+    return await _get_storage().shard(user_id).read(q_get_remind_time, user_id)
+
+
+@observe_db
+async def db_set_remind_time(user_id: int, hour: int, minute: int) -> None:
+    await _get_storage().shard(user_id).write(q_set_remind_time, user_id, hour, minute)
+
+
+@observe_db
+async def db_users_at(hour: int, minute: int) -> list[int]:
+    return await _get_storage().scan(q_users_at, hour, minute)
+
+
+@observe_db
+async def db_iter_slot_deadlines(
+    hour: int, minute: int, until_day: int, chunk: int = SLOT_CHUNK, exact: bool | None = None,
+):
+    """Дедлайны до until_day у всех пользователей слота, по одному пользователю за раз.
+
+    Читает порциями по chunk строк; пользователи без таких дедлайнов не попадают в выборку вовсе.
+    Шарды обходятся по очереди, внутри шарда пользователи идут по возрастанию id.
+    exact отбирает только выбравших время сами (True) или оставшихся на времени по умолчанию.
+    """
+    for shard in _get_storage().shards:
+        async for user_id, user_dls in _iter_shard_slot(shard, hour, minute, until_day, chunk, exact):
+            yield user_id, user_dls
+
+
+async def _iter_shard_slot(st, hour: int, minute: int, until_day: int, chunk: int, exact: bool | None):
+    from_user = -(2 ** 63)
+    while True:
+        rows = await st.read(q_slot_deadlines, hour, minute, until_day, from_user, chunk, exact)
+        if not rows:
+            return
+        last_user = rows[-1][0]
+        complete = len(rows) < chunk
+        if not complete:
+            if rows[0][0] == last_user:
+                # у одного пользователя больше строк, чем влезает в порцию
+                yield last_user, await st.read(q_get_until, last_user, until_day)
+                from_user = last_user + 1
+                continue
+            # хвост последнего пользователя мог обрезаться LIMIT — перечитаем его следующей порцией
+            rows = [r for r in rows if r[0] != last_user]
+            from_user = last_user
+        for user_id, group in groupby(rows, key=itemgetter(0)):
+            yield user_id, [_make_deadline(r[1:]) for r in group]
+        if complete:
+            return
+
+
+@observe_db
+async def db_all_remind_settings() -> list[tuple[int, int, int]]:
+    return await _get_storage().scan(q_all_remind_settings)
+
+
+@observe_db
+async def db_load_user_data(user_id: int) -> str | None:
+    return await _get_storage().shard(user_id).read(q_load_user_data, user_id)
+
+
+@observe_db
+async def db_load_conversations(name: str, since: int) -> list[tuple[str, str]]:
+    st = _get_storage()
+    await asyncio.gather(*(shard.write(q_drop_stale_conversations, name, since) for shard in st.shards))
+    return await st.scan(q_load_conversations, name, since)
+
+
+def _split(st: StorageBackend, rows: list[tuple], user_at: int) -> list[list[tuple]]:
+    parts = [[] for _ in st.shards]
+    for row in rows:
+        parts[st.index(row[user_at])].append(row)
+    return parts
+
+
+@observe_db
+async def db_save_persistence(
+    users: list[tuple], user_deletes: list[tuple], convs: list[tuple], conv_deletes: list[tuple],
+) -> None:
+    """users (user_id, …), user_deletes (user_id,), convs (name, key, user_id, …),
+    conv_deletes (name, key, user_id) — каждая строка уходит в шард своего пользователя.
+    """
+    st = _get_storage()
+    if len(st.shards) == 1:
+        await st.shards[0].write(q_save_persistence, users, user_deletes, convs, conv_deletes)
+        return
+    parts = zip(_split(st, users, 0), _split(st, user_deletes, 0), _split(st, convs, 2), _split(st, conv_deletes, 2))
+    await asyncio.gather(*(
+        shard.write(q_save_persistence, *part) for shard, part in zip(st.shards, parts) if any(part)
+    ))
@@ -0,0 +1,109 @@
+"""Маршрутизация по шардам и перебалансировка без воркеров и сети."""
+import asyncio
+import json
+import sqlite3
+
+from cluster import USER_TABLES, ShardRouter, rebalance, shard_path
+from storage import init_db, shard_for
+from webhook import HttpRequest
+
+USERS = range(1000, 1200)
+
+
+def test_shard_for_is_stable_and_in_range():
+    for shards in (1, 2, 4, 7):
+        placed = [shard_for(uid, shards) for uid in USERS]
+        assert placed == [shard_for(uid, shards) for uid in USERS]
+        assert set(placed) == set(range(shards))
+
+
+def test_shard_for_moves_only_to_the_new_shard():
+    uids = range(10_000)
+    for shards in (1, 3, 4, 8):
+        moved = [uid for uid in uids if shard_for(uid, shards) != shard_for(uid, shards + 1)]
+        # при N -> N+1 переезжают только в новый шард и примерно 1/(N+1) пользователей
+        assert all(shard_for(uid, shards + 1) == shards for uid in moved)
+        assert abs(len(moved) / len(uids) - 1 / (shards + 1)) < 0.03
+
+
+class _Link:
+    def __init__(self):
+        self.bodies: list[bytes] = []
+
+    async def post(self, body: bytes) -> int:
+        self.bodies.append(body)
+        return 200
+
+
+def _deliver(router: ShardRouter, update: dict) -> int:
+    request = HttpRequest("POST", "/webhook", {}, json.dumps(update).encode())
+    return asyncio.run(router._deliver(request))
+
+
+def test_router_picks_worker_by_sender():
+    links = [_Link() for _ in range(4)]
+    router = ShardRouter("127.0.0.1", 0, "/webhook", "secret", links)
+    for uid in USERS:
+        message = {"message_id": 1, "date": 0, "chat": {"id": uid, "type": "private"},
+                   "from": {"id": uid, "is_bot": False, "first_name": "u"}, "text": "/start"}
+        query = {"id": "1", "chat_instance": "1", "data": "x",
+                 "from": {"id": uid, "is_bot": False, "first_name": "u"}}
+        assert _deliver(router, {"update_id": uid, "message": message}) == 200
+        assert _deliver(router, {"update_id": uid, "callback_query": query}) == 200
+
+    for shard, link in enumerate(links):
+        senders = {
+            value["from"]["id"] for body in link.bodies
+            for value in json.loads(body).values() if isinstance(value, dict)
+        }
+        assert senders == {uid for uid in USERS if shard_for(uid, 4) == shard}
+    assert sum(router.routed.values()) == 2 * len(USERS)
+
+
+def test_router_sends_updates_without_sender_to_first_shard():
+    links = [_Link() for _ in range(3)]
+    router = ShardRouter("127.0.0.1", 0, "/webhook", "secret", links)
+    assert _deliver(router, {"update_id": 1, "poll": {"id": "p"}}) == 200
+    assert _deliver(router, {"update_id": 2, "message": "без автора"}) == 200
+    assert len(links[0].bodies) == 2
+    assert not links[1].bodies and not links[2].bodies
+
+
+def _user_rows(uid: int) -> dict[str, tuple]:
+    return {
+        "deadlines": (f"d{uid}", uid, "задача", "01.01.2031", None, 20000),
+        "settings": (uid, 9, 0, 0),
+        "user_data": (uid, "{}", 0),
+        "conversations": ("add_conv", f"[{uid}, {uid}]", uid, "1", 0),
+        "archived_deadlines": (f"d{uid}", uid, "старая", "01.01.2020", None, 18000, 18030),
+    }
+
+
+def test_rebalance_moves_every_user_table(tmp_path):
+    source = tmp_path / "deadlines.db"
+    init_db(source)
+    con = sqlite3.connect(source)
+    with con:
+        for table, columns in USER_TABLES:
+            marks = ", ".join("?" * len(columns.split(",")))
+            con.executemany(
+                f"INSERT INTO {table} ({columns}) VALUES ({marks})",
+                [_user_rows(uid)[table] for uid in USERS],
+            )
+    con.close()
+
+    moved = rebalance([source], 3, tmp_path)
+
+    assert sum(moved.values()) == len(USERS)
+    assert not source.exists()
+    for table, columns in USER_TABLES:
+        placed: dict[int, list[int]] = {}
+        for shard in range(3):
+            con = sqlite3.connect(shard_path(shard, tmp_path))
+            for row in con.execute(f"SELECT {columns} FROM {table}"):
+                uid = row[columns.split(", ").index("user_id")]
+                assert row == _user_rows(uid)[table]
+                placed.setdefault(uid, []).append(shard)
+            con.close()
+        assert placed == {uid: [shard_for(uid, 3)] for uid in USERS}, table
+    assert not rebalance([shard_path(i, tmp_path) for i in range(3)], 3, tmp_path)
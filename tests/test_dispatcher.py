@@ -0,0 +1,122 @@
+"""ReminderDispatcher и TokenBucket на поддельном боте: 429, сетевые ошибки и счётчики."""
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+import dispatcher
+from dispatcher import ReminderDispatcher, TokenBucket
+
+RETRY_AFTER = timedelta(seconds=0.2)
+
+
+class ScriptedBot:
+    """Отвечает на send_message по сценарию: исключение из списка или доставка."""
+
+    def __init__(self, *errors: Exception, latency: float = 0.0):
+        self.errors = list(errors)
+        self.latency = latency
+        self.calls: list[tuple[int, float]] = []
+        self.delivered: list[int] = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.calls.append((chat_id, time.monotonic()))
+        await asyncio.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.delivered.append(chat_id)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(dispatcher, "BACKOFF_BASE", 0.01)
+
+
+def _dispatcher(bot, **kwargs) -> ReminderDispatcher:
+    kwargs.setdefault("rate", 1000.0)
+    kwargs.setdefault("per_chat_interval", 0.0)
+    return ReminderDispatcher(bot, **kwargs)
+
+
+def test_bucket_pause_is_absolute():
+    async def run() -> float:
+        bucket = TokenBucket(rate=100.0)
+        # одновременные 429 от запросов в полёте: пауза не должна складываться
+        for _ in range(10):
+            bucket.pause(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    waited = asyncio.run(run())
+    assert 0.15 < waited < 0.5
+
+
+def test_bucket_pause_does_not_shorten_longer_pause():
+    async def run() -> float:
+        bucket = TokenBucket(rate=100.0)
+        bucket.pause(0.3)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) > 0.25
+
+
+def test_retry_after_requeues_and_waits():
+    bot = ScriptedBot(RetryAfter(RETRY_AFTER))
+    d = _dispatcher(bot)
+
+    assert asyncio.run(d.send(1, "Напоминание"))
+    assert bot.delivered == [1]
+    (_, first), (_, second) = bot.calls
+    assert second - first >= RETRY_AFTER.total_seconds() * 0.9
+    assert d.stats() == {"sent": 1, "retried": 1, "failed": 0}
+
+
+def test_concurrent_retry_after_stalls_once():
+    # все запросы в полёте получают 429 разом: рассылка встаёт на retry_after, а не на сумму
+    bot = ScriptedBot(*(RetryAfter(RETRY_AFTER) for _ in range(8)), latency=0.05)
+    d = _dispatcher(bot, concurrency=8)
+
+    async def run() -> float:
+        started = time.monotonic()
+        await asyncio.gather(*(d.send(uid, "Напоминание") for uid in range(8)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    assert sorted(bot.delivered) == list(range(8))
+    assert elapsed < 2 * RETRY_AFTER.total_seconds()
+    assert d.stats() == {"sent": 8, "retried": 8, "failed": 0}
+
+
+def test_network_error_backs_off_exponentially():
+    bot = ScriptedBot(NetworkError("timeout"), NetworkError("timeout"))
+    d = _dispatcher(bot)
+
+    assert asyncio.run(d.send(1, "Напоминание"))
+    gaps = [b[1] - a[1] for a, b in zip(bot.calls, bot.calls[1:])]
+    assert gaps[0] >= dispatcher.BACKOFF_BASE * 0.9
+    assert gaps[1] >= 2 * dispatcher.BACKOFF_BASE * 0.9
+    assert d.stats() == {"sent": 1, "retried": 2, "failed": 0}
+
+
+def test_gives_up_after_max_retries():
+    bot = ScriptedBot(*(NetworkError("timeout") for _ in range(3)))
+    d = _dispatcher(bot, max_retries=2)
+
+    assert not asyncio.run(d.send(1, "Напоминание"))
+    assert len(bot.calls) == 3
+    assert d.stats() == {"sent": 0, "retried": 2, "failed": 1}
+
+
+def test_forbidden_fails_without_retry():
+    bot = ScriptedBot(Forbidden("bot was blocked by the user"))
+    d = _dispatcher(bot)
+
+    assert not asyncio.run(d.send(1, "Напоминание"))
+    assert len(bot.calls) == 1
+    assert d.stats() == {"sent": 0, "retried": 0, "failed": 1}
@@ -0,0 +1,55 @@
+"""Кто в круглом слоте сглаживается, а кто получает напоминание минута в минуту."""
+import asyncio
+import sqlite3
+
+import storage
+from storage import connect, init_db, q_add, q_set_remind_time, today_day
+
+CHOSEN, DEFAULT = 1, 2
+
+
+def _slot_users(path, exact: bool | None) -> list[int]:
+    async def run() -> list[int]:
+        storage.open_storage(path)
+        try:
+            return [uid async for uid, _ in storage.db_iter_slot_deadlines(9, 0, today_day() + 7, exact=exact)]
+        finally:
+            await storage.close_storage()
+
+    return asyncio.run(run())
+
+
+def test_chosen_round_time_is_exact(tmp_path):
+    path = tmp_path / "deadlines.db"
+    init_db(path)
+    con = connect(path)
+    with con:
+        for uid in (CHOSEN, DEFAULT):
+            q_add(con, uid, f"d{uid}", "задача", today_day() + 1)
+        # время по умолчанию: строка есть, но пользователь его не выбирал
+        con.execute("INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, 9, 0)", (DEFAULT,))
+        q_set_remind_time(con, CHOSEN, 9, 0)
+    con.close()
+
+    assert _slot_users(path, None) == [CHOSEN, DEFAULT]
+    assert _slot_users(path, True) == [CHOSEN]
+    assert _slot_users(path, False) == [DEFAULT]
+
+
+def test_migration_keeps_stored_times_exact(tmp_path):
+    path = tmp_path / "deadlines.db"
+    init_db(path)
+    con = sqlite3.connect(path)
+    with con:
+        # база до remind_exact: всё в settings записано через /settime
+        con.execute("DROP INDEX idx_settings_time_exact")
+        con.execute("ALTER TABLE settings DROP COLUMN remind_exact")
+        con.execute("UPDATE schema_version SET version = 5")
+        con.execute("INSERT INTO settings (user_id, remind_hour, remind_min) VALUES (?, 9, 0)", (CHOSEN,))
+    con.close()
+
+    init_db(path)
+
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT remind_exact FROM settings WHERE user_id = ?", (CHOSEN,)).fetchone() == (1,)
+    con.close()
@@ -0,0 +1,104 @@
+"""Кэш отрисованных сообщений: текст и разметка списка и напоминания по пользователям.
+
+Для одного пользователя и дня сообщение полностью определяется его дедлайнами,
+поэтому запись лежит под (версия данных, день) из storage.data_version: любое
+изменение дедлайнов даёт новую версию, и старые представления просто перестают
+совпадать. С переходом на новый день кэш сбрасывается целиком.
+"""
+from collections import OrderedDict
+
+from telegram import InlineKeyboardMarkup
+
+RENDER_CACHE_BUDGET_BYTES = 16 * 1024 * 1024
+RENDER_VIEWS_PER_USER = 4
+# грубая оценка одной кнопки вместе с callback_data; текст считается по длине
+BUTTON_COST = 250
+VIEW_COST = 200
+
+View = tuple[str, InlineKeyboardMarkup | None]
+
+
+def _cost(view: View) -> int:
+    text, markup = view
+    buttons = sum(len(row) for row in markup.inline_keyboard) if markup is not None else 0
+    return VIEW_COST + 2 * len(text) + BUTTON_COST * buttons
+
+
+class RenderCache:
+    """LRU по пользователям с ограничением по памяти, в каждом — несколько последних представлений."""
+
+    def __init__(self, budget: int = RENDER_CACHE_BUDGET_BYTES):
+        self.budget = budget
+        self.size = 0
+        self.today: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.unchanged = 0
+        # пользователь -> (версия, {ключ представления: (представление, стоимость)})
+        self._entries: OrderedDict[int, tuple[int, OrderedDict[str, tuple[View, int]]]] = OrderedDict()
+
+    def _roll(self, today: int) -> bool:
+        # назад день не откатывается: обращение со вчерашним днём, запоздавшее
+        # после полуночи, просто не кэшируется и не сбрасывает сегодняшний кэш
+        if self.today is None or today > self.today:
+            self._entries.clear()
+            self.size = 0
+            self.today = today
+        return today == self.today
+
+    def get(self, user_id: int, version: int, today: int, key: str) -> View | None:
+        entry = self._entries.get(user_id) if self._roll(today) else None
+        if entry is None or entry[0] != version or key not in entry[1]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        entry[1].move_to_end(key)
+        return entry[1][key][0]
+
+    def put(self, user_id: int, version: int, today: int, key: str, view: View) -> None:
+        cost = _cost(view)
+        if not self._roll(today) or cost > self.budget:
+            return
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > version:
+            # чтение по старой версии закончилось позже записи свежего представления
+            return
+        if entry is None or entry[0] != version:
+            self._drop(user_id)
+            entry = self._entries[user_id] = (version, OrderedDict())
+        views = entry[1]
+        old = views.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        views[key] = (view, cost)
+        self.size += cost
+        self._entries.move_to_end(user_id)
+        while len(views) > RENDER_VIEWS_PER_USER:
+            _, (_, evicted) = views.popitem(last=False)
+            self.size -= evicted
+        while self.size > self.budget:
+            _, (_, user_views) = self._entries.popitem(last=False)
+            self.size -= sum(c for _, c in user_views.values())
+            self.evictions += 1
+
+    def _drop(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= sum(c for _, c in entry[1].values())
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users": len(self._entries), "bytes": self.size, "hits": self.hits,
+            "misses": self.misses, "evictions": self.evictions, "unchanged": self.unchanged,
+        }
+
+
+def shows(message, text: str, markup: InlineKeyboardMarkup | None) -> bool:
+    """Сообщение уже показывает ровно это: edit_text ничего бы не изменил."""
+    return message is not None and message.text == text and message.reply_markup == markup
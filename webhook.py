@@ -0,0 +1,212 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_SIZE = 1000
+WEBHOOK_ENQUEUE_TIMEOUT = 1.0
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+REASONS = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+
+class HttpRequest:
+    __slots__ = ("method", "path", "headers", "body")
+
+    def __init__(self, method: str, path: str, headers: dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_request(reader: asyncio.StreamReader) -> HttpRequest | None:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("headers too large")
+    if len(head) > MAX_HEADER_BYTES:
+        raise ValueError("headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise OverflowError(length)
+    body = await reader.readexactly(length) if length else b""
+    return HttpRequest(method, path, headers, body)
+
+
+def _head(status: int, length: int, headers: dict[str, str] | None, keep_alive: bool) -> bytes:
+    head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    for name, value in (headers or {}).items():
+        head.append(f"{name}: {value}")
+    head.append(f"Content-Length: {length}")
+    head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+
+
+def write_head(
+    writer: asyncio.StreamWriter, status: int, length: int,
+    headers: dict[str, str] | None = None, keep_alive: bool = True,
+) -> None:
+    """Статус и заголовки; тело длиной length вызывающий пишет сам, хоть кусками."""
+    writer.write(_head(status, length, headers, keep_alive))
+
+
+def write_response(
+    writer: asyncio.StreamWriter, status: int, body: bytes = b"",
+    headers: dict[str, str] | None = None, keep_alive: bool = True,
+) -> None:
+    writer.write(_head(status, len(body), headers, keep_alive) + body)
+
+
+class WebhookServer:
+    """Приём обновлений от Telegram по HTTP в ограниченную очередь приложения.
+
+    Очередь приложения должна быть создана с maxsize: если она не освобождается
+    за WEBHOOK_ENQUEUE_TIMEOUT, отвечаем 503, и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, application, host: str, port: int, path: str, secret_token: str):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.accepted = 0
+        self.rejected = 0
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_HEADER_BYTES,
+        )
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Webhook слушает %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # keep-alive соединения сами не закроются: обрываем их, пока цикл ещё жив
+            for task in self._connections:
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except OverflowError:
+                    write_response(writer, 413, keep_alive=False)
+                    break
+                except ValueError:
+                    write_response(writer, 400, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                status = await self._dispatch(request)
+                write_response(writer, status, keep_alive=request.keep_alive)
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(task)
+
+    async def _dispatch(self, request: HttpRequest) -> int:
+        if request.path != self.path:
+            return 404
+        if request.method != "POST":
+            return 405
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            return 403
+        return await self._deliver(request)
+
+    async def _deliver(self, request: HttpRequest) -> int:
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400
+        try:
+            await asyncio.wait_for(
+                self.application.update_queue.put(update), WEBHOOK_ENQUEUE_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return 503
+        self.accepted += 1
+        return 200
+
+
+def run_webhook(
+    application, url: str | None, host: str, port: int, path: str, secret_token: str,
+    allowed_updates: list[str] | None = None, max_connections: int = 40,
+) -> None:
+    """Аналог Application.run_webhook на встроенном сервере, без зависимости от tornado."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(application, host, port, path, secret_token)
+
+    async def run() -> None:
+        await application.initialize()
+        try:
+            if application.post_init:
+                await application.post_init(application)
+            await server.start()
+            # без url вебхук регистрирует кто-то другой (роутер кластера)
+            if url:
+                await application.bot.set_webhook(
+                    url=url, secret_token=secret_token, allowed_updates=allowed_updates,
+                    max_connections=max_connections, drop_pending_updates=False,
+                )
+            await application.start()
+            await stop.wait()
+        finally:
+            await server.stop()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()